@@ -33,11 +33,39 @@ import os
 import json
 import re
 import base64
+import unicodedata
 from datetime import datetime
-from groq import Groq
+from html import escape as echapper_html
+from groq import AsyncGroq, RateLimitError
 from audio_recorder_streamlit import audio_recorder
+import sys
 import tempfile
+import sqlite3
+import hashlib
+import uuid
+import zlib
+import logging
+import threading
+import asyncio
+import queue
+import concurrent.futures
+import time
+import math
+import io
+import wave
+from types import MappingProxyType
+from array import array
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
+from functools import lru_cache
 import requests
+import numpy as np
 
 # Charger .env automatiquement
 try:
@@ -119,7 +147,757 @@ if not GROQ_API_KEY:
     st.error("⚠️ GROQ_API_KEY manquant! Crée le fichier .streamlit/secrets.toml")
     st.stop()
 
-client = Groq(api_key=GROQ_API_KEY)
+# =============================================================================
+# CLIENT GROQ ASYNCHRONE (boucle dédiée, concurrence bornée, annulation au rerun)
+# =============================================================================
+
+# Appels Groq simultanés maximum pour tout le processus (toutes sessions)
+MAX_APPELS_GROQ_SIMULTANES = 8
+
+# Délais maximum par appel (secondes)
+TIMEOUT_GROQ = 30
+TIMEOUT_GROQ_FLUX = 60
+
+# Fréquence à laquelle une attente rend la main à Streamlit (détection des reruns)
+INTERVALLE_ATTENTE_GROQ = 0.1
+
+# Fin de la file des chunks (None: identique d'un rerun à l'autre, contrairement à un object())
+FIN_FLUX = None
+
+class CoucheGroqAsync:
+    """Client AsyncGroq sur une boucle asyncio dédiée, partagé par toutes les sessions"""
+    
+    def __init__(self, api_key, max_simultanes=MAX_APPELS_GROQ_SIMULTANES, disjoncteur=None):
+        self.client = AsyncGroq(api_key=api_key)
+        self.disjoncteur = disjoncteur
+        self._boucle = asyncio.new_event_loop()
+        self._semaphore = asyncio.Semaphore(max_simultanes)
+        self.stats = {'en_cours': 0, 'max_en_cours': 0, 'termines': 0, 'annules': 0, 'expires': 0, 'erreurs': 0}
+        threading.Thread(target=self._boucle.run_forever, name="sarahmiam-groq", daemon=True).start()
+    
+    async def _executer(self, fabrique, timeout):
+        async with self._semaphore:
+            self.stats['en_cours'] += 1
+            self.stats['max_en_cours'] = max(self.stats['max_en_cours'], self.stats['en_cours'])
+            debut = time.monotonic()
+            bilan = None  # None: ni succès ni panne (annulé, quota)
+            try:
+                resultat = await asyncio.wait_for(fabrique(self.client), timeout)
+                self.stats['termines'] += 1
+                bilan = True
+                return resultat
+            except asyncio.CancelledError:
+                self.stats['annules'] += 1
+                raise
+            except asyncio.TimeoutError:
+                self.stats['expires'] += 1
+                bilan = False
+                raise
+            except RateLimitError:
+                self.stats['erreurs'] += 1
+                raise
+            except Exception:
+                self.stats['erreurs'] += 1
+                bilan = False
+                raise
+            finally:
+                self.stats['en_cours'] -= 1
+                if self.disjoncteur is not None:
+                    self.disjoncteur.enregistrer(bilan, time.monotonic() - debut)
+    
+    def lancer(self, fabrique, timeout=TIMEOUT_GROQ):
+        """Lance un appel (fabrique: client -> coroutine) et retourne son Future sans attendre"""
+        return asyncio.run_coroutine_threadsafe(self._executer(fabrique, timeout), self._boucle)
+    
+    def flux(self, fabrique, timeout=TIMEOUT_GROQ_FLUX):
+        """Lance un appel en streaming; retourne (Future, file des chunks terminée par FIN_FLUX)"""
+        chunks = queue.Queue()
+        
+        async def consommer(client):
+            try:
+                async for chunk in await fabrique(client):
+                    chunks.put(chunk)
+            finally:
+                chunks.put(FIN_FLUX)
+        
+        return self.lancer(consommer, timeout), chunks
+
+@st.cache_resource(show_spinner=False)
+def obtenir_groq():
+    """Couche Groq asynchrone unique par processus"""
+    return CoucheGroqAsync(GROQ_API_KEY, disjoncteur=obtenir_disjoncteur())
+
+def point_de_controle_rerun(signal):
+    """Rend la main à Streamlit: lève l'exception de rerun si l'utilisateur a relancé l'app"""
+    if signal is not None:
+        signal.empty()
+
+def attendre_groq(futur, signal=None, annuler=True):
+    """Attend un appel Groq sans bloquer les reruns: un rerun (ou une erreur) annule l'appel"""
+    signal = signal if signal is not None else st.empty()
+    try:
+        while True:
+            try:
+                return futur.result(timeout=INTERVALLE_ATTENTE_GROQ)
+            except concurrent.futures.TimeoutError:
+                point_de_controle_rerun(signal)
+    finally:
+        if annuler and not futur.done():
+            futur.cancel()
+
+def lancer_groq(fabrique, jetons, timeout=TIMEOUT_GROQ, signal=None):
+    """Admission dans le quota Groq (file d'attente) puis lancement de l'appel; retourne son Future"""
+    preparer_appel_groq(jetons, signal)
+    return obtenir_groq().lancer(fabrique, timeout)
+
+def appel_groq(fabrique, jetons, timeout=TIMEOUT_GROQ):
+    """Appel Groq depuis le script Streamlit (annulé si l'utilisateur relance)"""
+    signal = st.empty()
+    return attendre_groq(lancer_groq(fabrique, jetons, timeout, signal), signal)
+
+def flux_groq(fabrique, jetons, timeout=TIMEOUT_GROQ_FLUX):
+    """Chunks d'un appel Groq en streaming, au fil de l'eau (annulé si le générateur est abandonné)"""
+    signal = st.empty()
+    preparer_appel_groq(jetons, signal)
+    futur, chunks = obtenir_groq().flux(fabrique, timeout)
+    try:
+        while True:
+            try:
+                chunk = chunks.get(timeout=INTERVALLE_ATTENTE_GROQ)
+            except queue.Empty:
+                point_de_controle_rerun(signal)
+                continue
+            if chunk is FIN_FLUX:
+                break
+            yield chunk
+        futur.result()  # propage l'erreur ou le timeout éventuel
+    finally:
+        if not futur.done():
+            futur.cancel()
+
+def appel_groq_hors_session(fabrique, jetons, timeout=TIMEOUT_GROQ):
+    """Appel Groq bloquant depuis un thread de fond (pas de session ni de rerun à surveiller)"""
+    return lancer_groq(fabrique, jetons, timeout).result()
+
+def flux_groq_hors_session(fabrique, jetons, timeout=TIMEOUT_GROQ_FLUX):
+    """Chunks d'un appel Groq en streaming depuis un thread de fond"""
+    preparer_appel_groq(jetons)
+    futur, chunks = obtenir_groq().flux(fabrique, timeout)
+    try:
+        while True:
+            try:
+                chunk = chunks.get(timeout=timeout)
+            except queue.Empty:
+                # Même erreur qu'un appel expiré dans la boucle (attendre_groq): un seul type de timeout pour l'appelant
+                raise asyncio.TimeoutError(f"aucun chunk Groq depuis {timeout} s") from None
+            if chunk is FIN_FLUX:
+                break
+            yield chunk
+        futur.result()
+    finally:
+        if not futur.done():
+            futur.cancel()
+
+# =============================================================================
+# DISJONCTEUR GROQ (pannes et lenteurs: réponses locales en attendant)
+# =============================================================================
+
+# Derniers appels observés pour décider d'ouvrir le circuit
+FENETRE_DISJONCTEUR = 20
+MIN_APPELS_DISJONCTEUR = 5
+TAUX_ECHEC_MAX = 0.5
+
+# Un appel plus lent que ce délai compte comme un échec (secondes)
+LATENCE_MAX_GROQ = 12
+
+# Durée d'ouverture avant de laisser passer un appel de test (secondes)
+DUREE_OUVERTURE_DISJONCTEUR = 30
+
+class GroqIndisponible(Exception):
+    """Circuit ouvert: Groq est en panne ou trop lent, l'appel n'est pas tenté"""
+
+class DisjoncteurGroq:
+    """
+    Disjoncteur fermé / ouvert / semi-ouvert sur le taux d'échec (erreurs, timeouts,
+    lenteurs) des derniers appels; en semi-ouvert, un seul appel de test passe.
+    """
+    
+    def __init__(self, fenetre=FENETRE_DISJONCTEUR, taux_max=TAUX_ECHEC_MAX,
+                 latence_max=LATENCE_MAX_GROQ, duree_ouverture=DUREE_OUVERTURE_DISJONCTEUR):
+        self.taux_max = taux_max
+        self.latence_max = latence_max
+        self.duree_ouverture = duree_ouverture
+        self.etat = 'ferme'
+        self._bilans = deque(maxlen=fenetre)
+        self._ouvert_le = 0.0
+        self._test_en_cours = False
+        self._test_le = 0.0
+        self._verrou = threading.Lock()
+        self.stats = {'ouvertures': 0, 'refus': 0}
+    
+    def autoriser(self):
+        """Vrai si un appel peut partir (en semi-ouvert: seulement l'appel de test)"""
+        with self._verrou:
+            if self.etat == 'ouvert' and time.monotonic() - self._ouvert_le >= self.duree_ouverture:
+                self.etat = 'semi_ouvert'
+            if self.etat == 'ferme':
+                return True
+            # Un appel de test sans nouvelles (annulé avant de partir) n'en bloque pas un autre indéfiniment
+            if self.etat == 'semi_ouvert' and (not self._test_en_cours or time.monotonic() - self._test_le > TIMEOUT_GROQ_FLUX):
+                self._test_en_cours = True
+                self._test_le = time.monotonic()
+                return True
+            self.stats['refus'] += 1
+            return False
+    
+    def enregistrer(self, succes, duree):
+        """Bilan d'un appel terminé (succes None: annulé ou quota, sans effet sur le circuit)"""
+        with self._verrou:
+            if self.etat == 'semi_ouvert':
+                self._test_en_cours = False
+            if succes is None:
+                return
+            succes = succes and duree <= self.latence_max
+            if self.etat == 'semi_ouvert':
+                if succes:
+                    self.etat = 'ferme'
+                    self._bilans.clear()
+                else:
+                    self._ouvrir()
+                return
+            self._bilans.append(succes)
+            echecs = self._bilans.count(False)
+            if len(self._bilans) >= MIN_APPELS_DISJONCTEUR and echecs / len(self._bilans) >= self.taux_max:
+                self._ouvrir()
+    
+    def _ouvrir(self):
+        self.etat = 'ouvert'
+        self._ouvert_le = time.monotonic()
+        self._bilans.clear()
+        self.stats['ouvertures'] += 1
+        logger.warning("Disjoncteur Groq ouvert: réponses locales pendant %ss", self.duree_ouverture)
+
+@st.cache_resource(show_spinner=False)
+def obtenir_disjoncteur():
+    """Disjoncteur unique par processus (partagé par toutes les sessions)"""
+    return DisjoncteurGroq()
+
+def preparer_appel_groq(jetons, signal=None):
+    """Disjoncteur puis quota: lève GroqIndisponible si le circuit est ouvert"""
+    disjoncteur = obtenir_disjoncteur()
+    if not disjoncteur.autoriser():
+        raise GroqIndisponible("circuit Groq ouvert")
+    try:
+        admettre_groq(jetons, signal)
+    except BaseException:
+        # Appel jamais lancé (quota, rerun): libère l'appel de test éventuel
+        disjoncteur.enregistrer(None, 0)
+        raise
+
+# =============================================================================
+# QUOTA GROQ (seaux à jetons partagés + file d'attente FIFO)
+# =============================================================================
+
+# Limites du compte Groq, partagées par toutes les sessions et tous les réplicas de la machine
+LIMITE_REQUETES_MINUTE = int(os.getenv("SARAHMIAM_GROQ_RPM", "30"))
+LIMITE_TOKENS_MINUTE = int(os.getenv("SARAHMIAM_GROQ_TPM", "6000"))
+
+# Attente maximum dans la file avant d'abandonner (secondes)
+ATTENTE_MAX_QUOTA = 30
+
+# Un ticket sans nouvelles depuis ce délai est abandonné (session fermée, processus arrêté)
+EXPIRATION_TICKET = 5
+
+FICHIER_QUOTA_GROQ = os.getenv(
+    "SARAHMIAM_QUOTA_GROQ",
+    os.path.join(tempfile.gettempdir(), "sarahmiam-quota-groq.db")
+)
+
+class QuotaGroqDepasse(Exception):
+    """Quota Groq saturé: la requête a attendu plus que l'attente maximum"""
+
+class LimiteurGroq:
+    """
+    Seaux à jetons requêtes/minute et tokens/minute dans une base SQLite
+    (verrou partagé entre processus) et file d'attente FIFO par tickets.
+    """
+    
+    def __init__(self, fichier=FICHIER_QUOTA_GROQ, rpm=LIMITE_REQUETES_MINUTE, tpm=LIMITE_TOKENS_MINUTE):
+        self.fichier = fichier
+        self.capacites = {'requetes': float(rpm), 'tokens': float(tpm)}
+        with closing(self._connexion()) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS seaux (nom TEXT PRIMARY KEY, jetons REAL, maj REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS file (ticket INTEGER PRIMARY KEY AUTOINCREMENT, vu_le REAL)")
+            for nom, capacite in self.capacites.items():
+                conn.execute("INSERT OR IGNORE INTO seaux VALUES (?, ?, ?)", (nom, capacite, time.time()))
+    
+    def _connexion(self):
+        return sqlite3.connect(self.fichier, timeout=5, isolation_level=None)
+    
+    def _prendre(self, conn, besoins):
+        """Remplit les seaux puis prélève les besoins; retourne 0 si admis, sinon l'attente estimée (s)"""
+        maintenant = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            niveaux = {}
+            for nom, jetons, maj in conn.execute("SELECT nom, jetons, maj FROM seaux"):
+                capacite = self.capacites[nom]
+                niveaux[nom] = min(capacite, jetons + (maintenant - maj) * capacite / 60)
+            
+            # Une demande plus grosse que le seau entier passe quand il est plein
+            manques = {nom: min(besoins[nom], self.capacites[nom]) - niveaux[nom] for nom in besoins}
+            attente = max(max(manque, 0) * 60 / self.capacites[nom] for nom, manque in manques.items())
+            if attente == 0:
+                for nom in besoins:
+                    niveaux[nom] -= besoins[nom]
+            for nom, niveau in niveaux.items():
+                conn.execute("UPDATE seaux SET jetons = ?, maj = ? WHERE nom = ?", (niveau, maintenant, nom))
+            conn.execute("COMMIT")
+            return attente
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    
+    def admettre(self, tokens, attente_max=ATTENTE_MAX_QUOTA, sur_attente=None):
+        """Attend son tour (FIFO) puis le quota; False si l'attente maximum est dépassée"""
+        besoins = {'requetes': 1.0, 'tokens': float(tokens)}
+        debut = time.time()
+        with closing(self._connexion()) as conn:
+            ticket = conn.execute("INSERT INTO file (vu_le) VALUES (?)", (debut,)).lastrowid
+            try:
+                while True:
+                    maintenant = time.time()
+                    conn.execute("UPDATE file SET vu_le = ? WHERE ticket = ?", (maintenant, ticket))
+                    conn.execute("DELETE FROM file WHERE vu_le < ?", (maintenant - EXPIRATION_TICKET,))
+                    devant = conn.execute("SELECT COUNT(*) FROM file WHERE ticket < ?", (ticket,)).fetchone()[0]
+                    
+                    attente = self._prendre(conn, besoins) if devant == 0 else None
+                    if attente == 0:
+                        return True
+                    if maintenant - debut > attente_max:
+                        return False
+                    if sur_attente:
+                        sur_attente(devant + 1, maintenant - debut)
+                    time.sleep(min(0.25, attente) if attente else 0.1)
+            finally:
+                conn.execute("DELETE FROM file WHERE ticket = ?", (ticket,))
+    
+    def rembourser(self, tokens):
+        """Rend au seau les tokens réservés mais non consommés"""
+        if tokens <= 0:
+            return
+        with closing(self._connexion()) as conn, conn:
+            conn.execute("UPDATE seaux SET jetons = MIN(jetons + ?, ?) WHERE nom = 'tokens'", (tokens, self.capacites['tokens']))
+    
+    def vider(self):
+        """Vide les seaux après un refus du fournisseur (429): tout le monde ralentit"""
+        with closing(self._connexion()) as conn, conn:
+            conn.execute("UPDATE seaux SET jetons = 0, maj = ?", (time.time(),))
+
+@st.cache_resource(show_spinner=False)
+def obtenir_limiteur_groq():
+    """Limiteur de quota unique par processus (état partagé via la base SQLite)"""
+    return LimiteurGroq()
+
+def admettre_groq(jetons, signal=None):
+    """Admission d'un appel Groq; affiche la position dans la file si le quota est saturé"""
+    def sur_attente(position, secondes):
+        if signal is not None:
+            # Sert aussi de point de contrôle: un rerun pendant l'attente libère le ticket
+            signal.info(f"⏳ Beaucoup de monde chez Sarah... tu es n°{position} dans la file ({secondes:.0f} s)")
+    
+    # Exception levée ici et non dans le limiteur: l'instance partagée garde les classes de son premier run
+    if not obtenir_limiteur_groq().admettre(jetons, sur_attente=sur_attente):
+        raise QuotaGroqDepasse(f"quota Groq saturé après {ATTENTE_MAX_QUOTA} s d'attente")
+    if signal is not None:
+        signal.empty()
+
+def reconcilier_tokens(completion, jetons_reserves):
+    """Rend au quota la différence entre tokens réservés et tokens réellement consommés (notés pour la télémétrie)"""
+    usage = getattr(completion, 'usage', None)
+    noter_usage(usage, getattr(completion, 'model', None))
+    rembourser_tokens(usage, jetons_reserves)
+
+def rembourser_tokens(usage, jetons_reserves):
+    """Rend au quota les tokens réservés non consommés, d'après l'usage d'une réponse ou du dernier chunk d'un flux"""
+    if usage is not None and getattr(usage, 'total_tokens', None):
+        obtenir_limiteur_groq().rembourser(jetons_reserves - usage.total_tokens)
+
+def cout_tokens(messages, max_tokens):
+    """Tokens à réserver pour un appel: prompt estimé + réponse maximum"""
+    return sum(estimer_tokens(m['content']) for m in messages if isinstance(m.get('content'), str)) + max_tokens
+
+# =============================================================================
+# APPELS PARTAGÉS (demandes identiques simultanées: un seul appel Groq)
+# =============================================================================
+
+class VolsPartages:
+    """
+    Regroupe les demandes identiques en cours (single-flight): la première session
+    exécute l'appel, les suivantes attendent son résultat au lieu de relancer Groq.
+    """
+    
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._en_vol = {}
+        self.stats = {'meneurs': 0, 'suiveurs': 0, 'relances': 0}
+    
+    def en_vol(self, cle):
+        """Vrai si une demande avec cette clé est déjà en cours"""
+        with self._verrou:
+            return cle in self._en_vol
+    
+    def executer(self, cle, fonction, attendre):
+        """Résultat de fonction() pour cette clé, partagé avec les demandes identiques simultanées"""
+        while True:
+            with self._verrou:
+                futur = self._en_vol.get(cle)
+                meneur = futur is None
+                if meneur:
+                    futur = self._en_vol[cle] = concurrent.futures.Future()
+                self.stats['meneurs' if meneur else 'suiveurs'] += 1
+            
+            if not meneur:
+                try:
+                    return attendre(futur)
+                except concurrent.futures.CancelledError:
+                    # Le meneur a abandonné (rerun de sa session): un suiveur prend le relais
+                    self.stats['relances'] += 1
+                    continue
+            
+            try:
+                resultat = fonction()
+            except Exception as e:
+                futur.set_exception(e)
+                raise
+            except BaseException:
+                futur.cancel()
+                raise
+            else:
+                futur.set_result(resultat)
+                return resultat
+            finally:
+                with self._verrou:
+                    self._en_vol.pop(cle, None)
+
+@st.cache_resource(show_spinner=False)
+def obtenir_vols_partages():
+    """Registre des demandes en cours unique par processus (partagé entre sessions)"""
+    return VolsPartages()
+
+def cle_vol(espace, entree):
+    """Clé d'une demande: espace + hash de l'entrée normalisée (texte ou octets)"""
+    if isinstance(entree, str):
+        entree = entree.encode()
+    return f"{espace}:{hashlib.sha1(entree).hexdigest()}"
+
+def partager_appel(espace, entree, fonction):
+    """Exécute fonction() une seule fois pour toutes les demandes identiques en cours (attente annulable au rerun)"""
+    try:
+        return obtenir_vols_partages().executer(
+            cle_vol(espace, entree), fonction,
+            # Un suiveur qui part (rerun) n'annule pas l'appel des autres
+            lambda futur: attendre_groq(futur, annuler=False)
+        )
+    except (GroqIndisponible, QuotaGroqDepasse):
+        raise
+    except Exception as e:
+        # Erreur du meneur d'une autre session: même exception, mais classe de son propre run du module
+        for classe in (GroqIndisponible, QuotaGroqDepasse):
+            if type(e).__name__ == classe.__name__:
+                raise classe(*e.args) from e
+        raise
+
+# =============================================================================
+# TÉLÉMÉTRIE DES APPELS IA (métriques Prometheus + journal JSONL tournant)
+# =============================================================================
+
+# Journal d'un appel par ligne (JSONL), découpé à TAILLE_MAX_TELEMETRIE: un fichier par processus,
+# la rotation n'étant pas sûre entre processus (SARAHMIAM_TELEMETRIE doit aussi différer d'un réplica à l'autre)
+FICHIER_TELEMETRIE = os.getenv(
+    "SARAHMIAM_TELEMETRIE",
+    os.path.join(tempfile.gettempdir(), f"sarahmiam-telemetrie-{os.getpid()}.jsonl")
+)
+TAILLE_MAX_TELEMETRIE = 10 * 1024 * 1024
+NB_FICHIERS_TELEMETRIE = 5
+
+# Export des métriques: port HTTP (/metrics) et/ou fichier pour le textfile collector de node_exporter
+PORT_METRIQUES = int(os.getenv("SARAHMIAM_PORT_METRIQUES", "0"))
+FICHIER_METRIQUES = os.getenv("SARAHMIAM_METRIQUES", "")
+INTERVALLE_ECRITURE_METRIQUES = 5
+
+# Bornes des histogrammes de durée (secondes)
+BORNES_DUREES = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+
+# Tarifs Groq en $ par million de tokens (entrée, sortie) et $ par heure d'audio (10 s minimum facturées)
+PRIX_MODELES = {
+    "llama-3.1-8b-instant": (0.05, 0.08),
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    "llama-3.2-90b-vision-preview": (0.90, 0.90),
+}
+PRIX_AUDIO_HEURE = {"whisper-large-v3": 0.111}
+DUREE_AUDIO_MIN_FACTUREE = 10
+
+def cout_appel(modele, tokens_prompt, tokens_completion, audio_secondes=None):
+    """Coût estimé d'un appel en dollars (None si le modèle n'a pas de tarif connu)"""
+    if modele in PRIX_AUDIO_HEURE:
+        if audio_secondes is None:
+            return None
+        return max(audio_secondes, DUREE_AUDIO_MIN_FACTUREE) / 3600 * PRIX_AUDIO_HEURE[modele]
+    if modele not in PRIX_MODELES:
+        return None
+    prix_entree, prix_sortie = PRIX_MODELES[modele]
+    return (tokens_prompt * prix_entree + tokens_completion * prix_sortie) / 1e6
+
+class MesureAppelIA:
+    """Mesure d'un appel IA, remplie pendant l'appel et enregistrée à la fin du bloc mesurer_appel"""
+    
+    def __init__(self, fonction, modele=None):
+        self.fonction = fonction
+        self.modele = modele
+        self.cache = None  # 'hit', 'miss', 'partage' (résultat d'une demande identique en cours) ou None
+        self.erreur = None
+        self.annule = False  # interrompu par Streamlit (rerun, stop de la session): ni succès ni erreur
+        self.tokens_prompt = 0
+        self.tokens_completion = 0
+        self.tokens_mesures = False
+        self.audio_secondes = None
+        self.duree = None
+        self.premier_token = None
+        self._debut = time.monotonic()
+    
+    def noter_premier_token(self):
+        if self.premier_token is None:
+            self.premier_token = time.monotonic() - self._debut
+    
+    def noter_usage(self, usage, modele=None):
+        """Tokens réellement consommés (usage renvoyé par Groq), cumulés si l'appel en fait plusieurs"""
+        if usage is None:
+            return
+        self.tokens_prompt += getattr(usage, 'prompt_tokens', 0) or 0
+        self.tokens_completion += getattr(usage, 'completion_tokens', 0) or 0
+        self.tokens_mesures = True
+        self.modele = self.modele or modele
+    
+    def noter_echec(self, erreur):
+        """Erreur rattrapée par l'appelant (réponse de secours servie à l'utilisateur)"""
+        self.erreur = type(erreur).__name__
+    
+    def terminer(self):
+        self.duree = time.monotonic() - self._debut
+    
+    def ligne(self):
+        """Ligne du journal JSONL"""
+        return {
+            'horodatage': round(time.time(), 3),
+            'pid': os.getpid(),
+            'fonction': self.fonction,
+            'modele': self.modele,
+            'cache': self.cache,
+            'erreur': self.erreur,
+            'annule': self.annule,
+            'duree': round(self.duree, 4),
+            'premier_token': round(self.premier_token, 4) if self.premier_token is not None else None,
+            'tokens_prompt': self.tokens_prompt,
+            'tokens_completion': self.tokens_completion,
+            'tokens_mesures': self.tokens_mesures,
+            'audio_secondes': self.audio_secondes,
+            'cout': cout_appel(self.modele, self.tokens_prompt, self.tokens_completion, self.audio_secondes),
+        }
+
+def etiquettes_prometheus(**etiquettes):
+    """{cle="valeur",...} au format texte Prometheus (valeurs échappées)"""
+    def echapper(valeur):
+        return str(valeur).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{cle}="{echapper(valeur)}"' for cle, valeur in etiquettes.items()) + '}'
+
+class TelemetrieIA:
+    """
+    Agrégats par fonction et modèle (compteurs, histogrammes de durée et de premier token,
+    tokens, coût) exportés au format Prometheus, et journal JSONL tournant d'un appel par ligne.
+    """
+    
+    def __init__(self, journal=FICHIER_TELEMETRIE, fichier_metriques=FICHIER_METRIQUES, port=PORT_METRIQUES):
+        self._verrou = threading.Lock()
+        self.appels = {}           # (fonction, modele, cache, erreur, annule) -> nombre
+        self.durees = {}           # (fonction, modele) -> [compte par borne..., somme, total]
+        self.premiers_tokens = {}
+        self.tokens = {}           # (fonction, modele, type) -> tokens
+        self.couts = {}            # (fonction, modele) -> dollars
+        self.fichier_metriques = fichier_metriques
+        self._metriques_ecrites_le = 0.0
+        
+        self._journal = logging.getLogger("sarahmiam.telemetrie")
+        self._journal.propagate = False
+        if journal and not self._journal.handlers:
+            try:
+                gestionnaire = RotatingFileHandler(journal, maxBytes=TAILLE_MAX_TELEMETRIE,
+                                                   backupCount=NB_FICHIERS_TELEMETRIE, encoding='utf-8')
+                gestionnaire.setFormatter(logging.Formatter('%(message)s'))
+                self._journal.addHandler(gestionnaire)
+                self._journal.setLevel(logging.INFO)
+            except OSError as e:
+                logger.warning("Journal de télémétrie impossible: %s", e)
+        
+        if port:
+            self._servir(port)
+    
+    def _servir(self, port):
+        """Expose /metrics en HTTP (thread de fond) pour un scrape Prometheus"""
+        telemetrie = self
+        
+        class Metriques(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                corps = telemetrie.metriques_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(corps)))
+                self.end_headers()
+                self.wfile.write(corps)
+            
+            def log_message(self, *args):
+                pass
+        
+        try:
+            serveur = ThreadingHTTPServer(('0.0.0.0', port), Metriques)
+        except OSError as e:
+            logger.warning("Métriques non exposées sur le port %s: %s", port, e)
+            return
+        threading.Thread(target=serveur.serve_forever, name="sarahmiam-metriques", daemon=True).start()
+    
+    def _observer(self, histogrammes, cle, valeur):
+        compteurs = histogrammes.setdefault(cle, [0] * (len(BORNES_DUREES) + 2))
+        for i, borne in enumerate(BORNES_DUREES):
+            if valeur <= borne:
+                compteurs[i] += 1
+        compteurs[-2] += valeur
+        compteurs[-1] += 1
+    
+    def enregistrer(self, mesure):
+        """Ajoute un appel terminé aux agrégats et au journal"""
+        ligne = mesure.ligne()
+        modele = ligne['modele'] or 'aucun'
+        with self._verrou:
+            cle = (mesure.fonction, modele, ligne['cache'] or 'aucun', ligne['erreur'] or 'aucune', str(ligne['annule']).lower())
+            self.appels[cle] = self.appels.get(cle, 0) + 1
+            self._observer(self.durees, (mesure.fonction, modele), ligne['duree'])
+            if ligne['premier_token'] is not None:
+                self._observer(self.premiers_tokens, (mesure.fonction, modele), ligne['premier_token'])
+            for type_tokens in ('prompt', 'completion'):
+                if ligne[f'tokens_{type_tokens}']:
+                    cle = (mesure.fonction, modele, type_tokens)
+                    self.tokens[cle] = self.tokens.get(cle, 0) + ligne[f'tokens_{type_tokens}']
+            if ligne['cout']:
+                self.couts[(mesure.fonction, modele)] = self.couts.get((mesure.fonction, modele), 0.0) + ligne['cout']
+        
+        if self._journal.handlers:
+            self._journal.info(json.dumps(ligne, ensure_ascii=False))
+        if self.fichier_metriques and time.monotonic() - self._metriques_ecrites_le >= INTERVALLE_ECRITURE_METRIQUES:
+            self._metriques_ecrites_le = time.monotonic()
+            self.ecrire_metriques()
+    
+    def ecrire_metriques(self):
+        """Écrit les métriques dans le fichier lu par le textfile collector (remplacement atomique)"""
+        temporaire = f"{self.fichier_metriques}.{os.getpid()}.tmp"
+        try:
+            with open(temporaire, 'w', encoding='utf-8') as f:
+                f.write(self.metriques_prometheus())
+            os.replace(temporaire, self.fichier_metriques)
+        except OSError as e:
+            logger.warning("Fichier de métriques impossible: %s", e)
+    
+    def metriques_prometheus(self):
+        """Toutes les métriques au format texte Prometheus"""
+        lignes = []
+        
+        def declarer(nom, type_metrique, aide):
+            lignes.append(f"# HELP {nom} {aide}")
+            lignes.append(f"# TYPE {nom} {type_metrique}")
+        
+        def histogramme(nom, aide, histogrammes):
+            declarer(nom, 'histogram', aide)
+            for (fonction, modele), compteurs in sorted(histogrammes.items()):
+                for borne, compte in zip(BORNES_DUREES + ('+Inf',), compteurs[:len(BORNES_DUREES)] + [compteurs[-1]]):
+                    lignes.append(f"{nom}_bucket{etiquettes_prometheus(fonction=fonction, modele=modele, le=borne)} {compte}")
+                lignes.append(f"{nom}_sum{etiquettes_prometheus(fonction=fonction, modele=modele)} {compteurs[-2]:.6f}")
+                lignes.append(f"{nom}_count{etiquettes_prometheus(fonction=fonction, modele=modele)} {compteurs[-1]}")
+        
+        with self._verrou:
+            declarer('sarahmiam_appels_ia_total', 'counter', "Appels IA par fonction, modèle, résultat du cache, classe d'erreur et annulation")
+            for (fonction, modele, cache, erreur, annule), nombre in sorted(self.appels.items()):
+                etiquettes = etiquettes_prometheus(fonction=fonction, modele=modele, cache=cache, erreur=erreur, annule=annule)
+                lignes.append(f"sarahmiam_appels_ia_total{etiquettes} {nombre}")
+            histogramme('sarahmiam_appels_ia_duree_secondes', "Durée totale des appels IA", self.durees)
+            histogramme('sarahmiam_appels_ia_premier_token_secondes', "Délai avant le premier token (streaming)", self.premiers_tokens)
+            declarer('sarahmiam_appels_ia_tokens_total', 'counter', "Tokens consommés (usage renvoyé par Groq)")
+            for (fonction, modele, type_tokens), nombre in sorted(self.tokens.items()):
+                lignes.append(f"sarahmiam_appels_ia_tokens_total{etiquettes_prometheus(fonction=fonction, modele=modele, type=type_tokens)} {nombre}")
+            declarer('sarahmiam_appels_ia_cout_dollars_total', 'counter', "Coût estimé des appels IA (tarifs PRIX_MODELES)")
+            for (fonction, modele), cout in sorted(self.couts.items()):
+                lignes.append(f"sarahmiam_appels_ia_cout_dollars_total{etiquettes_prometheus(fonction=fonction, modele=modele)} {cout:.8f}")
+        return '\n'.join(lignes) + '\n'
+    
+    def resume(self):
+        """Nombre d'appels, coût total estimé, nombre d'erreurs et d'appels annulés (barre latérale)"""
+        with self._verrou:
+            appels = sum(self.appels.values())
+            erreurs = sum(n for (_, _, _, erreur, _), n in self.appels.items() if erreur != 'aucune')
+            annules = sum(n for (_, _, _, _, annule), n in self.appels.items() if annule == 'true')
+            return {'appels': appels, 'erreurs': erreurs, 'annules': annules, 'cout': sum(self.couts.values())}
+
+@st.cache_resource(show_spinner=False)
+def obtenir_telemetrie():
+    """Télémétrie unique par processus (agrégats partagés par toutes les sessions)"""
+    return TelemetrieIA()
+
+# Mesure de l'appel en cours dans ce thread (les fonctions bas niveau y ajoutent tokens et premier token)
+MESURE_EN_COURS = ContextVar('mesure_appel_ia', default=None)
+
+@contextmanager
+def mesurer_appel(fonction, modele=None):
+    """Mesure un appel IA (durée, tokens, cache, erreur) et l'enregistre à la sortie du bloc, même en cas d'exception"""
+    mesure = MesureAppelIA(fonction, modele)
+    jeton = MESURE_EN_COURS.set(mesure)
+    try:
+        yield mesure
+    except Exception as e:
+        if mesure.erreur is None:
+            mesure.noter_echec(e)
+        raise
+    except BaseException:
+        # Exceptions de contrôle de Streamlit (rerun, stop) ou arrêt du processus: appel annulé, pas en échec
+        mesure.annule = True
+        raise
+    finally:
+        MESURE_EN_COURS.reset(jeton)
+        mesure.terminer()
+        try:
+            obtenir_telemetrie().enregistrer(mesure)
+        except Exception as e:
+            logger.warning("Télémétrie non enregistrée: %s", e)
+
+def noter_usage(usage, modele=None):
+    """Ajoute l'usage d'une réponse Groq à la mesure en cours (sans effet hors mesurer_appel)"""
+    mesure = MESURE_EN_COURS.get()
+    if mesure is not None:
+        mesure.noter_usage(usage, modele)
+
+def noter_premier_token():
+    mesure = MESURE_EN_COURS.get()
+    if mesure is not None:
+        mesure.noter_premier_token()
+
+def noter_echec(erreur):
+    mesure = MESURE_EN_COURS.get()
+    if mesure is not None:
+        mesure.noter_echec(erreur)
+
+def usage_chunk(chunk):
+    """Usage d'un chunk de streaming (dernier chunk: x_groq.usage chez Groq), None sinon"""
+    return getattr(chunk, 'usage', None) or getattr(getattr(chunk, 'x_groq', None), 'usage', None)
 
 # =============================================================================
 # CONSTANTES
@@ -127,6 +905,8 @@ client = Groq(api_key=GROQ_API_KEY)
 
 BUDGET_MAX_PAR_ASSIETTE = 5.0  # euros
 
+logger = logging.getLogger("sarahmiam")
+
 # Liste des allergènes courants
 ALLERGENES = {
     "gluten": ["farine", "pates", "pain", "couscous", "semoule", "blé"],
@@ -176,80 +956,6 @@ CONVERSIONS = {
     "lb_kg": 0.453592
 }
 
-# Prix enseignes pour comparateur
-PRIX_ENSEIGNES = {
-    "Lidl": {
-        "poulet_kg": 4.80, "boeuf_kg": 11.20, "viande_mouton_kg": 12.50, "merguez_kg": 8.90,
-        "viande_hachee_kg": 9.20, "agneau_kg": 13.50, "porc_kg": 7.80,
-        "tomates_kg": 2.10, "oignons_kg": 0.95, "oignon_kg": 0.95, "poivrons_kg": 2.40,
-        "courgettes_kg": 1.80, "aubergines_kg": 2.20, "carottes_kg": 1.10, "pommes_de_terre_kg": 1.50,
-        "tomates_cerises_kg": 3.20, "salade_kg": 1.80, "celeri_kg": 2.50, "haricots_verts_kg": 3.50,
-        "lentilles_kg": 2.80, "pois_chiches_kg": 2.90, "riz_kg": 1.80, "pates_kg": 1.50,
-        "farine_kg": 0.90, "couscous_kg": 2.20, "semoule_kg": 1.90,
-        "coriandre_kg": 8.50, "persil_kg": 8.00, "menthe_kg": 9.00, "basilic_kg": 10.50,
-        "oeufs_unite": 0.25, "fromage_kg": 12.50, "creme_fraiche_kg": 4.80, "beurre_kg": 8.90,
-        "lait_litre": 0.95, "yaourt_unite": 0.40,
-        "saumon_kg": 16.50, "cabillaud_kg": 12.80, "sardines_kg": 6.50,
-        "huile_litre": 4.20, "olives_kg": 6.80, "citrons_kg": 2.50
-    },
-    "Aldi": {
-        "poulet_kg": 4.90, "boeuf_kg": 11.50, "viande_mouton_kg": 12.80, "merguez_kg": 9.20,
-        "viande_hachee_kg": 9.50, "agneau_kg": 13.80, "porc_kg": 8.10,
-        "tomates_kg": 2.20, "oignons_kg": 0.99, "oignon_kg": 0.99, "poivrons_kg": 2.50,
-        "courgettes_kg": 1.90, "aubergines_kg": 2.30, "carottes_kg": 1.15, "pommes_de_terre_kg": 1.55,
-        "tomates_cerises_kg": 3.30, "salade_kg": 1.85, "celeri_kg": 2.60, "haricots_verts_kg": 3.60,
-        "lentilles_kg": 2.90, "pois_chiches_kg": 3.00, "riz_kg": 1.85, "pates_kg": 1.55,
-        "farine_kg": 0.95, "couscous_kg": 2.30, "semoule_kg": 1.95,
-        "coriandre_kg": 8.80, "persil_kg": 8.30, "menthe_kg": 9.30, "basilic_kg": 10.80,
-        "oeufs_unite": 0.26, "fromage_kg": 12.80, "creme_fraiche_kg": 4.90, "beurre_kg": 9.10,
-        "lait_litre": 0.98, "yaourt_unite": 0.42,
-        "saumon_kg": 16.90, "cabillaud_kg": 13.10, "sardines_kg": 6.70,
-        "huile_litre": 4.30, "olives_kg": 7.00, "citrons_kg": 2.60
-    },
-    "Leclerc": {
-        "poulet_kg": 5.50, "boeuf_kg": 12.90, "viande_mouton_kg": 14.20, "merguez_kg": 10.50,
-        "viande_hachee_kg": 10.80, "agneau_kg": 15.20, "porc_kg": 9.20,
-        "tomates_kg": 2.80, "oignons_kg": 1.20, "oignon_kg": 1.20, "poivrons_kg": 3.10,
-        "courgettes_kg": 2.40, "aubergines_kg": 2.90, "carottes_kg": 1.45, "pommes_de_terre_kg": 1.85,
-        "tomates_cerises_kg": 4.10, "salade_kg": 2.30, "celeri_kg": 3.20, "haricots_verts_kg": 4.30,
-        "lentilles_kg": 3.50, "pois_chiches_kg": 3.60, "riz_kg": 2.30, "pates_kg": 1.90,
-        "farine_kg": 1.20, "couscous_kg": 2.80, "semoule_kg": 2.40,
-        "coriandre_kg": 10.50, "persil_kg": 10.00, "menthe_kg": 11.00, "basilic_kg": 12.80,
-        "oeufs_unite": 0.32, "fromage_kg": 14.50, "creme_fraiche_kg": 5.80, "beurre_kg": 10.50,
-        "lait_litre": 1.15, "yaourt_unite": 0.50,
-        "saumon_kg": 19.50, "cabillaud_kg": 15.20, "sardines_kg": 7.80,
-        "huile_litre": 5.10, "olives_kg": 8.50, "citrons_kg": 3.10
-    },
-    "Auchan": {
-        "poulet_kg": 5.80, "boeuf_kg": 12.80, "viande_mouton_kg": 14.50, "merguez_kg": 10.80,
-        "viande_hachee_kg": 11.00, "agneau_kg": 15.50, "porc_kg": 9.50,
-        "tomates_kg": 2.90, "oignons_kg": 1.30, "oignon_kg": 1.30, "poivrons_kg": 3.20,
-        "courgettes_kg": 2.50, "aubergines_kg": 3.00, "carottes_kg": 1.50, "pommes_de_terre_kg": 1.90,
-        "tomates_cerises_kg": 4.20, "salade_kg": 2.40, "celeri_kg": 3.30, "haricots_verts_kg": 4.40,
-        "lentilles_kg": 3.60, "pois_chiches_kg": 3.70, "riz_kg": 2.40, "pates_kg": 1.95,
-        "farine_kg": 1.25, "couscous_kg": 2.90, "semoule_kg": 2.50,
-        "coriandre_kg": 10.80, "persil_kg": 10.30, "menthe_kg": 11.30, "basilic_kg": 13.00,
-        "oeufs_unite": 0.33, "fromage_kg": 14.80, "creme_fraiche_kg": 5.90, "beurre_kg": 10.80,
-        "lait_litre": 1.18, "yaourt_unite": 0.52,
-        "saumon_kg": 19.80, "cabillaud_kg": 15.50, "sardines_kg": 8.00,
-        "huile_litre": 5.20, "olives_kg": 8.80, "citrons_kg": 3.20
-    },
-    "Carrefour": {
-        "poulet_kg": 6.20, "boeuf_kg": 13.50, "viande_mouton_kg": 15.00, "merguez_kg": 11.20,
-        "viande_hachee_kg": 11.50, "agneau_kg": 16.00, "porc_kg": 9.80,
-        "tomates_kg": 3.10, "oignons_kg": 1.50, "oignon_kg": 1.50, "poivrons_kg": 3.50,
-        "courgettes_kg": 2.70, "aubergines_kg": 3.20, "carottes_kg": 1.60, "pommes_de_terre_kg": 2.10,
-        "tomates_cerises_kg": 4.50, "salade_kg": 2.60, "celeri_kg": 3.50, "haricots_verts_kg": 4.70,
-        "lentilles_kg": 3.80, "pois_chiches_kg": 3.90, "riz_kg": 2.60, "pates_kg": 2.10,
-        "farine_kg": 1.35, "couscous_kg": 3.10, "semoule_kg": 2.70,
-        "coriandre_kg": 11.50, "persil_kg": 11.00, "menthe_kg": 12.00, "basilic_kg": 13.80,
-        "oeufs_unite": 0.35, "fromage_kg": 15.50, "creme_fraiche_kg": 6.20, "beurre_kg": 11.50,
-        "lait_litre": 1.25, "yaourt_unite": 0.55,
-        "saumon_kg": 21.00, "cabillaud_kg": 16.50, "sardines_kg": 8.50,
-        "huile_litre": 5.50, "olives_kg": 9.50, "citrons_kg": 3.50
-    }
-}
-
 # Liens GPS enseignes
 LIENS_ENSEIGNES = {
     "Leclerc": {"gps": "https://www.google.com/maps/search/Leclerc+{ville}"},
@@ -260,2651 +966,1097 @@ LIENS_ENSEIGNES = {
 }
 
 # =============================================================================
-# BASE DE DONNÉES - 40 RECETTES ULTRA-DÉTAILLÉES
+# BASE DE DONNÉES - RECETTES ET PRIX (dossier data/)
 # =============================================================================
 
-RECETTES_DETAILLEES = {
-    # ========== RECETTES MAROCAINES (20) ==========
-    "Harira": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Soupe",
-        "budget_assiette": 1.20,
-        "duree_min": 60,
-        "difficulte": "Moyen",
-        "saison": "Hiver",
-        "darija": "الحريرة - Had l-harira, katskhon f ramadan!",
-        "ingredients": {
-            "viande_mouton_kg": 0.3,
-            "tomates_kg": 0.5,
-            "oignon_kg": 0.2,
-            "lentilles_kg": 0.15,
-            "pois_chiches_kg": 0.15,
-            "farine_kg": 0.05,
-            "celeri_kg": 0.1,
-            "coriandre_kg": 0.05
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🔥 Préparation de la base (10 min)",
-                "description": "Faire revenir la viande coupée en petits morceaux avec l'oignon émincé dans une grande marmite avec 2 cuillères d'huile d'olive. Remuer constamment jusqu'à ce que la viande soit bien dorée.",
-                "temperature": "Feu moyen-vif",
-                "duree": "10 minutes",
-                "astuce": "Walli ghir tqelbi mezyan bach ma ta7reqch! (Remue bien pour ne pas brûler!)"
-            },
-            {
-                "num": 2,
-                "titre": "🍅 Ajout des tomates et épices (5 min)",
-                "description": "Ajouter les tomates pelées et coupées, le céleri haché, sel, poivre, curcuma, gingembre et un peu de safran. Laisser mijoter en remuant.",
-                "temperature": "Feu moyen",
-                "duree": "5 minutes",
-                "astuce": "Les épices doivent bien se mélanger avec la viande avant d'ajouter l'eau"
-            },
-            {
-                "num": 3,
-                "titre": "💧 Cuisson principale (30 min)",
-                "description": "Ajouter 2 litres d'eau, les lentilles et les pois chiches (trempés la veille). Porter à ébullition puis réduire le feu. Couvrir et laisser mijoter.",
-                "temperature": "Feu doux",
-                "duree": "30 minutes",
-                "astuce": "Safi, khelli-ha tta tsali! (Laisse mijoter tranquillement!)"
-            },
-            {
-                "num": 4,
-                "titre": "🌾 Préparation du Tedouira (5 min)",
-                "description": "Dans un bol, mélanger la farine avec un peu d'eau froide pour faire une pâte liquide sans grumeaux. Ajouter la coriandre fraîche ciselée.",
-                "temperature": "Température ambiante",
-                "duree": "5 minutes",
-                "astuce": "Le tedouira donne l'onctuosité typique de la harira"
-            },
-            {
-                "num": 5,
-                "titre": "🥄 Liaison finale (10 min)",
-                "description": "Ajouter le tedouira progressivement en remuant constamment. Continuer la cuisson en remuant pour éviter les grumeaux.",
-                "temperature": "Feu doux",
-                "duree": "10 minutes",
-                "astuce": "Walli ma twaqfch men tqelib! (Ne t'arrête pas de remuer!)"
-            },
-            {
-                "num": 6,
-                "titre": "✨ Finitions",
-                "description": "Goûter et ajuster l'assaisonnement. Ajouter un filet de citron et plus de coriandre fraîche.",
-                "temperature": "Éteindre le feu",
-                "duree": "2 minutes",
-                "astuce": "Le citron réveille tous les arômes!"
-            },
-            {
-                "num": 7,
-                "titre": "🍽️ Service",
-                "description": "Servir bien chaud avec des dattes, des œufs durs et des chebakia pendant Ramadan, ou simplement avec du pain.",
-                "temperature": "Très chaud",
-                "duree": "Immédiat",
-                "astuce": "Besaha w raha! (Bon appétit et santé!)"
-            }
-        ],
-        "anecdote": "La harira est LA soupe du Ramadan au Maroc. Chaque famille a sa recette secrète transmise de génération en génération!"
-    },
+# Sources éditables: data/recettes.json et data/prix.json. Les recettes sont
+# compilées en base SQLite (data/recettes-<empreinte>.db) pour ne charger que
+# les en-têtes; étapes, anecdote et darija sont lus à la demande.
+
+DOSSIER_DONNEES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+FICHIER_RECETTES = os.path.join(DOSSIER_DONNEES, 'recettes.json')
+FICHIER_PRIX = os.path.join(DOSSIER_DONNEES, 'prix.json')
+
+# Champs gardés en mémoire (listes, filtres, index); le reste est lu à la demande
+CHAMPS_ENTETE = ('pays', 'categorie', 'budget_assiette', 'duree_min', 'difficulte', 'saison', 'ingredients')
+
+# Bases compilées conservées (les sessions en cours peuvent encore lire l'ancienne)
+NB_CATALOGUES_COMPILES_GARDES = 3
+
+# Champs d'une étape de recette
+CHAMPS_ETAPE = ('num', 'titre', 'description', 'temperature', 'duree', 'astuce')
+
+def _interner(valeur):
+    """Une seule copie en mémoire des textes courts répétés ("Feu moyen", "Facile"...)"""
+    if isinstance(valeur, str) and len(valeur) <= 40:
+        return sys.intern(valeur)
+    return valeur
+
+class Etape(Mapping):
+    """Étape de recette compacte (slots), lisible comme un dict"""
+    __slots__ = CHAMPS_ETAPE
     
-    "Tajine Poulet Citron": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Plat principal",
-        "budget_assiette": 2.80,
-        "duree_min": 75,
-        "difficulte": "Facile",
-        "saison": "Toute",
-        "darija": "طاجين دجاج بالحامض - Tajine dial djaj b l7amed!",
-        "ingredients": {
-            "poulet_kg": 1.0,
-            "citron_confit_kg": 0.15,
-            "oignon_kg": 0.2,
-            "olives_kg": 0.1,
-            "citron_frais_kg": 0.1,
-            "huile_olive_kg": 0.05
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🔪 Préparation du poulet (10 min)",
-                "description": "Nettoyer le poulet et le découper en 8 morceaux. Frotter chaque morceau avec sel, poivre, curcuma, gingembre et un peu d'ail écrasé.",
-                "temperature": "Température ambiante",
-                "duree": "10 minutes",
-                "astuce": "Walli khelli t3teq l7wayej mezyan f l7am! (Fais bien pénétrer les épices!)"
-            },
-            {
-                "num": 2,
-                "titre": "🧅 Faire revenir (15 min)",
-                "description": "Dans le tajine ou une cocotte, faire chauffer l'huile d'olive et faire dorer le poulet de tous côtés avec l'oignon émincé.",
-                "temperature": "Feu moyen-vif",
-                "duree": "15 minutes",
-                "astuce": "Il faut que le poulet soit bien doré pour avoir du goût!"
-            },
-            {
-                "num": 3,
-                "titre": "💧 Cuisson mijotée (40 min)",
-                "description": "Ajouter un demi-verre d'eau, le citron confit coupé en quartiers, quelques branches de coriandre. Couvrir et laisser mijoter à feu doux.",
-                "temperature": "Feu très doux",
-                "duree": "40 minutes",
-                "astuce": "Safi, khelli-ha tchettah bchwiya bchwiya! (Laisse mijoter doucement!)"
-            },
-            {
-                "num": 4,
-                "titre": "🫒 Ajout des olives (10 min)",
-                "description": "Ajouter les olives vertes dénoyautées et le jus d'un citron frais. Poursuivre la cuisson à découvert.",
-                "temperature": "Feu doux",
-                "duree": "10 minutes",
-                "astuce": "Les olives doivent juste chauffer, pas trop cuire"
-            },
-            {
-                "num": 5,
-                "titre": "✨ Finitions",
-                "description": "Vérifier l'assaisonnement. La sauce doit être onctueuse et bien réduite. Ajouter de la coriandre fraîche ciselée.",
-                "temperature": "Éteindre le feu",
-                "duree": "2 minutes",
-                "astuce": "La sauce ne doit pas être trop liquide!"
-            },
-            {
-                "num": 6,
-                "titre": "🍽️ Présentation",
-                "description": "Disposer le poulet au centre, les citrons confits et olives autour. Napper de sauce et parsemer de coriandre.",
-                "temperature": "Chaud",
-                "duree": "3 minutes",
-                "astuce": "Présente-le directement dans le tajine, c'est plus beau!"
-            },
-            {
-                "num": 7,
-                "titre": "🥖 Service",
-                "description": "Servir avec du pain marocain bien chaud (khobz) ou du riz blanc.",
-                "temperature": "Très chaud",
-                "duree": "Immédiat",
-                "astuce": "Besaha! (Bon appétit!)"
-            }
-        ],
-        "anecdote": "Le tajine aux citrons confits est un classique marocain. Le secret? Les vrais citrons confits maison qui ont macéré au moins 1 mois!"
-    },
+    def __init__(self, etape):
+        for champ in CHAMPS_ETAPE:
+            setattr(self, champ, _interner(etape.get(champ)))
     
-    "Couscous Royal": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Plat principal",
-        "budget_assiette": 3.50,
-        "duree_min": 120,
-        "difficulte": "Difficile",
-        "saison": "Toute",
-        "darija": "كسكس - Seksu dyalna, a khoya!",
-        "ingredients": {
-            "viande_mouton_kg": 0.4,
-            "poulet_kg": 0.4,
-            "merguez_kg": 0.3,
-            "semoule_couscous_kg": 0.5,
-            "legumes_kg": 1.5,
-            "pois_chiches_kg": 0.2,
-            "oignon_kg": 0.2
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🥘 Préparation du bouillon (20 min)",
-                "description": "Dans un grand couscoussier, faire revenir la viande et le poulet avec l'oignon, ail, épices (ras el hanout, curcuma, gingembre, poivre). Ajouter 3 litres d'eau.",
-                "temperature": "Feu vif puis moyen",
-                "duree": "20 minutes",
-                "astuce": "Hadi asas seksu! (C'est la base du couscous!)"
-            },
-            {
-                "num": 2,
-                "titre": "🥕 Préparation des légumes (15 min)",
-                "description": "Éplucher et couper en gros morceaux: carottes, navets, courgettes, courge, tomates. Ajouter au bouillon avec les pois chiches trempés.",
-                "temperature": "Feu moyen",
-                "duree": "15 minutes",
-                "astuce": "Coupe gros sinon ça va se défaire!"
-            },
-            {
-                "num": 3,
-                "titre": "🌾 Premier roulage de la semoule (10 min)",
-                "description": "Mettre la semoule dans un grand plat. Arroser d'eau salée, malaxer avec les mains pour séparer les grains. Ajouter un filet d'huile.",
-                "temperature": "Température ambiante",
-                "duree": "10 minutes",
-                "astuce": "Khelli kulshi mtfarreq mezyan! (Bien séparer tous les grains!)"
-            },
-            {
-                "num": 4,
-                "titre": "💨 Première cuisson vapeur (20 min)",
-                "description": "Mettre la semoule dans le panier du couscoussier au-dessus du bouillon qui bout. Ne pas couvrir. Laisser la vapeur monter.",
-                "temperature": "Vapeur forte",
-                "duree": "20 minutes",
-                "astuce": "Quand la vapeur sort partout, c'est bon!"
-            },
-            {
-                "num": 5,
-                "titre": "🌾 Deuxième roulage (10 min)",
-                "description": "Reverser la semoule dans le plat. Casser les grumeaux avec les mains mouillées. Ajouter eau salée et huile. Rouler à nouveau.",
-                "temperature": "Température ambiante",
-                "duree": "10 minutes",
-                "astuce": "Walli khdem b sbabek! (Travaille avec tes doigts!)"
-            },
-            {
-                "num": 6,
-                "titre": "💨 Deuxième cuisson vapeur (20 min)",
-                "description": "Remettre au-dessus du bouillon. Laisser cuire à nouveau. Cette fois on peut couvrir légèrement.",
-                "temperature": "Vapeur moyenne",
-                "duree": "20 minutes",
-                "astuce": "Les grains doivent être bien gonflés et aérés"
-            },
-            {
-                "num": 7,
-                "titre": "🌶️ Cuisson merguez (15 min)",
-                "description": "Dans une poêle, griller les merguez à feu moyen. Les piquer avec une fourchette pour évacuer la graisse.",
-                "temperature": "Feu moyen",
-                "duree": "15 minutes",
-                "astuce": "N'ajoute pas d'huile, elles en ont déjà!"
-            },
-            {
-                "num": 8,
-                "titre": "✨ Dernier roulage et beurrage (5 min)",
-                "description": "Reverser la semoule une dernière fois. Ajouter le beurre et malaxer délicatement pour séparer les grains.",
-                "temperature": "Tiède",
-                "duree": "5 minutes",
-                "astuce": "Le beurre rend le couscous fondant!"
-            },
-            {
-                "num": 9,
-                "titre": "🍽️ Montage et service",
-                "description": "Former une montagne de semoule. Disposer viandes, poulet, merguez et légumes autour. Napper de bouillon. Servir le reste du bouillon à part.",
-                "temperature": "Très chaud",
-                "duree": "5 minutes",
-                "astuce": "Besaha w raha! C'est le plat du vendredi!"
-            }
-        ],
-        "anecdote": "Le couscous royal est servi chaque vendredi dans les familles marocaines. C'est un moment de partage et de convivialité!"
-    },
+    def __getitem__(self, cle):
+        if cle in CHAMPS_ETAPE:
+            valeur = getattr(self, cle)
+            if valeur is not None:
+                return valeur
+        raise KeyError(cle)
     
-    "Kefta": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Plat principal",
-        "budget_assiette": 1.80,
-        "duree_min": 30,
-        "difficulte": "Facile",
-        "saison": "Toute",
-        "darija": "كفتة - Kefta dial mama!",
-        "ingredients": {
-            "viande_hachee_kg": 0.6,
-            "oignon_kg": 0.15,
-            "persil_kg": 0.05,
-            "coriandre_kg": 0.05
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🔪 Préparation du mélange (10 min)",
-                "description": "Hacher finement persil, coriandre et oignon. Mélanger avec la viande hachée, sel, poivre, paprika, cumin et un peu de piment.",
-                "temperature": "Température ambiante",
-                "duree": "10 minutes",
-                "astuce": "Khelli l7wayej yetmellku mezyan! (Mélange bien les épices!)"
-            },
-            {
-                "num": 2,
-                "titre": "✋ Façonnage des brochettes (10 min)",
-                "description": "Mouiller les mains. Prendre une boule de viande et l'allonger autour d'une brochette en pressant bien.",
-                "temperature": "Température ambiante",
-                "duree": "10 minutes",
-                "astuce": "Mains mouillées = la viande ne colle pas!"
-            },
-            {
-                "num": 3,
-                "titre": "🔥 Cuisson au grill (10 min)",
-                "description": "Faire griller les keftas à feu vif en les retournant régulièrement. Elles doivent être bien dorées à l'extérieur.",
-                "temperature": "Feu vif",
-                "duree": "10 minutes",
-                "astuce": "Qelleb-hom bezzaf! (Retourne-les souvent!)"
-            },
-            {
-                "num": 4,
-                "titre": "🍽️ Service",
-                "description": "Servir avec du pain, de la salade et de la harissa.",
-                "temperature": "Très chaud",
-                "duree": "Immédiat",
-                "astuce": "Besaha!"
-            }
-        ],
-        "anecdote": "Les keftas se mangent dans la rue au Maroc, c'est du fast-food marocain!"
-    },
+    def __iter__(self):
+        return (champ for champ in CHAMPS_ETAPE if getattr(self, champ) is not None)
     
-    "Zaalouk": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Salade",
-        "budget_assiette": 0.90,
-        "duree_min": 40,
-        "difficulte": "Facile",
-        "saison": "Été",
-        "darija": "زعلوك - Zaalouk bnaynin!",
-        "ingredients": {
-            "aubergine_kg": 0.8,
-            "tomate_kg": 0.5,
-            "ail_kg": 0.05,
-            "huile_olive_kg": 0.08
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🔥 Griller les aubergines (15 min)",
-                "description": "Piquer les aubergines avec une fourchette. Les griller directement sur le feu ou au four jusqu'à ce que la peau soit complètement noircie.",
-                "temperature": "Feu vif / Four 220°C",
-                "duree": "15 minutes",
-                "astuce": "Khelli-ha ta t7req kulha! (Laisse-la brûler complètement!)"
-            },
-            {
-                "num": 2,
-                "titre": "🥄 Éplucher et écraser (10 min)",
-                "description": "Laisser tiédir puis éplucher. Écraser la chair à la fourchette avec l'ail écrasé.",
-                "temperature": "Tiède",
-                "duree": "10 minutes",
-                "astuce": "La chair doit être comme une purée"
-            },
-            {
-                "num": 3,
-                "titre": "🍅 Cuisson avec tomates (15 min)",
-                "description": "Dans une poêle, faire revenir les tomates râpées avec l'aubergine écrasée, huile d'olive, paprika, cumin, sel. Faire mijoter.",
-                "temperature": "Feu moyen",
-                "duree": "15 minutes",
-                "astuce": "Qelleb mezyan! (Remue bien!)"
-            },
-            {
-                "num": 4,
-                "titre": "🍽️ Service",
-                "description": "Servir froid avec du pain ou en salade d'accompagnement.",
-                "temperature": "Froid",
-                "duree": "Après refroidissement",
-                "astuce": "Meilleur le lendemain!"
-            }
-        ],
-        "anecdote": "Le zaalouk est incontournable dans les tables marocaines, c'est une salade cuite aux aubergines grillées!"
-    },
+    def __len__(self):
+        return sum(1 for _ in self)
     
-    "Pastilla": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Plat festif",
-        "budget_assiette": 4.50,
-        "duree_min": 120,
-        "difficulte": "Difficile",
-        "saison": "Toute",
-        "darija": "بسطيلة - Bstila dial l3reyess!",
-        "ingredients": {
-            "feuilles_brick_kg": 0.4,
-            "pigeon_ou_poulet_kg": 1.0,
-            "amandes_kg": 0.3,
-            "oeufs_kg": 0.3,
-            "oignon_kg": 0.3,
-            "beurre_kg": 0.2,
-            "sucre_kg": 0.1,
-            "cannelle_kg": 0.02
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🍖 Cuisson de la viande (45 min)",
-                "description": "Faire revenir le pigeon ou poulet avec oignon, épices (safran, gingembre, cannelle), beurre. Ajouter eau et laisser mijoter jusqu'à ce que la viande se détache.",
-                "temperature": "Feu doux",
-                "duree": "45 minutes",
-                "astuce": "La viande doit être ultra fondante!"
-            },
-            {
-                "num": 2,
-                "titre": "🥚 Préparation des œufs (10 min)",
-                "description": "Retirer la viande. Dans le bouillon restant, ajouter les œufs battus et cuire en remuant jusqu'à obtenir des œufs brouillés. Égoutter.",
-                "temperature": "Feu doux",
-                "duree": "10 minutes",
-                "astuce": "Les œufs doivent être bien secs"
-            },
-            {
-                "num": 3,
-                "titre": "🔥 Torréfaction des amandes (10 min)",
-                "description": "Faire dorer les amandes à sec dans une poêle. Les concasser grossièrement et mélanger avec sucre et cannelle.",
-                "temperature": "Feu moyen",
-                "duree": "10 minutes",
-                "astuce": "Ne les brûle pas!"
-            },
-            {
-                "num": 4,
-                "titre": "🍖 Effilocher la viande (10 min)",
-                "description": "Effilocher la viande en enlevant os et peau. Mélanger avec un peu de bouillon réduit et épices.",
-                "temperature": "Température ambiante",
-                "duree": "10 minutes",
-                "astuce": "La viande doit être en fins morceaux"
-            },
-            {
-                "num": 5,
-                "titre": "📋 Montage de la pastilla (20 min)",
-                "description": "Beurrer un moule rond. Disposer les feuilles de brick beurrées en rosace. Alterner couches: œufs, viande, amandes, viande, œufs. Replier les feuilles.",
-                "temperature": "Température ambiante",
-                "duree": "20 minutes",
-                "astuce": "Chaque couche doit être bien répartie!"
-            },
-            {
-                "num": 6,
-                "titre": "🔥 Cuisson finale (25 min)",
-                "description": "Badigeonner le dessus de beurre. Cuire au four jusqu'à ce que le dessus soit bien doré et croustillant.",
-                "temperature": "Four 180°C",
-                "duree": "25 minutes",
-                "astuce": "Elle doit être dorée comme de l'or!"
-            },
-            {
-                "num": 7,
-                "titre": "✨ Décoration et service",
-                "description": "Saupoudrer de sucre glace et tracer des lignes de cannelle. Servir chaud ou tiède.",
-                "temperature": "Chaud/Tiède",
-                "duree": "5 minutes",
-                "astuce": "Le mélange sucré-salé est typique!"
-            }
-        ],
-        "anecdote": "La pastilla est LE plat festif marocain par excellence, servi lors des grandes occasions. C'est un chef-d'œuvre culinaire!"
-    },
+    def __repr__(self):
+        return f"Etape({self.num!r}, {self.titre!r})"
+
+class IngredientsRecette(Mapping):
+    """Ingrédients d'une recette: clés internées + quantités dans un tableau, lisibles comme un dict"""
+    __slots__ = ('_cles', '_quantites')
     
-    "Bissara": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Soupe",
-        "budget_assiette": 0.60,
-        "duree_min": 50,
-        "difficulte": "Facile",
-        "saison": "Hiver",
-        "darija": "بيصارة - Bissara dyal sbah!",
-        "ingredients": {
-            "feves_seches_kg": 0.5,
-            "ail_kg": 0.08,
-            "huile_olive_kg": 0.08,
-            "cumin_kg": 0.02,
-            "paprika_kg": 0.02
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "💧 Cuisson des fèves (40 min)",
-                "description": "Faire cuire les fèves sèches (épluchées) avec l'ail dans beaucoup d'eau salée jusqu'à ce qu'elles soient très tendres.",
-                "temperature": "Feu moyen",
-                "duree": "40 minutes",
-                "astuce": "Elles doivent se défaire facilement!"
-            },
-            {
-                "num": 2,
-                "titre": "🥄 Mixage (5 min)",
-                "description": "Mixer le tout jusqu'à obtenir une purée lisse et onctueuse. Ajouter de l'eau de cuisson si trop épais.",
-                "temperature": "Chaud",
-                "duree": "5 minutes",
-                "astuce": "Consistance crémeuse parfaite!"
-            },
-            {
-                "num": 3,
-                "titre": "🌶️ Assaisonnement (5 min)",
-                "description": "Verser dans des bols. Faire un puits au centre, y verser l'huile d'olive. Saupoudrer de cumin et paprika.",
-                "temperature": "Très chaud",
-                "duree": "5 minutes",
-                "astuce": "L'huile d'olive au centre, c'est traditionnel!"
-            },
-            {
-                "num": 4,
-                "titre": "🍽️ Service",
-                "description": "Servir bien chaud avec du pain marocain (khobz) pour tremper.",
-                "temperature": "Très chaud",
-                "duree": "Immédiat",
-                "astuce": "Parfait pour le petit-déjeuner d'hiver!"
-            }
-        ],
-        "anecdote": "La bissara est le petit-déjeuner traditionnel des travailleurs marocains en hiver. Nourrissante et économique!"
-    },
+    def __init__(self, ingredients):
+        self._cles = tuple(sys.intern(cle) for cle in ingredients)
+        self._quantites = array('d', ingredients.values())
     
-    "Rfissa": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Plat principal",
-        "budget_assiette": 2.50,
-        "duree_min": 90,
-        "difficulte": "Moyen",
-        "saison": "Hiver",
-        "darija": "رفيسة - Rfissa dial les mamans!",
-        "ingredients": {
-            "poulet_kg": 1.2,
-            "msemmen_ou_crepes_kg": 0.4,
-            "lentilles_kg": 0.2,
-            "oignon_kg": 0.25,
-            "fenugrec_kg": 0.05,
-            "smen_beurre_kg": 0.15
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🍖 Cuisson du poulet (50 min)",
-                "description": "Dans une marmite, faire cuire le poulet avec oignon, ail, smen (beurre rance), safran, gingembre, ras el hanout, fenugrec et lentilles. Couvrir d'eau.",
-                "temperature": "Feu moyen",
-                "duree": "50 minutes",
-                "astuce": "Le fenugrec donne le goût unique!"
-            },
-            {
-                "num": 2,
-                "titre": "🥞 Préparation des msemmen (20 min si fait maison)",
-                "description": "Si tu fais les msemmen maison, prépare-les et fais-les cuire. Sinon utilise des crêpes ou achète des msemmen tout faits.",
-                "temperature": "Feu moyen",
-                "duree": "20 minutes",
-                "astuce": "Les msemmen du commerce font l'affaire!"
-            },
-            {
-                "num": 3,
-                "titre": "💧 Réduction de la sauce (10 min)",
-                "description": "Retirer le poulet cuit. Faire réduire le bouillon avec les lentilles jusqu'à obtenir une sauce épaisse et onctueuse.",
-                "temperature": "Feu vif",
-                "duree": "10 minutes",
-                "astuce": "La sauce doit napper la cuillère!"
-            },
-            {
-                "num": 4,
-                "titre": "🥞 Trempage des msemmen (5 min)",
-                "description": "Déchirer les msemmen en morceaux. Les tremper dans la sauce chaude pour qu'ils s'imprègnent bien.",
-                "temperature": "Chaud",
-                "duree": "5 minutes",
-                "astuce": "Ils doivent être bien imbibés!"
-            },
-            {
-                "num": 5,
-                "titre": "🍽️ Montage et service (5 min)",
-                "description": "Dans un plat de service, disposer les msemmen trempés. Disposer le poulet dessus. Arroser du reste de sauce. Garnir de lentilles.",
-                "temperature": "Très chaud",
-                "duree": "5 minutes",
-                "astuce": "Se mange avec les mains traditionnellement!"
-            }
-        ],
-        "anecdote": "La rfissa est LE plat traditionnel servi aux jeunes mamans après l'accouchement au Maroc. Très nourrissant!"
-    },
+    def __getitem__(self, cle):
+        try:
+            return self._quantites[self._cles.index(cle)]
+        except ValueError:
+            raise KeyError(cle) from None
     
-    "Tangia": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Plat principal",
-        "budget_assiette": 3.20,
-        "duree_min": 240,
-        "difficulte": "Moyen",
-        "saison": "Toute",
-        "darija": "طانجية - Tangia dial Marrakech!",
-        "ingredients": {
-            "viande_mouton_kg": 1.0,
-            "ail_kg": 0.1,
-            "huile_kg": 0.1,
-            "smen_kg": 0.05,
-            "citron_confit_kg": 0.1
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🏺 Préparation dans la jarre (15 min)",
-                "description": "Dans une jarre en terre cuite (tangia), mettre la viande coupée en gros morceaux avec ail écrasé, huile, smen, cumin, safran, sel, poivre et citron confit.",
-                "temperature": "Température ambiante",
-                "duree": "15 minutes",
-                "astuce": "Pas d'eau! Cuisson à l'étouffée!"
-            },
-            {
-                "num": 2,
-                "titre": "🔥 Cuisson traditionnelle (4h)",
-                "description": "Fermer hermétiquement avec du papier d'alu et ficelle. Mettre dans les braises du hammam (bain maure) ou au four très doux.",
-                "temperature": "Four 110°C",
-                "duree": "4 heures",
-                "astuce": "Traditionnellement cuit dans les braises du hammam!"
-            },
-            {
-                "num": 3,
-                "titre": "🍽️ Service",
-                "description": "Ouvrir la jarre devant les convives. La viande doit être ultra fondante et se défaire toute seule.",
-                "temperature": "Très chaud",
-                "duree": "Immédiat",
-                "astuce": "L'ouverture de la tangia est un moment!"
-            }
-        ],
-        "anecdote": "La tangia est LE plat des hommes à Marrakech! Traditionnellement préparé par les hommes et cuit au hammam pendant qu'ils se lavent!"
-    },
+    def __contains__(self, cle):
+        return cle in self._cles
     
-    "Briouates": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Entrée",
-        "budget_assiette": 1.40,
-        "duree_min": 45,
-        "difficulte": "Moyen",
-        "saison": "Toute",
-        "darija": "بريوات - Briouates dial Ramadan!",
-        "ingredients": {
-            "feuilles_brick_kg": 0.25,
-            "viande_hachee_kg": 0.4,
-            "oignon_kg": 0.1,
-            "persil_kg": 0.05,
-            "huile_friture_kg": 0.5
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🍳 Préparation de la farce (20 min)",
-                "description": "Faire revenir la viande hachée avec oignon émincé, persil, coriandre, sel, poivre, cumin, paprika. Cuire jusqu'à évaporation complète de l'eau.",
-                "temperature": "Feu moyen",
-                "duree": "20 minutes",
-                "astuce": "La farce doit être sèche, pas de jus!"
-            },
-            {
-                "num": 2,
-                "titre": "📐 Pliage en triangles (15 min)",
-                "description": "Couper les feuilles de brick en bandes. Mettre une cuillère de farce au bout. Plier en triangle comme un drapeau. Coller le bout avec un peu d'œuf battu.",
-                "temperature": "Température ambiante",
-                "duree": "15 minutes",
-                "astuce": "Plie comme un drapeau américain!"
-            },
-            {
-                "num": 3,
-                "titre": "🔥 Friture (10 min)",
-                "description": "Faire chauffer l'huile. Frire les briouates jusqu'à ce qu'elles soient bien dorées et croustillantes. Égoutter sur papier absorbant.",
-                "temperature": "Huile 180°C",
-                "duree": "10 minutes",
-                "astuce": "Feu moyen pour qu'elles dorent sans brûler!"
-            },
-            {
-                "num": 4,
-                "titre": "🍽️ Service",
-                "description": "Servir chaud ou tiède en entrée ou à l'heure du thé.",
-                "temperature": "Chaud/Tiède",
-                "duree": "Immédiat",
-                "astuce": "Parfait pour le ftour du Ramadan!"
-            }
-        ],
-        "anecdote": "Les briouates sont incontournables pendant le Ramadan. Chaque famille a sa farce préférée: viande, poulet, fromage ou amandes!"
-    },
+    def __iter__(self):
+        return iter(self._cles)
     
-    "Taktouka": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Salade",
-        "budget_assiette": 0.80,
-        "duree_min": 35,
-        "difficulte": "Facile",
-        "saison": "Été",
-        "darija": "تكتوكة - Taktouka dial sif!",
-        "ingredients": {
-            "poivron_kg": 0.6,
-            "tomate_kg": 0.5,
-            "ail_kg": 0.04,
-            "huile_olive_kg": 0.06
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🔥 Griller les poivrons (15 min)",
-                "description": "Griller les poivrons directement sur le feu ou au four jusqu'à ce que la peau soit noircie. Les mettre dans un sac plastique fermé 5 min.",
-                "temperature": "Feu vif / Four 220°C",
-                "duree": "15 minutes",
-                "astuce": "Le sac facilite l'épluchage!"
-            },
-            {
-                "num": 2,
-                "titre": "✋ Éplucher et couper (5 min)",
-                "description": "Éplucher les poivrons sous l'eau. Retirer graines et membranes. Couper en lanières.",
-                "temperature": "Tiède",
-                "duree": "5 minutes",
-                "astuce": "Enlève bien toutes les peaux!"
-            },
-            {
-                "num": 3,
-                "titre": "🍅 Cuisson finale (15 min)",
-                "description": "Dans une poêle, faire revenir ail, tomates concassées, poivrons, huile d'olive, paprika, cumin, sel. Faire mijoter jusqu'à épaississement.",
-                "temperature": "Feu moyen",
-                "duree": "15 minutes",
-                "astuce": "La sauce doit être épaisse!"
-            },
-            {
-                "num": 4,
-                "titre": "🍽️ Service",
-                "description": "Servir froid avec du pain ou en accompagnement d'un tajine.",
-                "temperature": "Froid",
-                "duree": "Après refroidissement",
-                "astuce": "Meilleur le lendemain!"
-            }
-        ],
-        "anecdote": "La taktouka est la salade d'été par excellence au Maroc. Fraîche et savoureuse!"
-    },
+    def __len__(self):
+        return len(self._cles)
     
-    "Seffa": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Dessert/Plat sucré",
-        "budget_assiette": 1.20,
-        "duree_min": 40,
-        "difficulte": "Facile",
-        "saison": "Toute",
-        "darija": "سفة - Seffa dial l3id!",
-        "ingredients": {
-            "vermicelles_kg": 0.5,
-            "amandes_kg": 0.15,
-            "sucre_kg": 0.15,
-            "cannelle_kg": 0.02,
-            "beurre_kg": 0.1,
-            "raisins_secs_kg": 0.08
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "💨 Cuisson vapeur des vermicelles (20 min)",
-                "description": "Faire cuire les vermicelles à la vapeur dans un couscoussier. Ils doivent être tendres et bien gonflés.",
-                "temperature": "Vapeur forte",
-                "duree": "20 minutes",
-                "astuce": "Ne pas les faire bouillir dans l'eau!"
-            },
-            {
-                "num": 2,
-                "titre": "🧈 Beurrage (5 min)",
-                "description": "Verser les vermicelles dans un plat. Ajouter le beurre fondu et mélanger délicatement pour bien les séparer.",
-                "temperature": "Chaud",
-                "duree": "5 minutes",
-                "astuce": "Le beurre les rend brillants!"
-            },
-            {
-                "num": 3,
-                "titre": "🥜 Préparation garniture (10 min)",
-                "description": "Faire griller les amandes. Les concasser grossièrement. Mélanger avec sucre et cannelle. Faire gonfler les raisins secs dans eau tiède.",
-                "temperature": "Feu moyen",
-                "duree": "10 minutes",
-                "astuce": "Amandes bien dorées = plus de goût!"
-            },
-            {
-                "num": 4,
-                "titre": "🏔️ Montage (5 min)",
-                "description": "Former une montagne de vermicelles. Décorer le sommet avec le mélange amandes-sucre-cannelle. Parsemer de raisins secs autour.",
-                "temperature": "Chaud",
-                "duree": "5 minutes",
-                "astuce": "La présentation en montagne est traditionnelle!"
-            },
-            {
-                "num": 5,
-                "titre": "🍽️ Service",
-                "description": "Servir chaud ou tiède. Chacun se sert en creusant dans la montagne.",
-                "temperature": "Chaud/Tiède",
-                "duree": "Immédiat",
-                "astuce": "Servi lors des fêtes et célébrations!"
-            }
-        ],
-        "anecdote": "La seffa est servie lors des grandes occasions: mariages, Aid, naissances. C'est un plat de fête!"
-    },
+    def keys(self):
+        return self._cles
     
-    "Msemmen": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Pain/Crêpe",
-        "budget_assiette": 0.50,
-        "duree_min": 60,
-        "difficulte": "Difficile",
-        "saison": "Toute",
-        "darija": "مسمن - Msemmen dial sbah!",
-        "ingredients": {
-            "farine_kg": 0.5,
-            "semoule_fine_kg": 0.15,
-            "huile_kg": 0.1,
-            "beurre_kg": 0.08,
-            "sel_kg": 0.01
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🥄 Préparation de la pâte (15 min)",
-                "description": "Mélanger farine, semoule fine, sel. Ajouter eau tiède progressivement et pétrir jusqu'à obtenir une pâte lisse et élastique. Laisser reposer 10 min.",
-                "temperature": "Température ambiante",
-                "duree": "15 minutes",
-                "astuce": "La pâte doit être souple!"
-            },
-            {
-                "num": 2,
-                "titre": "🔵 Façonnage des boules (10 min)",
-                "description": "Diviser la pâte en boules de la taille d'une noix. Les huiler légèrement. Laisser reposer 20 min.",
-                "temperature": "Température ambiante",
-                "duree": "10 minutes + 20 min repos",
-                "astuce": "L'huile permet l'étalement!"
-            },
-            {
-                "num": 3,
-                "titre": "📏 Étalement et pliage (15 min)",
-                "description": "Sur une surface huilée, étaler chaque boule très finement au maximum. Badigeonner de beurre fondu. Plier en carré en 2 fois.",
-                "temperature": "Température ambiante",
-                "duree": "15 minutes",
-                "astuce": "Plus c'est fin, plus c'est feuilleté!"
-            },
-            {
-                "num": 4,
-                "titre": "🔥 Cuisson (20 min)",
-                "description": "Faire cuire chaque msemmen dans une poêle ou sur une plaque chaude sans matière grasse. Retourner quand des bulles se forment. Doit être doré des 2 côtés.",
-                "temperature": "Feu moyen",
-                "duree": "20 minutes (2-3 min/pièce)",
-                "astuce": "Pas d'huile dans la poêle!"
-            },
-            {
-                "num": 5,
-                "titre": "🍽️ Service",
-                "description": "Servir chaud avec du miel, de la confiture ou du fromage. Ou nature avec du thé à la menthe.",
-                "temperature": "Chaud",
-                "duree": "Immédiat",
-                "astuce": "Parfait pour le petit-déjeuner!"
-            }
-        ],
-        "anecdote": "Les msemmen sont les crêpes feuilletées marocaines. C'est l'art du pliage qui fait leur texture unique!"
-    },
+    def values(self):
+        return tuple(self._quantites)
     
-    "Chebakia": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Pâtisserie",
-        "budget_assiette": 1.80,
-        "duree_min": 90,
-        "difficulte": "Difficile",
-        "saison": "Ramadan",
-        "darija": "شباكية - Chebakia dial Ramadan!",
-        "ingredients": {
-            "farine_kg": 0.5,
-            "amandes_kg": 0.1,
-            "sesame_kg": 0.15,
-            "miel_kg": 0.3,
-            "huile_friture_kg": 1.0,
-            "oeuf_kg": 0.1,
-            "levure_kg": 0.02
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🥄 Préparation de la pâte (20 min)",
-                "description": "Mélanger farine, amandes concassées, graines de sésame grillées, épices (cannelle, anis, gomme arabique), levure. Ajouter œufs, huile, eau de fleur d'oranger. Pétrir. Repos 30 min.",
-                "temperature": "Température ambiante",
-                "duree": "20 min + 30 min repos",
-                "astuce": "La pâte doit être ferme!"
-            },
-            {
-                "num": 2,
-                "titre": "📏 Étalement et découpe (25 min)",
-                "description": "Étaler finement. Découper en rectangles. Faire 4 fentes longitudinales. Tresser en passant une extrémité dans les fentes pour former une fleur.",
-                "temperature": "Température ambiante",
-                "duree": "25 minutes",
-                "astuce": "Le tressage demande de la pratique!"
-            },
-            {
-                "num": 3,
-                "titre": "🔥 Friture (20 min)",
-                "description": "Faire chauffer l'huile. Frire les chebakia jusqu'à ce qu'elles soient bien dorées. Égoutter sur papier absorbant.",
-                "temperature": "Huile 170°C",
-                "duree": "20 minutes",
-                "astuce": "Feu moyen pour cuisson uniforme!"
-            },
-            {
-                "num": 4,
-                "titre": "🍯 Trempage dans le miel (15 min)",
-                "description": "Faire chauffer le miel avec un peu d'eau de fleur d'oranger. Y tremper les chebakia encore chaudes. Les retirer et les rouler dans du sésame grillé.",
-                "temperature": "Miel tiède",
-                "duree": "15 minutes",
-                "astuce": "Le miel doit être liquide mais pas trop chaud!"
-            },
-            {
-                "num": 5,
-                "titre": "🍽️ Séchage et service (10 min)",
-                "description": "Disposer sur une grille pour laisser égoutter le surplus de miel. Laisser durcir légèrement.",
-                "temperature": "Température ambiante",
-                "duree": "10 minutes",
-                "astuce": "Elles se conservent plusieurs semaines!"
-            }
-        ],
-        "anecdote": "Les chebakia sont LA pâtisserie du Ramadan! Servies au ftour avec la harira. Leur forme en fleur tressée est emblématique!"
-    },
+    def items(self):
+        return tuple(zip(self._cles, self._quantites))
     
-    "Maakouda": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Entrée/Snack",
-        "budget_assiette": 0.70,
-        "duree_min": 35,
-        "difficulte": "Facile",
-        "saison": "Toute",
-        "darija": "معقودة - Maakouda dial lil!",
-        "ingredients": {
-            "pomme_terre_kg": 0.8,
-            "persil_kg": 0.05,
-            "ail_kg": 0.03,
-            "oeuf_kg": 0.1,
-            "huile_friture_kg": 0.5
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🥔 Cuisson des pommes de terre (20 min)",
-                "description": "Éplucher et couper les pommes de terre en morceaux. Les faire bouillir dans l'eau salée jusqu'à ce qu'elles soient bien tendres.",
-                "temperature": "Eau bouillante",
-                "duree": "20 minutes",
-                "astuce": "Elles doivent être très tendres!"
-            },
-            {
-                "num": 2,
-                "titre": "🥄 Préparation de la purée (5 min)",
-                "description": "Égoutter et écraser en purée. Ajouter persil haché, ail écrasé, sel, poivre, cumin, paprika. Incorporer l'œuf battu. Bien mélanger.",
-                "temperature": "Chaud",
-                "duree": "5 minutes",
-                "astuce": "La purée doit être homogène!"
-            },
-            {
-                "num": 3,
-                "titre": "✋ Façonnage (5 min)",
-                "description": "Former des boulettes aplaties avec les mains mouillées. Les passer dans la farine.",
-                "temperature": "Température ambiante",
-                "duree": "5 minutes",
-                "astuce": "Pas trop épaisses!"
-            },
-            {
-                "num": 4,
-                "titre": "🔥 Friture (5 min)",
-                "description": "Faire chauffer l'huile. Frire les maakouda jusqu'à ce qu'elles soient bien dorées et croustillantes.",
-                "temperature": "Huile 180°C",
-                "duree": "5 minutes",
-                "astuce": "Feu vif pour qu'elles soient croustillantes!"
-            },
-            {
-                "num": 5,
-                "titre": "🍽️ Service",
-                "description": "Égoutter et servir chaud avec de la harissa ou dans du pain.",
-                "temperature": "Très chaud",
-                "duree": "Immédiat",
-                "astuce": "Parfait en sandwich!"
-            }
-        ],
-        "anecdote": "Les maakouda sont le street-food marocain par excellence! On les trouve partout, surtout le soir!"
-    },
+    def __repr__(self):
+        return f"IngredientsRecette({dict(self.items())!r})"
+
+def compacter_details(details):
+    """Convertit les étapes d'une recette en objets Etape"""
+    if isinstance(details.get('etapes'), list):
+        details = dict(details, etapes=tuple(Etape(e) for e in details['etapes']))
+    return details
+
+class Recette(Mapping):
+    """Recette compacte (slots, chaînes internées) lisible comme un dict: en-tête en mémoire, détails lus à la demande"""
+    __slots__ = CHAMPS_ENTETE + ('_base', '_rang', '_cles_details', '_details')
+    
+    def __init__(self, entete, cles_details=(), base=None, rang=None, details=None):
+        for champ in CHAMPS_ENTETE:
+            valeur = entete.get(champ)
+            if champ == 'ingredients' and valeur is not None:
+                valeur = IngredientsRecette(valeur)
+            setattr(self, champ, _interner(valeur))
+        self._base = base
+        self._rang = rang
+        self._cles_details = tuple(sys.intern(cle) for cle in cles_details)
+        self._details = details
+    
+    @classmethod
+    def depuis_dict(cls, recette):
+        """Recette compacte hors base compilée (détails gardés en mémoire)"""
+        entete = {k: v for k, v in recette.items() if k in CHAMPS_ENTETE}
+        details = compacter_details({k: v for k, v in recette.items() if k not in CHAMPS_ENTETE})
+        return cls(entete, tuple(details), details=details)
+    
+    def details(self):
+        """Étapes, anecdote et darija (lus dans la base compilée si besoin)"""
+        if self._details is not None:
+            return self._details
+        return lire_details_recette(self._base, self._rang)
+    
+    def __getitem__(self, cle):
+        if cle in CHAMPS_ENTETE:
+            valeur = getattr(self, cle)
+            if valeur is not None:
+                return valeur
+            raise KeyError(cle)
+        if cle in self._cles_details:
+            return self.details()[cle]
+        raise KeyError(cle)
+    
+    def __contains__(self, cle):
+        if cle in CHAMPS_ENTETE:
+            return getattr(self, cle) is not None
+        return cle in self._cles_details
+    
+    def __iter__(self):
+        for champ in CHAMPS_ENTETE:
+            if getattr(self, champ) is not None:
+                yield champ
+        yield from self._cles_details
+    
+    def __len__(self):
+        return sum(1 for _ in self)
+    
+    def __repr__(self):
+        return f"Recette({self.pays!r}, {self.categorie!r}, détails={list(self._cles_details)})"
+
+def compiler_catalogue(recettes, cible):
+    """Compile le catalogue en base SQLite (en-têtes et détails séparés)"""
+    # Écriture dans un fichier temporaire puis remplacement atomique (multi-réplicas)
+    temporaire = f"{cible}.{os.getpid()}.{threading.get_ident()}.tmp"
+    conn = sqlite3.connect(temporaire)
+    try:
+        conn.execute("CREATE TABLE recettes (rang INTEGER PRIMARY KEY, nom TEXT UNIQUE, entete TEXT, cles_details TEXT, details TEXT)")
+        for rang, (nom, recette) in enumerate(recettes.items()):
+            entete = {k: v for k, v in recette.items() if k in CHAMPS_ENTETE}
+            details = {k: v for k, v in recette.items() if k not in CHAMPS_ENTETE}
+            conn.execute(
+                "INSERT INTO recettes VALUES (?, ?, ?, ?, ?)",
+                (rang, nom, json.dumps(entete, ensure_ascii=False), json.dumps(list(details)), json.dumps(details, ensure_ascii=False))
+            )
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(temporaire, cible)
+
+def charger_recettes(contenu, empreinte, dossier=DOSSIER_DONNEES):
+    """Charge les en-têtes des recettes depuis la base compilée de cette version"""
+    cible = os.path.join(dossier, f"recettes-{empreinte}.db")
+    if not os.access(dossier, os.W_OK):
+        # Dossier en lecture seule: compiler dans le dossier temporaire
+        cible = os.path.join(tempfile.gettempdir(), f"sarahmiam-recettes-{empreinte}.db")
+    if not os.path.exists(cible):
+        compiler_catalogue(json.loads(contenu), cible)
+    
+    with closing(sqlite3.connect(f"file:{cible}?mode=ro", uri=True)) as conn:
+        lignes = conn.execute("SELECT rang, nom, entete, cles_details FROM recettes ORDER BY rang").fetchall()
     
-    "Sellou": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Pâtisserie sèche",
-        "budget_assiette": 2.20,
-        "duree_min": 60,
-        "difficulte": "Moyen",
-        "saison": "Ramadan/Fêtes",
-        "darija": "سلو - Sellou dial Ramadan!",
-        "ingredients": {
-            "farine_kg": 0.5,
-            "amandes_kg": 0.3,
-            "sesame_kg": 0.15,
-            "miel_kg": 0.2,
-            "beurre_kg": 0.25,
-            "sucre_kg": 0.15
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🔥 Torréfaction de la farine (25 min)",
-                "description": "Faire griller la farine à sec dans une grande poêle en remuant constamment jusqu'à ce qu'elle soit bien dorée et dégage une odeur de noisette.",
-                "temperature": "Feu moyen-doux",
-                "duree": "25 minutes",
-                "astuce": "Remue tout le temps sinon elle brûle!"
-            },
-            {
-                "num": 2,
-                "titre": "🥜 Torréfaction amandes et sésame (15 min)",
-                "description": "Griller séparément les amandes et le sésame. Laisser refroidir puis moudre finement les amandes.",
-                "temperature": "Feu moyen",
-                "duree": "15 minutes",
-                "astuce": "Les amandes doivent être bien dorées!"
-            },
-            {
-                "num": 3,
-                "titre": "🥄 Mélange à sec (5 min)",
-                "description": "Dans un grand récipient, mélanger la farine torréfiée, les amandes moulues, le sésame, le sucre et les épices (cannelle, anis).",
-                "temperature": "Température ambiante",
-                "duree": "5 minutes",
-                "astuce": "Bien mélanger pour homogénéiser!"
-            },
-            {
-                "num": 4,
-                "titre": "🧈 Ajout du gras (10 min)",
-                "description": "Faire fondre le beurre. L'ajouter progressivement au mélange en pétrissant. Ajouter le miel. Mélanger jusqu'à obtenir une pâte sableuse.",
-                "temperature": "Beurre fondu tiède",
-                "duree": "10 minutes",
-                "astuce": "La texture doit être sableuse, pas trop compacte!"
-            },
-            {
-                "num": 5,
-                "titre": "🏔️ Façonnage (5 min)",
-                "description": "Tasser le sellou dans un plat. Former une montagne ou des dômes. Décorer avec des amandes entières.",
-                "temperature": "Température ambiante",
-                "duree": "5 minutes",
-                "astuce": "Se déguste à la cuillère!"
-            }
-        ],
-        "anecdote": "Le sellou est une pâtisserie énergétique servie aux jeunes mamans et pendant le Ramadan. Très nutritif!"
-    },
+    return {
+        sys.intern(nom): Recette(json.loads(entete), json.loads(cles_details), base=cible, rang=rang)
+        for rang, nom, entete, cles_details in lignes
+    }
+
+@st.cache_resource(show_spinner=False, max_entries=128)
+def lire_details_recette(base, rang):
+    """Lit les étapes, l'anecdote et le darija d'une recette (cache borné)"""
+    with closing(sqlite3.connect(f"file:{base}?mode=ro", uri=True)) as conn:
+        ligne = conn.execute("SELECT details FROM recettes WHERE rang = ?", (rang,)).fetchone()
+    return compacter_details(json.loads(ligne[0])) if ligne else {}
+
+def nettoyer_catalogues_compiles(dossier, a_garder):
+    """Supprime les anciennes bases compilées, sauf les plus récentes"""
+    bases = sorted(
+        (os.path.join(dossier, f) for f in os.listdir(dossier) if f.startswith('recettes-') and f.endswith('.db')),
+        key=os.path.getmtime, reverse=True
+    )
+    for base in bases:
+        if base in a_garder or len(a_garder) < NB_CATALOGUES_COMPILES_GARDES:
+            a_garder.add(base)
+            continue
+        try:
+            os.remove(base)
+        except OSError:
+            pass
+
+# =============================================================================
+# REGISTRE DES INGRÉDIENTS (identifiants entiers, unités, synonymes)
+# =============================================================================
+
+# Suffixe des clés d'ingrédients -> unité
+UNITES_INGREDIENTS = {'_kg': 'kg', '_litre': 'litre', '_unite': 'unite'}
+AFFICHAGE_UNITES = {'kg': 'kg', 'litre': 'L', 'unite': 'unité(s)'}
+MOTS_VIDES_INGREDIENTS = {'de', 'du', 'des', 'la', 'le', 'les', 'ou', 'et', 'au', 'aux', 'en'}
+
+# Synonymes entre recettes et prix (noms normalisés, sans unité)
+ALIAS_INGREDIENTS = {
+    "citron_frais": "citron",
+    "semoule_couscous": "couscous",
+    "semoule_fine": "semoule",
+    "creme": "creme_fraiche",
+    "fromage_rape": "fromage",
+    "smen": "smen_beurre"
+}
+
+# Conversions vers le kg pour rapprocher des clés d'unités différentes
+DENSITES_KG_PAR_LITRE = {"huile": 0.92, "lait": 1.03}
+POIDS_UNITAIRES_KG = {"oeuf": 0.06, "yaourt": 0.125}
+
+def normaliser_ingredient(texte):
+    """Normalise un nom d'ingrédient: minuscules, sans accents, sans unité"""
+    texte = texte.lower().replace('œ', 'oe')
+    if not texte.isascii():
+        texte = ''.join(c for c in unicodedata.normalize('NFKD', texte) if not unicodedata.combining(c))
+    texte = re.sub(r"[\s\-'’]+", '_', texte.strip())
+    for suffixe in UNITES_INGREDIENTS:
+        if texte.endswith(suffixe):
+            texte = texte[:-len(suffixe)]
+    return texte.strip('_')
+
+def unite_ingredient(cle):
+    """Unité d'une clé d'ingrédient d'après son suffixe ('lait_litre' -> 'litre')"""
+    for suffixe, unite in UNITES_INGREDIENTS.items():
+        if cle.endswith(suffixe):
+            return unite
+    return 'unite'
+
+def mots_ingredient(texte):
+    """Mots significatifs d'un ingrédient, au singulier (ex: 'pommes de terre' -> pomme, terre)"""
+    mots = []
+    for mot in normaliser_ingredient(texte).split('_'):
+        if len(mot) < 3 or mot in MOTS_VIDES_INGREDIENTS:
+            continue
+        if len(mot) > 3 and mot[-1] in 'sx':
+            mot = mot[:-1]
+        if mot not in mots:
+            mots.append(mot)
+    return mots
+
+def tokens_ingredient(texte):
+    """Ensemble des mots-clés d'un ingrédient (pour l'index inversé)"""
+    return set(mots_ingredient(texte))
+
+def nom_canonique(cle):
+    """Nom canonique d'un ingrédient ('pommes_de_terre_kg' et 'pomme_terre_kg' -> 'pomme_terre')"""
+    nom = normaliser_ingredient(cle)
+    nom = ALIAS_INGREDIENTS.get(nom, nom)
+    return '_'.join(mots_ingredient(nom)) or nom
+
+def facteur_kg(canonique, unite):
+    """Nombre de kg pour une unité de la clé (None si la conversion est inconnue)"""
+    if unite == 'kg':
+        return 1.0
+    if unite == 'litre':
+        return DENSITES_KG_PAR_LITRE.get(canonique, 1.0)
+    return POIDS_UNITAIRES_KG.get(canonique)
+
+def construire_registre_ingredients(*sources):
+    """
+    Associe chaque clé d'ingrédient (recettes, prix) à un identifiant entier
+    canonique, une unité de base et un nom d'affichage.
+    """
+    return etendre_registre_ingredients(REGISTRE_VIDE, [cle for cles in sources for cle in cles])
+
+REGISTRE_VIDE = {
+    'id_par_canonique': {}, 'id_par_cle': {}, 'facteur_par_cle': {}, 'unite_par_cle': {},
+    'canoniques': (), 'unites': (), 'noms': ()
+}
+
+def etendre_registre_ingredients(registre, cles):
+    """Registre complété par de nouvelles clés (identifiants existants inchangés, registre d'origine intact)"""
+    id_par_canonique = dict(registre['id_par_canonique'])
+    id_par_cle = dict(registre['id_par_cle'])
+    facteur_par_cle = dict(registre['facteur_par_cle'])
+    unite_par_cle = dict(registre['unite_par_cle'])
+    canoniques, unites, noms = list(registre['canoniques']), list(registre['unites']), list(registre['noms'])
+    
+    for cle in cles:
+        if cle in id_par_cle:
+            continue
+        unite = unite_ingredient(cle)
+        canonique = nom_canonique(cle)
+        facteur = facteur_kg(canonique, unite)
+        base = 'kg'
+        if facteur is None:
+            # Compté à l'unité sans poids connu: ingrédient distinct
+            canonique, base, facteur = f"{canonique}_unite", 'unite', 1.0
+        canonique = sys.intern(canonique)
+        
+        if canonique not in id_par_canonique:
+            id_par_canonique[canonique] = len(canoniques)
+            canoniques.append(canonique)
+            unites.append(base)
+            noms.append('')
+        id_ing = id_par_canonique[canonique]
+        
+        # Nom d'affichage: la variante la plus explicite ('pommes de terre')
+        nom = normaliser_ingredient(cle)
+        nom = ALIAS_INGREDIENTS.get(nom, nom).replace('_', ' ').capitalize()
+        if len(nom) > len(noms[id_ing]):
+            noms[id_ing] = nom
+        
+        id_par_cle[cle] = id_ing
+        facteur_par_cle[cle] = facteur
+        unite_par_cle[cle] = unite
     
-    "Baghrir": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Crêpe",
-        "budget_assiette": 0.60,
-        "duree_min": 40,
-        "difficulte": "Moyen",
-        "saison": "Toute",
-        "darija": "بغرير - Baghrir dial sbah!",
-        "ingredients": {
-            "semoule_fine_kg": 0.25,
-            "farine_kg": 0.15,
-            "levure_kg": 0.02,
-            "oeuf_kg": 0.05,
-            "sucre_kg": 0.02,
-            "sel_kg": 0.005,
-            "beurre_miel_kg": 0.15
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🥄 Préparation de la pâte (10 min)",
-                "description": "Mixer semoule fine, farine, levure, sucre, sel, œuf et eau tiède jusqu'à obtenir une pâte liquide homogène. Laisser reposer 15 min.",
-                "temperature": "Température ambiante",
-                "duree": "10 min + 15 min repos",
-                "astuce": "La pâte doit être liquide comme une crêpe!"
-            },
-            {
-                "num": 2,
-                "titre": "💨 Activation de la levure (15 min)",
-                "description": "Pendant le repos, la pâte va faire des bulles et gonfler. C'est normal! Ne pas remuer après le repos.",
-                "temperature": "Température ambiante",
-                "duree": "15 minutes",
-                "astuce": "Les bulles sont essentielles!"
-            },
-            {
-                "num": 3,
-                "titre": "🔥 Cuisson (15 min)",
-                "description": "Chauffer une poêle antiadhésive sans matière grasse. Verser une louche de pâte. Cuire SEULEMENT d'un côté jusqu'à apparition de mille trous et surface sèche.",
-                "temperature": "Feu moyen",
-                "duree": "15 minutes (2 min/pièce)",
-                "astuce": "Ne JAMAIS retourner! Un seul côté!"
-            },
-            {
-                "num": 4,
-                "titre": "🍯 Préparation beurre-miel",
-                "description": "Faire fondre du beurre avec du miel à feu doux. Mélanger bien.",
-                "temperature": "Feu doux",
-                "duree": "5 minutes",
-                "astuce": "Mélange moitié-moitié!"
-            },
-            {
-                "num": 5,
-                "titre": "🍽️ Service",
-                "description": "Empiler les baghrir côté troué vers le haut. Verser généreusement le mélange beurre-miel qui va s'infiltrer dans tous les trous.",
-                "temperature": "Chaud",
-                "duree": "Immédiat",
-                "astuce": "Les mille trous absorbent le beurre-miel!"
-            }
-        ],
-        "anecdote": "Les baghrir sont appelés 'crêpes aux mille trous'. Leur texture alvéolée unique absorbe le beurre fondu au miel!"
-    },
+    return {
+        'id_par_canonique': id_par_canonique,
+        'id_par_cle': id_par_cle,
+        'facteur_par_cle': facteur_par_cle,
+        'unite_par_cle': unite_par_cle,
+        'canoniques': tuple(canoniques),
+        'unites': tuple(unites),
+        'noms': tuple(noms)
+    }
+
+def resoudre_ingredient(cle, registre=None):
+    """Retourne (identifiant, facteur vers l'unité de base) d'une clé, ou (None, 0) si inconnue"""
+    registre = registre or obtenir_index_catalogue()['registre']
+    id_ing = registre['id_par_cle'].get(cle)
+    if id_ing is not None:
+        return id_ing, registre['facteur_par_cle'][cle]
+    
+    # Clé hors catalogue (recette générée, saisie libre): résolution par le nom canonique
+    canonique = nom_canonique(cle)
+    facteur = facteur_kg(canonique, unite_ingredient(cle))
+    if facteur is None:
+        canonique, facteur = f"{canonique}_unite", 1.0
+    id_ing = registre['id_par_canonique'].get(canonique)
+    return (id_ing, facteur) if id_ing is not None else (None, 0)
+
+# =============================================================================
+# INDEX CATALOGUE (construits une fois par version du catalogue)
+# =============================================================================
+
+def construire_index_ingredients(recettes, registre):
+    """Construit l'index inversé mot-clé -> ingrédients (identifiants) -> rangs des recettes"""
+    par_token = {}
+    par_ingredient = {}
+    nb_ingredients = np.zeros(len(recettes), dtype=np.int32)
+    rang = {}
+    
+    for nom, recette in recettes.items():
+        ingredients = recette.get('ingredients', {})
+        rang[nom] = len(rang)
+        for ing in ingredients:
+            for token in tokens_ingredient(ing):
+                par_token.setdefault(token, set()).add(registre['id_par_cle'][ing])
+        # Un alias et son nom canonique (ou deux unités) ne comptent qu'une fois par recette
+        ids = {registre['id_par_cle'][ing] for ing in ingredients}
+        nb_ingredients[rang[nom]] = len(ids)
+        for id_ing in ids:
+            par_ingredient.setdefault(id_ing, []).append(rang[nom])
     
-    "Khobz": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Pain",
-        "budget_assiette": 0.30,
-        "duree_min": 90,
-        "difficulte": "Facile",
-        "saison": "Toute",
-        "darija": "خبز - Khobz dial darna!",
-        "ingredients": {
-            "farine_kg": 1.0,
-            "semoule_fine_kg": 0.1,
-            "levure_kg": 0.02,
-            "sel_kg": 0.02,
-            "huile_kg": 0.03
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🥄 Préparation de la pâte (15 min)",
-                "description": "Mélanger farine, semoule, sel. Diluer la levure dans eau tiède avec une pincée de sucre. Ajouter à la farine. Pétrir 10 min en ajoutant eau tiède progressivement.",
-                "temperature": "Température ambiante",
-                "duree": "15 minutes",
-                "astuce": "Pétris bien pour avoir du moelleux!"
-            },
-            {
-                "num": 2,
-                "titre": "💨 Première levée (45 min)",
-                "description": "Former une boule. Huiler légèrement. Couvrir d'un torchon humide. Laisser lever dans un endroit chaud jusqu'à doubler de volume.",
-                "temperature": "Endroit chaud 25-30°C",
-                "duree": "45 minutes",
-                "astuce": "Près du radiateur ou four éteint!"
-            },
-            {
-                "num": 3,
-                "titre": "✋ Façonnage (5 min)",
-                "description": "Dégazer la pâte. Former des boules aplaties de 15cm de diamètre. Saupoudrer de semoule fine.",
-                "temperature": "Température ambiante",
-                "duree": "5 minutes",
-                "astuce": "Pas trop fin sinon pas moelleux!"
-            },
-            {
-                "num": 4,
-                "titre": "💨 Seconde levée (15 min)",
-                "description": "Laisser reposer les pains formés encore 15 min sous un torchon.",
-                "temperature": "Température ambiante",
-                "duree": "15 minutes",
-                "astuce": "Cette levée donne le moelleux!"
-            },
-            {
-                "num": 5,
-                "titre": "🔥 Cuisson (10 min)",
-                "description": "Préchauffer le four à 240°C. Cuire les pains sur plaque huilée jusqu'à ce qu'ils soient dorés et gonflés.",
-                "temperature": "Four 240°C",
-                "duree": "10 minutes",
-                "astuce": "Four très chaud = beau gonflement!"
-            },
-            {
-                "num": 6,
-                "titre": "🍽️ Service",
-                "description": "Laisser tiédir sous un torchon pour garder moelleux. Servir tiède.",
-                "temperature": "Tiède",
-                "duree": "Après refroidissement",
-                "astuce": "Rien de meilleur que le pain maison!"
-            }
-        ],
-        "anecdote": "Le khobz marocain est rond et plat. Dans chaque quartier, il y a un four communautaire (ferran) où on apporte sa pâte à cuire!"
-    },
+    return {
+        'par_token': {t: frozenset(ids) for t, ids in par_token.items()},
+        'par_ingredient': {id_ing: np.array(rangs, dtype=np.int32) for id_ing, rangs in par_ingredient.items()},
+        'nb_ingredients': nb_ingredients,
+        'rang': rang
+    }
+
+# Un bit par allergène, dans l'ordre de ALLERGENES
+BITS_ALLERGENES = {allergene: 1 << i for i, allergene in enumerate(ALLERGENES)}
+
+def masque_ingredient(ing):
+    """Masque des allergènes contenus dans une clé d'ingrédient"""
+    ing_lower = ing.lower()
+    masque = 0
+    for allergene, mots in ALLERGENES.items():
+        if any(mot in ing_lower for mot in mots):
+            masque |= BITS_ALLERGENES[allergene]
+    return masque
+
+def masque_allergies(allergies):
+    """Convertit une liste d'allergies utilisateur en masque de bits"""
+    masque = 0
+    for allergie in allergies or []:
+        masque |= BITS_ALLERGENES.get(allergie.lower(), 0)
+    return masque
+
+def construire_masques_allergenes(recettes):
+    """Précalcule le masque d'allergènes de chaque recette"""
+    masques_ingredients = {}
+    masques = {}
+    for nom, recette in recettes.items():
+        masque = 0
+        for ing in recette.get('ingredients', {}):
+            if ing not in masques_ingredients:
+                masques_ingredients[ing] = masque_ingredient(ing)
+            masque |= masques_ingredients[ing]
+        masques[nom] = masque
+    return masques
+
+def construire_colonnes_recettes(recettes):
+    """Vue en colonnes NumPy des attributs filtrables du catalogue"""
+    noms = tuple(recettes.keys())
+    vocabulaires = {'difficulte': {}, 'saison': {}, 'pays': {}}
+    codes = {champ: np.empty(len(noms), dtype=np.int32) for champ in vocabulaires}
+    budget = np.empty(len(noms), dtype=np.float64)
+    duree = np.empty(len(noms), dtype=np.float64)
+    
+    for i, recette in enumerate(recettes.values()):
+        budget[i] = recette.get('budget_assiette', 0)
+        duree[i] = recette.get('duree_min', 0)
+        valeurs = {
+            'difficulte': recette.get('difficulte', '').lower(),
+            'saison': recette.get('saison', 'Toute').lower(),
+            'pays': recette.get('pays', '')
+        }
+        for champ, valeur in valeurs.items():
+            codes[champ][i] = vocabulaires[champ].setdefault(valeur, len(vocabulaires[champ]))
     
-    "Zaazaa": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Dessert",
-        "budget_assiette": 1.50,
-        "duree_min": 35,
-        "difficulte": "Facile",
-        "saison": "Toute",
-        "darija": "زعزع - Zaazaa dyal bent!",
-        "ingredients": {
-            "lait_kg": 1.0,
-            "semoule_fine_kg": 0.15,
-            "sucre_kg": 0.12,
-            "eau_fleur_oranger_kg": 0.03,
-            "amandes_kg": 0.08
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🥛 Chauffer le lait (5 min)",
-                "description": "Faire chauffer le lait avec le sucre dans une casserole. Ne pas faire bouillir.",
-                "temperature": "Feu moyen",
-                "duree": "5 minutes",
-                "astuce": "Surveille bien!"
-            },
-            {
-                "num": 2,
-                "titre": "🌾 Ajout semoule (15 min)",
-                "description": "Saupoudrer la semoule fine en pluie tout en remuant constamment. Cuire en remuant jusqu'à épaississement.",
-                "temperature": "Feu doux",
-                "duree": "15 minutes",
-                "astuce": "Remue sans arrêt pour éviter grumeaux!"
-            },
-            {
-                "num": 3,
-                "titre": "✨ Parfumage (5 min)",
-                "description": "Retirer du feu. Ajouter l'eau de fleur d'oranger. Bien mélanger.",
-                "temperature": "Hors feu",
-                "duree": "5 minutes",
-                "astuce": "L'eau de fleur d'oranger parfume délicatement!"
-            },
-            {
-                "num": 4,
-                "titre": "🥜 Préparation amandes (10 min)",
-                "description": "Faire griller les amandes effilées. Les réserver pour la décoration.",
-                "temperature": "Feu moyen",
-                "duree": "10 minutes",
-                "astuce": "Amandes bien dorées!"
-            },
-            {
-                "num": 5,
-                "titre":"🍽️ Service",
-                "description": "Verser dans des coupelles individuelles. Décorer d'amandes grillées. Servir tiède ou froid.",
-                "temperature": "Tiède/Froid",
-                "duree": "Immédiat ou après refroidissement",
-                "astuce": "Parfait pour finir un repas!"
-            }
-        ],
-        "anecdote": "Le zaazaa est un dessert lacté traditionnel marocain, réconfortant et parfumé à la fleur d'oranger!"
-    },
+    return {
+        'noms': noms,
+        'budget': budget,
+        'duree': duree,
+        'difficulte': codes['difficulte'],
+        'saison': codes['saison'],
+        'pays': codes['pays'],
+        # Valeurs distinctes, dans l'ordre des codes
+        'difficultes': tuple(vocabulaires['difficulte']),
+        'saisons': tuple(vocabulaires['saison']),
+        'pays_valeurs': tuple(vocabulaires['pays'])
+    }
+
+# Recherche plein texte (BM25) sur les noms, catégories, pays et ingrédients des recettes
+BM25_K1 = 1.2
+BM25_B = 0.75
+POIDS_CHAMPS_RECHERCHE = {'nom': 3, 'categorie': 2, 'pays': 1, 'ingredients': 1}
+
+@lru_cache(maxsize=65536)
+def _mots_mot(brut):
+    """Mots significatifs d'un mot brut (les noms de recettes partagent beaucoup de mots)"""
+    return tuple(mots_ingredient(re.sub(r"[^\w'’-]+", ' ', brut)))
+
+def mots_texte(texte):
+    """Mots significatifs d'un texte libre (message, nom de recette), au singulier"""
+    mots = []
+    for brut in texte.split():
+        for mot in _mots_mot(brut):
+            if mot not in mots:
+                mots.append(mot)
+    return mots
+
+def occurrences_recherche(recettes, registre, vocabulaire, premier_rang=0):
+    """
+    Fréquences pondérées des couples (mot, recette) des recettes données, triées par mot
+    puis recette; vocabulaire (identifiants des mots et mots de chaque ingrédient) est complété sur place.
+    """
+    ids_mots = vocabulaire['ids_mots']
+    
+    def identifiants(mots):
+        return [ids_mots.setdefault(mot, len(ids_mots)) for mot in mots]
+    
+    ids_ingredients = vocabulaire['ids_ingredients']
+    ids_ingredients += [identifiants(mots_texte(nom)) for nom in registre['noms'][len(ids_ingredients):]]
+    ids_valeurs = {}
+    
+    # Occurrences (mot, recette, poids du champ) à plat, agrégées ensuite par NumPy
+    col_mot, col_rang, col_poids = [], [], []
+    for rang, (nom, recette) in enumerate(recettes.items(), premier_rang):
+        categorie, pays = recette.get('categorie', ''), recette.get('pays', '')
+        for valeur in (categorie, pays):
+            if valeur not in ids_valeurs:
+                ids_valeurs[valeur] = identifiants(mots_texte(valeur))
+        champs = [
+            (identifiants(mots_texte(nom)), POIDS_CHAMPS_RECHERCHE['nom']),
+            (ids_valeurs[categorie], POIDS_CHAMPS_RECHERCHE['categorie']),
+            (ids_valeurs[pays], POIDS_CHAMPS_RECHERCHE['pays'])
+        ]
+        champs += [(ids_ingredients[registre['id_par_cle'][ing]], POIDS_CHAMPS_RECHERCHE['ingredients']) for ing in recette.get('ingredients', {})]
+        for ids, poids in champs:
+            col_mot += ids
+            col_poids += [poids] * len(ids)
+        col_rang += [rang] * (len(col_mot) - len(col_rang))
+    
+    mot = np.array(col_mot, dtype=np.int64)
+    rang = np.array(col_rang, dtype=np.int64)
+    poids = np.array(col_poids, dtype=np.float64)
+    
+    # Fréquence pondérée de chaque couple (mot, recette), triée par mot puis recette
+    base = max(premier_rang + len(recettes), 1)
+    couples, inverse = np.unique(mot * base + rang, return_inverse=True)
+    mots_couples, rangs_couples = np.divmod(couples, base)
+    return {
+        'mots': mots_couples,
+        'rangs': rangs_couples,
+        'tf': np.bincount(inverse, weights=poids, minlength=len(couples)),
+        'longueurs': np.bincount(rang - premier_rang, weights=poids, minlength=len(recettes))
+    }
+
+def assembler_index_recherche(occurrences, vocabulaire, masques, colonnes):
+    """Index BM25 mot -> (rangs des recettes, poids), masques d'allergènes et ordre de repli varié"""
+    nb_recettes = len(colonnes['noms'])
+    mots_couples, rangs_couples, tf = occurrences['mots'], occurrences['rangs'], occurrences['tf']
+    longueurs = occurrences['longueurs']
+    longueur_moyenne = longueurs.mean() if nb_recettes else 1.0
+    
+    # Poids BM25 précalculés: une requête n'est plus qu'une somme de vecteurs creux
+    ids_mots = vocabulaire['ids_mots']
+    df = np.bincount(mots_couples, minlength=len(ids_mots))
+    idf = np.log(1 + (nb_recettes - df + 0.5) / (df + 0.5))
+    normalisation = BM25_K1 * (1 - BM25_B + BM25_B * longueurs[rangs_couples] / longueur_moyenne)
+    scores = idf[mots_couples] * tf * (BM25_K1 + 1) / (tf + normalisation)
+    
+    bornes = np.searchsorted(mots_couples, np.arange(len(ids_mots) + 1))
+    postings = {
+        sys.intern(texte): (rangs_couples[bornes[i]:bornes[i + 1]], scores[bornes[i]:bornes[i + 1]])
+        for texte, i in ids_mots.items()
+    }
     
-    # ========== RECETTES FRANÇAISES (20) ==========
-    
-    "Dinde de Noël": {
-        "pays": "🇫🇷 France",
-        "categorie": "Plat festif",
-        "budget_assiette": 4.50,
-        "duree_min": 180,
-        "difficulte": "Moyen",
-        "saison": "Hiver",
-        "ingredients": {
-            "dinde_kg": 3.0,
-            "marron_kg": 0.5,
-            "beurre_kg": 0.15,
-            "oignon_kg": 0.2,
-            "chair_saucisse_kg": 0.3
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🥄 Préparation de la farce (30 min)",
-                "description": "Faire revenir oignons émincés dans du beurre. Ajouter la chair à saucisse et les marrons émiettés. Assaisonner avec sel, poivre, thym, persil. Laisser refroidir.",
-                "temperature": "Feu moyen",
-                "duree": "30 minutes",
-                "astuce": "La farce doit être froide avant de farcir!"
-            },
-            {
-                "num": 2,
-                "titre": "🦃 Farcir la dinde (15 min)",
-                "description": "Saler et poivrer l'intérieur de la dinde. Remplir avec la farce sans trop tasser. Coudre ou brider l'ouverture.",
-                "temperature": "Température ambiante",
-                "duree": "15 minutes",
-                "astuce": "Ne pas trop tasser la farce!"
-            },
-            {
-                "num": 3,
-                "titre": "🧈 Beurrer et assaisonner (10 min)",
-                "description": "Badigeonner généreusement la dinde de beurre ramolli. Saler et poivrer l'extérieur. Ajouter thym et laurier.",
-                "temperature": "Température ambiante",
-                "duree": "10 minutes",
-                "astuce": "Le beurre donne une belle peau dorée!"
-            },
-            {
-                "num": 4,
-                "titre": "🔥 Cuisson au four (2h30)",
-                "description": "Enfourner à 180°C. Arroser régulièrement (toutes les 30 min) avec le jus de cuisson. Couvrir d'alu si elle dore trop vite.",
-                "temperature": "Four 180°C",
-                "duree": "2h30",
-                "astuce": "Compter 45 min par kg!"
-            },
-            {
-                "num": 5,
-                "titre": "✨ Préparation de la sauce (15 min)",
-                "description": "Récupérer le jus de cuisson. Dégraisser. Faire réduire avec un peu de vin blanc. Filtrer.",
-                "temperature": "Feu vif",
-                "duree": "15 minutes",
-                "astuce": "La sauce doit napper la cuillère!"
-            },
-            {
-                "num": 6,
-                "titre": "🍽️ Découpe et service",
-                "description": "Laisser reposer 15 min avant de découper. Servir avec la farce et la sauce à part.",
-                "temperature": "Chaud",
-                "duree": "15 min repos",
-                "astuce": "Le repos permet au jus de se répartir!"
-            }
-        ],
-        "anecdote": "La dinde farcie aux marrons est LE plat traditionnel du réveillon de Noël en France depuis le 19ème siècle!"
-    },
+    # Repli quand le message ne cite rien: pays en alternance, dans l'ordre du catalogue
+    par_pays = [np.flatnonzero(colonnes['pays'] == code) for code in range(len(colonnes['pays_valeurs']))]
+    ordre_repli = [int(rang) for groupe in zip_longest(*par_pays) for rang in groupe if rang is not None]
     
-    "Bûche de Noël": {
-        "pays": "🇫🇷 France",
-        "categorie": "Dessert",
-        "budget_assiette": 2.80,
-        "duree_min": 90,
-        "difficulte": "Difficile",
-        "saison": "Hiver",
-        "ingredients": {
-            "oeuf_kg": 0.25,
-            "sucre_kg": 0.2,
-            "farine_kg": 0.12,
-            "cacao_kg": 0.05,
-            "creme_kg": 0.5,
-            "chocolat_kg": 0.3
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🥚 Préparation de la génoise (20 min)",
-                "description": "Battre les œufs avec le sucre au fouet électrique jusqu'à ce que le mélange blanchisse et triple de volume. Incorporer délicatement farine et cacao tamisés.",
-                "temperature": "Température ambiante",
-                "duree": "20 minutes",
-                "astuce": "Le mélange doit faire un ruban!"
-            },
-            {
-                "num": 2,
-                "titre": "🔥 Cuisson de la génoise (12 min)",
-                "description": "Étaler sur une plaque recouverte de papier cuisson. Enfourner à 180°C. La génoise doit être cuite mais souple.",
-                "temperature": "Four 180°C",
-                "duree": "12 minutes",
-                "astuce": "Ne pas trop cuire sinon elle cassera au roulage!"
-            },
-            {
-                "num": 3,
-                "titre": "🌀 Roulage (10 min)",
-                "description": "Démouler sur un torchon humide saupoudré de sucre. Rouler la génoise encore chaude avec le torchon. Laisser refroidir roulée.",
-                "temperature": "Tiède",
-                "duree": "10 minutes",
-                "astuce": "Rouler tant que c'est chaud!"
-            },
-            {
-                "num": 4,
-                "titre": "🍫 Ganache montée (25 min)",
-                "description": "Faire fondre le chocolat dans la crème chaude. Laisser refroidir puis mettre au frais 2h. Fouetter jusqu'à obtenir une texture mousseuse.",
-                "temperature": "Froid puis température ambiante",
-                "duree": "25 min + 2h repos",
-                "astuce": "La ganache doit être bien froide pour monter!"
-            },
-            {
-                "num": 5,
-                "titre": "🌰 Montage (15 min)",
-                "description": "Dérouler délicatement la génoise. Tartiner de ganache. Rerouler sans le torchon. Couper une extrémité en biais pour faire une branche.",
-                "temperature": "Température ambiante",
-                "duree": "15 minutes",
-                "astuce": "Serrer bien en roulant!"
-            },
-            {
-                "num": 6,
-                "titre": "✨ Décoration (20 min)",
-                "description": "Masquer toute la bûche de ganache. Strier avec une fourchette pour imiter l'écorce. Décorer avec champignons en meringue, houx en pâte d'amande.",
-                "temperature": "Température ambiante",
-                "duree": "20 minutes",
-                "astuce": "Les stries donnent l'effet bois!"
-            },
-            {
-                "num": 7,
-                "titre": "🍽️ Service",
-                "description": "Mettre au frais au moins 2h avant de servir. Saupoudrer de sucre glace au moment de servir.",
-                "temperature": "Froid",
-                "duree": "Après 2h au frais",
-                "astuce": "Sortir 10 min avant de servir!"
-            }
-        ],
-        "anecdote": "La bûche de Noël rappelle la tradition de la bûche brûlée dans la cheminée pendant les fêtes. C'est le dessert incontournable du réveillon!"
-    },
+    return {
+        'postings': postings,
+        'masques': masques,
+        'ordre_repli': np.array(ordre_repli, dtype=np.int64),
+        # Gardés pour ajouter des recettes sans retokeniser le catalogue
+        'occurrences': occurrences,
+        'vocabulaire': vocabulaire
+    }
+
+def construire_index_recherche(recettes, registre, masques, colonnes):
+    """Index de recherche BM25 de tout le catalogue"""
+    vocabulaire = {'ids_mots': {}, 'ids_ingredients': []}
+    occurrences = occurrences_recherche(recettes, registre, vocabulaire)
+    masques = np.fromiter((masques[nom] for nom in recettes), dtype=np.int64, count=len(recettes))
+    return assembler_index_recherche(occurrences, vocabulaire, masques, colonnes)
+
+def construire_matrice_prix(recettes, prix_enseignes, prix_ingredients, registre):
+    """Compile les prix en matrice enseigne x ingrédient (par kg) et les recettes en vecteurs creux"""
+    enseignes = tuple(prix_enseignes.keys())
+    nb_ingredients = len(registre['canoniques'])
+    
+    # Prix de référence, puis prix propres à chaque enseigne (synonymes et unités résolus)
+    reference = np.zeros(nb_ingredients + 1, dtype=np.float64)
+    for ing, prix in prix_ingredients.items():
+        id_ing = registre['id_par_cle'][ing]
+        if not reference[id_ing]:
+            reference[id_ing] = prix / registre['facteur_par_cle'][ing]
+    
+    # Dernière colonne à 0 pour les ingrédients inconnus
+    matrice = np.tile(reference, (len(enseignes), 1))
+    for e, enseigne in enumerate(enseignes):
+        vus = set()
+        for ing, prix in prix_enseignes[enseigne].items():
+            id_ing = registre['id_par_cle'][ing]
+            if id_ing not in vus:
+                vus.add(id_ing)
+                matrice[e, id_ing] = prix / registre['facteur_par_cle'][ing]
+    
+    # Quantités des recettes au format creux (lignes, identifiants, quantités en kg)
+    lignes, colonnes_ing, quantites = [], [], []
+    for i, recette in enumerate(recettes.values()):
+        for ing, qte in recette.get('ingredients', {}).items():
+            lignes.append(i)
+            colonnes_ing.append(registre['id_par_cle'][ing])
+            quantites.append(qte * registre['facteur_par_cle'][ing])
+    lignes = np.array(lignes, dtype=np.int64)
+    colonnes_ing = np.array(colonnes_ing, dtype=np.int64)
+    quantites = np.array(quantites, dtype=np.float64)
+    
+    # Produit creux: coût de chaque recette dans chaque enseigne
+    couts = np.empty((len(recettes), len(enseignes)), dtype=np.float64)
+    for e in range(len(enseignes)):
+        couts[:, e] = np.bincount(lignes, weights=matrice[e, colonnes_ing] * quantites, minlength=len(recettes))
+    
+    # Ingrédients de recettes sans aucun prix (comptés 0€)
+    sans_prix = sorted({
+        ing for recette in recettes.values() for ing in recette.get('ingredients', {})
+        if not matrice[:, registre['id_par_cle'][ing]].any()
+    })
     
-    "Blanquette de Veau": {
-        "pays": "🇫🇷 France",
-        "categorie": "Plat principal",
-        "budget_assiette": 3.20,
-        "duree_min": 120,
-        "difficulte": "Moyen",
-        "saison": "Hiver",
-        "ingredients": {
-            "veau_kg": 1.0,
-            "carotte_kg": 0.3,
-            "oignon_kg": 0.2,
-            "champignon_kg": 0.25,
-            "creme_kg": 0.2,
-            "jaune_oeuf_kg": 0.06,
-            "beurre_kg": 0.05,
-            "farine_kg": 0.04
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🥘 Cuisson de la viande (90 min)",
-                "description": "Mettre le veau en morceaux dans l'eau froide. Porter à ébullition et écumer. Ajouter carottes, oignons piqués de clous de girofle, bouquet garni. Saler. Mijoter à couvert.",
-                "temperature": "Feu doux",
-                "duree": "90 minutes",
-                "astuce": "L'eau froide permet de bien départ partir les impuretés!"
-            },
-            {
-                "num": 2,
-                "titre": "🍄 Cuisson des champignons (10 min)",
-                "description": "Nettoyer et émincer les champignons. Les faire revenir dans du beurre avec un filet de citron.",
-                "temperature": "Feu vif",
-                "duree": "10 minutes",
-                "astuce": "Le citron garde les champignons blancs!"
-            },
-            {
-                "num": 3,
-                "titre": "🧈 Préparation du roux (10 min)",
-                "description": "Faire fondre le beurre. Ajouter la farine et mélanger au fouet 2 min sans colorer. Ajouter progressivement 50cl de bouillon de cuisson en fouettant.",
-                "temperature": "Feu moyen",
-                "duree": "10 minutes",
-                "astuce": "Le roux ne doit pas colorer pour la blanquette!"
-            },
-            {
-                "num": 4,
-                "titre": "✨ Liaison finale (10 min)",
-                "description": "Battre la crème avec les jaunes d'œufs. Ajouter une louche de sauce chaude en fouettant. Verser dans la sauce en remuant. Ne plus faire bouillir!",
-                "temperature": "Feu très doux",
-                "duree": "10 minutes",
-                "astuce": "Ne JAMAIS faire bouillir après les œufs!"
-            },
-            {
-                "num": 5,
-                "titre": "🥕 Assemblage",
-                "description": "Égoutter la viande et les légumes. Les disposer dans un plat. Ajouter les champignons. Napper de sauce. Vérifier l'assaisonnement.",
-                "temperature": "Chaud",
-                "duree": "5 minutes",
-                "astuce": "La sauce doit être onctueuse!"
-            },
-            {
-                "num": 6,
-                "titre": "🍽️ Service",
-                "description": "Servir bien chaud avec du riz basmati ou des pommes vapeur. Parsemer de persil frais ciselé.",
-                "temperature": "Très chaud",
-                "duree": "Immédiat",
-                "astuce": "Un classique de la cuisine bourgeoise française!"
-            }
-        ],
-        "anecdote": "La blanquette de veau est un grand classique de la cuisine française. Le secret: une sauce blanche veloutée sans coloration!"
-    },
+    return {
+        'noms': tuple(recettes.keys()),
+        'enseignes': enseignes,
+        'colonne_inconnue': nb_ingredients,
+        'matrice': matrice,
+        'couts_recettes': couts,
+        'sans_prix': tuple(sans_prix)
+    }
+
+def construire_index_catalogue(recettes, prix_enseignes, prix_ingredients):
+    """Construit tous les index d'une version du catalogue"""
+    registre = construire_registre_ingredients(
+        [ing for recette in recettes.values() for ing in recette.get('ingredients', {})],
+        prix_ingredients,
+        [ing for prix in prix_enseignes.values() for ing in prix]
+    )
+    index = {
+        'registre': registre,
+        'ingredients': construire_index_ingredients(recettes, registre),
+        'allergenes': construire_masques_allergenes(recettes),
+        'colonnes': construire_colonnes_recettes(recettes),
+        'prix': construire_matrice_prix(recettes, prix_enseignes, prix_ingredients, registre)
+    }
+    index['recherche'] = construire_index_recherche(recettes, registre, index['allergenes'], index['colonnes'])
     
-    "Ratatouille": {
-        "pays": "🇫🇷 France",
-        "categorie": "Plat légumes",
-        "budget_assiette": 1.80,
-        "duree_min": 60,
-        "difficulte": "Facile",
-        "saison": "Été",
-        "ingredients": {
-            "aubergine_kg": 0.4,
-            "courgette_kg": 0.4,
-            "poivron_kg": 0.4,
-            "tomate_kg": 0.6,
-            "oignon_kg": 0.2,
-            "ail_kg": 0.05,
-            "huile_olive_kg": 0.1
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🔪 Préparation des légumes (15 min)",
-                "description": "Laver et couper tous les légumes en dés réguliers d'environ 2cm. Garder chaque légume séparé.",
-                "temperature": "Température ambiante",
-                "duree": "15 minutes",
-                "astuce": "Des dés réguliers = cuisson homogène!"
-            },
-            {
-                "num": 2,
-                "titre": "🍆 Cuisson des aubergines (10 min)",
-                "description": "Faire revenir les aubergines dans l'huile d'olive jusqu'à ce qu'elles soient tendres et légèrement dorées. Réserver.",
-                "temperature": "Feu vif",
-                "duree": "10 minutes",
-                "astuce": "Les aubergines absorbent beaucoup d'huile!"
-            },
-            {
-                "num": 3,
-                "titre": "🥒 Cuisson des courgettes (8 min)",
-                "description": "Dans la même poêle, faire revenir les courgettes jusqu'à ce qu'elles soient tendres. Réserver.",
-                "temperature": "Feu vif",
-                "duree": "8 minutes",
-                "astuce": "Ne pas trop cuire, elles doivent rester fermes!"
-            },
-            {
-                "num": 4,
-                "titre": "🫑 Cuisson des poivrons (10 min)",
-                "description": "Faire revenir les poivrons jusqu'à ce qu'ils soient tendres. Réserver.",
-                "temperature": "Feu moyen",
-                "duree": "10 minutes",
-                "astuce": "Ils doivent être fondants!"
-            },
-            {
-                "num": 5,
-                "titre": "🍅 Sauce tomate (15 min)",
-                "description": "Faire revenir oignons et ail. Ajouter les tomates concassées, thym, laurier, sel, poivre. Laisser mijoter jusqu'à épaississement.",
-                "temperature": "Feu moyen",
-                "duree": "15 minutes",
-                "astuce": "La sauce doit être bien réduite!"
-            },
-            {
-                "num": 6,
-                "titre": "🥘 Mijotage final (10 min)",
-                "description": "Remettre tous les légumes dans la sauce tomate. Mélanger délicatement. Laisser mijoter ensemble quelques minutes.",
-                "temperature": "Feu doux",
-                "duree": "10 minutes",
-                "astuce": "Les saveurs se mélangent!"
-            },
-            {
-                "num": 7,
-                "titre": "🍽️ Service",
-                "description": "Servir chaud ou tiède avec du riz, des pâtes ou du pain. Parsemer de basilic frais.",
-                "temperature": "Chaud/Tiède",
-                "duree": "Immédiat",
-                "astuce": "Meilleure le lendemain!"
-            }
-        ],
-        "anecdote": "La ratatouille est LE plat provençal par excellence! Chaque légume est cuit séparément pour garder sa texture et son goût."
-    },
-    
-    "Gratin Dauphinois": {
-        "pays": "🇫🇷 France",
-        "categorie": "Accompagnement",
-        "budget_assiette": 1.20,
-        "duree_min": 90,
-        "difficulte": "Facile",
-        "saison": "Toute",
-        "ingredients": {
-            "pomme_terre_kg": 1.5,
-            "creme_kg": 0.5,
-            "lait_kg": 0.3,
-            "ail_kg": 0.03,
-            "beurre_kg": 0.03,
-            "muscade_kg": 0.002
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🔪 Préparation des pommes de terre (15 min)",
-                "description": "Éplucher les pommes de terre. Les laver et les sécher. Les couper en rondelles fines (2-3mm) à la mandoline ou au couteau. NE PAS les rincer après découpe!",
-                "temperature": "Température ambiante",
-                "duree": "15 minutes",
-                "astuce": "L'amidon des pommes de terre lie le gratin!"
-            },
-            {
-                "num": 2,
-                "titre": "🧄 Préparation du plat (5 min)",
-                "description": "Frotter énergiquement le plat à gratin avec une gousse d'ail coupée. Beurrer généreusement le fond et les parois.",
-                "temperature": "Température ambiante",
-                "duree": "5 minutes",
-                "astuce": "L'ail parfume subtilement!"
-            },
-            {
-                "num": 3,
-                "titre": "📋 Montage (10 min)",
-                "description": "Disposer les pommes de terre en couches régulières. Saler, poivrer et râper un peu de muscade entre chaque couche.",
-                "temperature": "Température ambiante",
-                "duree": "10 minutes",
-                "astuce": "Bien chevaucher les rondelles!"
-            },
-            {
-                "num": 4,
-                "titre": "🥛 Préparation de l'appareil (5 min)",
-                "description": "Mélanger la crème et le lait. Saler, poivrer, ajouter muscade. Verser sur les pommes de terre jusqu'à les recouvrir aux 3/4.",
-                "temperature": "Température ambiante",
-                "duree": "5 minutes",
-                "astuce": "Ne pas totalement recouvrir!"
-            },
-            {
-                "num": 5,
-                "titre": "🔥 Première cuisson (45 min)",
-                "description": "Enfourner à 160°C. Cuire jusqu'à ce que les pommes de terre soient tendres (vérifier avec un couteau).",
-                "temperature": "Four 160°C",
-                "duree": "45 minutes",
-                "astuce": "Cuisson douce pour éviter que la crème tranche!"
-            },
-            {
-                "num": 6,
-                "titre": "🔥 Gratinage (10 min)",
-                "description": "Monter le four à 200°C pour faire dorer le dessus. Le gratin doit être bien doré et croustillant.",
-                "temperature": "Four 200°C",
-                "duree": "10 minutes",
-                "astuce": "Surveiller pour ne pas brûler!"
-            },
-            {
-                "num": 7,
-                "titre": "🍽️ Service",
-                "description": "Laisser reposer 10 min avant de servir. Le gratin sera plus facile à découper.",
-                "temperature": "Chaud",
-                "duree": "Après 10 min repos",
-                "astuce": "Parfait avec une viande rôtie!"
-            }
-        ],
-        "anecdote": "Le VRAI gratin dauphinois ne contient PAS de fromage! C'est l'amidon des pommes de terre qui lie la crème."
-    },
-    
-    "Quiche Lorraine": {
-        "pays": "🇫🇷 France",
-        "categorie": "Tarte salée",
-        "budget_assiette": 1.60,
-        "duree_min": 60,
-        "difficulte": "Facile",
-        "saison": "Toute",
-        "ingredients": {
-            "pate_brisee_kg": 0.25,
-            "lardons_kg": 0.2,
-            "creme_kg": 0.3,
-            "oeuf_kg": 0.15,
-            "lait_kg": 0.1,
-            "muscade_kg": 0.002
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "📋 Préparation de la pâte (10 min)",
-                "description": "Étaler la pâte brisée. Foncer un moule à tarte beurré. Piquer le fond avec une fourchette. Mettre au frais 15 min.",
-                "temperature": "Froid 4°C",
-                "duree": "10 min + 15 min repos",
-                "astuce": "Piquer évite que la pâte gonfle!"
-            },
-            {
-                "num": 2,
-                "titre": "🥓 Cuisson des lardons (8 min)",
-                "description": "Faire revenir les lardons à sec dans une poêle jusqu'à ce qu'ils soient dorés. Pas besoin d'ajouter de matière grasse. Égoutter sur papier absorbant.",
-                "temperature": "Feu vif",
-                "duree": "8 minutes",
-                "astuce": "Bien les faire dorer!"
-            },
-            {
-                "num": 3,
-                "titre": "🥚 Préparation de l'appareil (5 min)",
-                "description": "Battre les œufs en omelette. Ajouter la crème et le lait. Saler légèrement (les lardons sont déjà salés), poivrer, muscader. Bien mélanger.",
-                "temperature": "Température ambiante",
-                "duree": "5 minutes",
-                "astuce": "Attention au sel!"
-            },
-            {
-                "num": 4,
-                "titre": "📋 Montage (5 min)",
-                "description": "Répartir les lardons sur le fond de tarte. Verser l'appareil à quiche dessus délicatement.",
-                "temperature": "Température ambiante",
-                "duree": "5 minutes",
-                "astuce": "Remplir jusqu'à 1cm du bord!"
-            },
-            {
-                "num": 5,
-                "titre": "🔥 Cuisson (30 min)",
-                "description": "Enfourner à 180°C. Cuire jusqu'à ce que l'appareil soit pris et le dessus légèrement doré. La quiche doit juste trembler au centre.",
-                "temperature": "Four 180°C",
-                "duree": "30 minutes",
-                "astuce": "Ne pas trop cuire sinon elle devient sèche!"
-            },
-            {
-                "num": 6,
-                "titre": "🍽️ Service",
-                "description": "Laisser tiédir 10 min avant de démouler et servir. Délicieuse chaude ou tiède avec une salade verte.",
-                "temperature": "Tiède",
-                "duree": "Après 10 min repos",
-                "astuce": "La vraie quiche lorraine n'a pas de fromage!"
-            }
-        ],
-        "anecdote": "La quiche lorraine authentique ne contient PAS de fromage ni d'oignon! Juste lardons, œufs et crème."
-    },
-    
-    "Pot-au-Feu": {
-        "pays": "🇫🇷 France",
-        "categorie": "Plat mijoté",
-        "budget_assiette": 2.80,
-        "duree_min": 180,
-        "difficulte": "Facile",
-        "saison": "Hiver",
-        "ingredients": {
-            "boeuf_kg": 1.2,
-            "os_moelle_kg": 0.4,
-            "carotte_kg": 0.6,
-            "navet_kg": 0.4,
-            "poireau_kg": 0.4,
-            "oignon_kg": 0.2,
-            "celeri_kg": 0.2
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🥘 Démarrage à l'eau froide (15 min)",
-                "description": "Mettre la viande dans une grande marmite d'eau froide. Porter doucement à ébullition. Écumer soigneusement toutes les impuretés qui remontent.",
-                "temperature": "Feu moyen puis doux",
-                "duree": "15 minutes",
-                "astuce": "L'eau froide permet de bien écumer!"
-            },
-            {
-                "num": 2,
-                "titre": "🧅 Ajout aromates (5 min)",
-                "description": "Ajouter l'oignon piqué de clous de girofle, le bouquet garni, sel, poivre en grains. Couvrir partiellement.",
-                "temperature": "Feu doux",
-                "duree": "5 minutes",
-                "astuce": "Le clou de girofle parfume subtilement!"
-            },
-            {
-                "num": 3,
-                "titre": "💧 Cuisson de la viande (2h)",
-                "description": "Laisser mijoter très doucement. L'eau doit à peine frémir. Écumer régulièrement. La viande doit être fondante.",
-                "temperature": "Feu très doux (frémissement)",
-                "duree": "2 heures",
-                "astuce": "Plus c'est doux, plus c'est tendre!"
-            },
-            {
-                "num": 4,
-                "titre": "🥕 Ajout des légumes (45 min)",
-                "description": "Ajouter carottes, navets, poireaux ficelés, céleri. Continuer la cuisson jusqu'à ce que les légumes soient tendres.",
-                "temperature": "Feu doux",
-                "duree": "45 minutes",
-                "astuce": "Ficeler les poireaux pour qu'ils ne se défassent pas!"
-            },
-            {
-                "num": 5,
-                "titre": "🦴 Cuisson des os à moelle (15 min)",
-                "description": "30 minutes avant la fin, ajouter les os à moelle ficelés dans un linge. Ils doivent juste chauffer sans que la moelle fonde.",
-                "temperature": "Feu doux",
-                "duree": "15 minutes",
-                "astuce": "La moelle est le trésor du pot-au-feu!"
-            },
-            {
-                "num": 6,
-                "titre": "🍽️ Service traditionnel",
-                "description": "Servir en 2 temps: d'abord le bouillon avec vermicelles, puis la viande et légumes avec cornichons, moutarde et gros sel. Tartiner la moelle sur du pain grillé.",
-                "temperature": "Très chaud",
-                "duree": "Immédiat",
-                "astuce": "C'est LE plat familial dominical français!"
-            }
-        ],
-        "anecdote": "Le pot-au-feu est considéré comme le plat national français. Henri IV voulait que chaque famille puisse en manger le dimanche!"
-    },
-    
-    "Hachis Parmentier": {
-        "pays": "🇫🇷 France",
-        "categorie": "Plat principal",
-        "budget_assiette": 1.40,
-        "duree_min": 60,
-        "difficulte": "Facile",
-        "saison": "Toute",
-        "ingredients": {
-            "viande_hachee_kg": 0.6,
-            "pomme_terre_kg": 1.0,
-            "oignon_kg": 0.15,
-            "beurre_kg": 0.08,
-            "lait_kg": 0.15,
-            "fromage_rape_kg": 0.08
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🥔 Cuisson pommes de terre (25 min)",
-                "description": "Éplucher et couper les pommes de terre. Les cuire dans l'eau salée jusqu'à ce qu'elles soient tendres.",
-                "temperature": "Eau bouillante",
-                "duree": "25 minutes",
-                "astuce": "Bien tendres pour une purée lisse!"
-            },
-            {
-                "num": 2,
-                "titre": "🥄 Purée (10 min)",
-                "description": "Égoutter les pommes de terre. Les écraser au presse-purée. Ajouter beurre et lait chaud. Saler, poivrer, muscader. Battre énergiquement.",
-                "temperature": "Chaud",
-                "duree": "10 minutes",
-                "astuce": "Ne jamais mixer, ça rend la purée collante!"
-            },
-            {
-                "num": 3,
-                "titre": "🍖 Cuisson de la viande (15 min)",
-                "description": "Faire revenir l'oignon émincé. Ajouter la viande hachée. Faire cuire en émiettant bien. Saler, poivrer. Ajouter concentré de tomate et herbes.",
-                "temperature": "Feu vif",
-                "duree": "15 minutes",
-                "astuce": "La viande doit être bien cuite et sèche!"
-            },
-            {
-                "num": 4,
-                "titre": "📋 Montage (5 min)",
-                "description": "Dans un plat à gratin beurré, étaler la viande. Recouvrir de purée en lissant bien. Parsemer de fromage râpé. Faire des stries avec une fourchette.",
-                "temperature": "Température ambiante",
-                "duree": "5 minutes",
-                "astuce": "Les stries donnent un beau gratiné!"
-            },
-            {
-                "num": 5,
-                "titre": "🔥 Gratinage (25 min)",
-                "description": "Enfourner à 200°C jusqu'à ce que le dessus soit bien doré et croustillant.",
-                "temperature": "Four 200°C",
-                "duree": "25 minutes",
-                "astuce": "Le gratiné doit être doré!"
-            },
-            {
-                "num": 6,
-                "titre": "🍽️ Service",
-                "description": "Laisser reposer 5 min. Servir bien chaud avec une salade verte.",
-                "temperature": "Très chaud",
-                "duree": "Après 5 min repos",
-                "astuce": "Parfait pour recycler un reste de pot-au-feu!"
-            }
-        ],
-        "anecdote": "Le hachis Parmentier est nommé d'après Antoine Parmentier qui a popularisé la pomme de terre en France au 18ème siècle!"
-    },
-    
-    "Poulet Rôti": {
-        "pays": "🇫🇷 France",
-        "categorie": "Plat principal",
-        "budget_assiette": 2.20,
-        "duree_min": 75,
-        "difficulte": "Facile",
-        "saison": "Toute",
-        "ingredients": {
-            "poulet_kg": 1.5,
-            "beurre_kg": 0.08,
-            "citron_kg": 0.1,
-            "thym_kg": 0.01,
-            "ail_kg": 0.05
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🧄 Préparation du poulet (10 min)",
-                "description": "Retirer le poulet du frigo 30 min avant. Glisser beurre, ail et thym sous la peau. Mettre citron coupé et herbes dans la cavité. Brider les cuisses.",
-                "temperature": "Température ambiante",
-                "duree": "10 minutes",
-                "astuce": "Le beurre sous la peau = peau ultra croustillante!"
-            },
-            {
-                "num": 2,
-                "titre": "🧈 Assaisonnement extérieur (5 min)",
-                "description": "Badigeonner le poulet de beurre fondu. Saler généreusement la peau. Poivrer. Parsemer de thym.",
-                "temperature": "Température ambiante",
-                "duree": "5 minutes",
-                "astuce": "Bien saler la peau pour qu'elle soit croustillante!"
-            },
-            {
-                "num": 3,
-                "titre": "🔥 Cuisson four chaud (60 min)",
-                "description": "Enfourner à 220°C pendant 15 min puis baisser à 180°C. Arroser toutes les 15 min avec le jus de cuisson. Total: 20 min par 500g + 20 min.",
-                "temperature": "Four 220°C puis 180°C",
-                "duree": "60 minutes",
-                "astuce": "Arroser régulièrement = viande juteuse!"
-            },
-            {
-                "num": 4,
-                "titre": "✅ Vérification cuisson",
-                "description": "Piquer entre cuisse et blanc: le jus doit être clair, pas rosé. La température à cœur doit être 75°C.",
-                "temperature": "Chaud",
-                "duree": "2 minutes",
-                "astuce": "Jus clair = poulet cuit!"
-            },
-            {
-                "num": 5,
-                "titre": "💤 Repos (15 min)",
-                "description": "Sortir le poulet du four. Le couvrir de papier alu. Laisser reposer 15 min. Le jus va se répartir dans la viande.",
-                "temperature": "Chaud",
-                "duree": "15 minutes",
-                "astuce": "Le repos est ESSENTIEL!"
-            },
-            {
-                "num": 6,
-                "titre": "🍽️ Découpe et service",
-                "description": "Découper: séparer cuisses, ailes, puis trancher les blancs en biais. Servir avec le jus de cuisson dégraissé.",
-                "temperature": "Chaud",
-                "duree": "5 minutes",
-                "astuce": "Le poulet rôti dominical français!"
-            }
-        ],
-        "anecdote": "Le poulet rôti du dimanche est une institution en France! Servi traditionnellement avec des frites ou des haricots verts."
-    },
-    
-    "Bœuf Bourguignon": {
-        "pays": "🇫🇷 France",
-        "categorie": "Plat mijoté",
-        "budget_assiette": 3.40,
-        "duree_min": 180,
-        "difficulte": "Moyen",
-        "saison": "Hiver",
-        "ingredients": {
-            "boeuf_kg": 1.2,
-            "lardons_kg": 0.2,
-            "carotte_kg": 0.3,
-            "oignon_kg": 0.3,
-            "champignon_kg": 0.3,
-            "vin_rouge_kg": 0.75,
-            "farine_kg": 0.04,
-            "beurre_kg": 0.05
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🥓 Cuisson des lardons (10 min)",
-                "description": "Faire revenir les lardons dans une cocotte jusqu'à ce qu'ils soient bien dorés. Les retirer et réserver.",
-                "temperature": "Feu vif",
-                "duree": "10 minutes",
-                "astuce": "Bien les faire dorer!"
-            },
-            {
-                "num": 2,
-                "titre": "🥩 Saisie de la viande (15 min)",
-                "description": "Couper le bœuf en gros cubes. Les saisir dans la graisse des lardons par petites quantités jusqu'à belle coloration. Réserver.",
-                "temperature": "Feu très vif",
-                "duree": "15 minutes",
-                "astuce": "Ne pas surcharger la cocotte!"
-            },
-            {
-                "num": 3,
-                "titre": "🧅 Cuisson des légumes (10 min)",
-                "description": "Faire revenir oignons et carottes coupés en gros morceaux dans la cocotte. Saupoudrer de farine et remuer 2 min.",
-                "temperature": "Feu moyen",
-                "duree": "10 minutes",
-                "astuce": "La farine va lier la sauce!"
-            },
-            {
-                "num": 4,
-                "titre": "🍷 Mouillage au vin (5 min)",
-                "description": "Remettre viande et lardons. Verser le vin rouge (de Bourgogne idéalement). Ajouter bouquet garni, ail. Porter à ébullition.",
-                "temperature": "Feu vif",
-                "duree": "5 minutes",
-                "astuce": "Le vin doit recouvrir la viande!"
-            },
-            {
-                "num": 5,
-                "titre": "💧 Mijotage (2h30)",
-                "description": "Couvrir et enfourner à 150°C ou laisser mijoter à feu très doux. La viande doit être fondante.",
-                "temperature": "Four 150°C ou feu très doux",
-                "duree": "2h30",
-                "astuce": "Plus c'est long, plus c'est bon!"
-            },
-            {
-                "num": 6,
-                "titre": "🍄 Cuisson des champignons (10 min)",
-                "description": "45 min avant la fin, faire revenir les champignons dans du beurre et les ajouter au plat.",
-                "temperature": "Feu vif",
-                "duree": "10 minutes",
-                "astuce": "Les champignons à la fin pour garder leur texture!"
-            },
-            {
-                "num": 7,
-                "titre": "🍽️ Service",
-                "description": "Servir bien chaud avec des pommes vapeur, des pâtes fraîches ou du pain. Meilleur réchauffé le lendemain!",
-                "temperature": "Très chaud",
-                "duree": "Immédiat",
-                "astuce": "Grand classique de la cuisine bourguignonne!"
-            }
-        ],
-        "anecdote": "Le bœuf bourguignon est un des plats les plus emblématiques de la cuisine française. Julia Child l'a rendu célèbre aux USA!"
-    },
-    
-    "Croque-Monsieur": {
-        "pays": "🇫🇷 France",
-        "categorie": "Sandwich chaud",
-        "budget_assiette": 1.30,
-        "duree_min": 20,
-        "difficulte": "Facile",
-        "saison": "Toute",
-        "ingredients": {
-            "pain_mie_kg": 0.2,
-            "jambon_kg": 0.15,
-            "gruyere_kg": 0.15,
-            "beurre_kg": 0.04,
-            "lait_kg": 0.1,
-            "farine_kg": 0.02
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🧈 Béchamel express (8 min)",
-                "description": "Faire fondre le beurre. Ajouter la farine, mélanger 2 min. Ajouter le lait progressivement en fouettant. Cuire jusqu'à épaississement. Saler, poivrer, muscader.",
-                "temperature": "Feu moyen",
-                "duree": "8 minutes",
-                "astuce": "La béchamel doit napper la cuillère!"
-            },
-            {
-                "num": 2,
-                "titre": "🥪 Montage des sandwiches (5 min)",
-                "description": "Beurrer légèrement les tranches de pain. Sur une tranche: béchamel, jambon, gruyère râpé. Recouvrir de la 2ème tranche.",
-                "temperature": "Température ambiante",
-                "duree": "5 minutes",
-                "astuce": "Le beurre empêche le pain de ramollir!"
-            },
-            {
-                "num": 3,
-                "titre": "✨ Nappage (2 min)",
-                "description": "Tartiner le dessus de béchamel. Parsemer généreusement de gruyère râpé.",
-                "temperature": "Température ambiante",
-                "duree": "2 minutes",
-                "astuce": "Beaucoup de fromage = beau gratiné!"
-            },
-            {
-                "num": 4,
-                "titre": "🔥 Gratinage (7 min)",
-                "description": "Enfourner à 220°C position grill jusqu'à ce que le dessus soit bien doré et gratinéet que le fromage bouillonne.",
-                "temperature": "Four 220°C grill",
-                "duree": "7 minutes",
-                "astuce": "Surveiller pour ne pas brûler!"
-            },
-            {
-                "num": 5,
-                "titre": "🍽️ Service",
-                "description": "Servir immédiatement bien chaud avec une salade verte. Avec un œuf au plat dessus, c'est un Croque-Madame!",
-                "temperature": "Très chaud",
-                "duree": "Immédiat",
-                "astuce": "L'incontournable des bistrots parisiens!"
-            }
-        ],
-        "anecdote": "Le croque-monsieur est né dans un café parisien en 1910. Son nom viendrait du croustillant du pain grillé!"
-    },
-    
-    "Omelette": {
-        "pays": "🇫🇷 France",
-        "categorie": "Plat rapide",
-        "budget_assiette": 0.80,
-        "duree_min": 10,
-        "difficulte": "Moyen",
-        "saison": "Toute",
-        "ingredients": {
-            "oeuf_kg": 0.18,
-            "beurre_kg": 0.02,
-            "creme_kg": 0.02,
-            "fines_herbes_kg": 0.01
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🥚 Préparation des œufs (2 min)",
-                "description": "Casser 3 œufs par personne dans un bol. Battre légèrement à la fourchette avec une cuillère de crème. Saler, poivrer.",
-                "temperature": "Température ambiante",
-                "duree": "2 minutes",
-                "astuce": "Ne pas trop battre!"
-            },
-            {
-                "num": 2,
-                "titre": "🧈 Cuisson au beurre (5 min)",
-                "description": "Faire chauffer le beurre dans une poêle antiadhésive. Quand il mousse, verser les œufs. Remuer vivement avec une spatule.",
-                "temperature": "Feu vif",
-                "duree": "5 minutes",
-                "astuce": "Le beurre ne doit pas brunir!"
-            },
-            {
-                "num": 3,
-                "titre": "🌀 Technique du roulage (2 min)",
-                "description": "Quand les œufs sont encore baveux dessus, arrêter de remuer. Laisser prendre 30 secondes. Plier l'omelette en trois avec la spatule.",
-                "temperature": "Feu vif",
-                "duree": "2 minutes",
-                "astuce": "L'intérieur doit rester baveux!"
-            },
-            {
-                "num": 4,
-                "titre": "✨ Finition (1 min)",
-                "description": "Parsemer de fines herbes ciselées (persil, ciboulette, cerfeuil, estragon). Glisser sur l'assiette.",
-                "temperature": "Chaud",
-                "duree": "1 minute",
-                "astuce": "Les herbes au dernier moment!"
-            },
-            {
-                "num": 5,
-                "titre": "🍽️ Service",
-                "description": "Servir immédiatement. L'omelette ne supporte pas l'attente! Avec une salade, c'est parfait.",
-                "temperature": "Très chaud",
-                "duree": "Immédiat",
-                "astuce": "L'omelette française est baveuse!"
-            }
-        ],
-        "anecdote": "La vraie omelette française doit être baveuse à l'intérieur! C'est l'art du timing qui fait la différence."
-    },
-    
-    "Salade Niçoise": {
-        "pays": "🇫🇷 France",
-        "categorie": "Salade",
-        "budget_assiette": 2.40,
-        "duree_min": 30,
-        "difficulte": "Facile",
-        "saison": "Été",
-        "ingredients": {
-            "tomate_kg": 0.5,
-            "oeuf_dur_kg": 0.12,
-            "thon_kg": 0.15,
-            "olive_kg": 0.08,
-            "anchois_kg": 0.05,
-            "poivron_kg": 0.15,
-            "oignon_kg": 0.08,
-            "huile_olive_kg": 0.06
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🥚 Cuisson des œufs (12 min)",
-                "description": "Faire bouillir les œufs 10 min pour qu'ils soient durs. Les rafraîchir à l'eau froide. Écaler et couper en quartiers.",
-                "temperature": "Eau bouillante",
-                "duree": "12 minutes",
-                "astuce": "10 min = jaune parfait!"
-            },
-            {
-                "num": 2,
-                "titre": "🔪 Préparation des légumes (10 min)",
-                "description": "Laver et couper les tomates en quartiers. Couper le poivron en lanières. Émincer finement l'oignon. Tout doit être cru!",
-                "temperature": "Température ambiante",
-                "duree": "10 minutes",
-                "astuce": "La salade niçoise est 100% crue!"
-            },
-            {
-                "num": 3,
-                "titre": "🥗 Assaisonnement (5 min)",
-                "description": "Dans un bol, mélanger huile d'olive, vinaigre, sel, poivre, ail écrasé pour faire la vinaigrette.",
-                "temperature": "Température ambiante",
-                "duree": "5 minutes",
-                "astuce": "3 parts d'huile pour 1 part de vinaigre!"
-            },
-            {
-                "num": 4,
-                "titre": "🍽️ Montage (5 min)",
-                "description": "Disposer joliment les tomates, œufs, thon émietté, olives noires, anchois, poivrons, oignon. Arroser de vinaigrette. Parsemer de basilic frais.",
-                "temperature": "Frais",
-                "duree": "5 minutes",
-                "astuce": "Chaque ingrédient visible!"
-            },
-            {
-                "num": 5,
-                "titre": "🍽️ Service",
-                "description": "Servir frais mais pas glacé. Accompagner de pain de campagne.",
-                "temperature": "Frais",
-                "duree": "Immédiat",
-                "astuce": "L'authentique n'a PAS de pommes de terre ni haricots verts!"
-            }
-        ],
-        "anecdote": "La vraie salade niçoise de Nice ne contient JAMAIS de pommes de terre ni de haricots verts! Seulement des légumes crus."
-    },
+    if index['prix']['sans_prix']:
+        logger.warning("Ingrédients sans prix (comptés 0€): %s", ', '.join(index['prix']['sans_prix']))
     
-    "Coq au Vin": {
-        "pays": "🇫🇷 France",
-        "categorie": "Plat mijoté",
-        "budget_assiette": 3.60,
-        "duree_min": 150,
-        "difficulte": "Moyen",
-        "saison": "Hiver",
-        "ingredients": {
-            "poulet_kg": 1.5,
-            "vin_rouge_kg": 0.75,
-            "lardons_kg": 0.2,
-            "oignon_grelot_kg": 0.25,
-            "champignon_kg": 0.3,
-            "ail_kg": 0.05,
-            "beurre_kg": 0.05,
-            "farine_kg": 0.03
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🍷 Marinade (24h recommandé)",
-                "description": "Faire mariner les morceaux de poulet dans le vin rouge avec carottes, oignon, ail, bouquet garni. Couvrir et mettre au frais 12-24h.",
-                "temperature": "Froid 4°C",
-                "duree": "12-24 heures",
-                "astuce": "La marinade attendrit et parfume!"
-            },
-            {
-                "num": 2,
-                "titre": "🥓 Cuisson des lardons (10 min)",
-                "description": "Égoutter le poulet (garder la marinade). Faire revenir les lardons jusqu'à ce qu'ils soient dorés. Réserver.",
-                "temperature": "Feu vif",
-                "duree": "10 minutes",
-                "astuce": "Bien les faire dorer!"
-            },
-            {
-                "num": 3,
-                "titre": "🍗 Cuisson du poulet (20 min)",
-                "description": "Sécher le poulet. Le faire dorer de tous côtés dans la graisse des lardons. Saupoudrer de farine, remuer 2 min.",
-                "temperature": "Feu vif",
-                "duree": "20 minutes",
-                "astuce": "Bien colorer pour le goût!"
-            },
-            {
-                "num": 4,
-                "titre": "🍷 Flambage et mijotage (90 min)",
-                "description": "Flamber au cognac. Ajouter la marinade filtrée, lardons, ail. Porter à ébullition puis couvrir et laisser mijoter à feu très doux.",
-                "temperature": "Feu très doux",
-                "duree": "90 minutes",
-                "astuce": "Mijotage doux = viande fondante!"
-            },
-            {
-                "num": 5,
-                "titre": "🍄 Garniture (20 min)",
-                "description": "Faire glacer les oignons grelots au beurre avec sucre. Faire sauter les champignons. Ajouter au plat 15 min avant la fin.",
-                "temperature": "Feu moyen",
-                "duree": "20 minutes",
-                "astuce": "Les oignons grelots entiers c'est traditionnel!"
-            },
-            {
-                "num": 6,
-                "titre": "✨ Liaison finale (10 min)",
-                "description": "Sortir le poulet. Faire réduire la sauce si besoin. Vérifier l'assaisonnement. Remettre le poulet.",
-                "temperature": "Feu vif",
-                "duree": "10 minutes",
-                "astuce": "La sauce doit napper!"
-            },
-            {
-                "num": 7,
-                "titre": "🍽️ Service",
-                "description": "Servir bien chaud dans la cocotte avec des pommes vapeur, pâtes fraîches ou riz. Parsemer de persil.",
-                "temperature": "Très chaud",
-                "duree": "Immédiat",
-                "astuce": "Grand classique bourguignon!"
-            }
-        ],
-        "anecdote": "Le coq au vin est un plat paysan qui utilisait les vieux coqs devenus trop durs. Le vin et le mijotage les attendrissaient!"
-    },
+    return index
+
+def etendre_index_ingredients(index_ingredients, nouvelles, registre):
+    """Index inversé des ingrédients complété par de nouvelles recettes (placées après les existantes)"""
+    ajout = construire_index_ingredients(nouvelles, registre)
+    par_token = dict(index_ingredients['par_token'])
+    for token, ids in ajout['par_token'].items():
+        par_token[token] = par_token.get(token, frozenset()) | ids
+    decalage = len(index_ingredients['rang'])
+    par_ingredient = dict(index_ingredients['par_ingredient'])
+    for id_ing, rangs in ajout['par_ingredient'].items():
+        existants = par_ingredient.get(id_ing, np.empty(0, dtype=np.int32))
+        par_ingredient[id_ing] = np.concatenate([existants, rangs + decalage])
+    return {
+        'par_token': par_token,
+        'par_ingredient': par_ingredient,
+        'nb_ingredients': np.concatenate([index_ingredients['nb_ingredients'], ajout['nb_ingredients']]),
+        'rang': {**index_ingredients['rang'], **{nom: rang + decalage for nom, rang in ajout['rang'].items()}}
+    }
+
+def etendre_colonnes_recettes(colonnes, nouvelles):
+    """Colonnes NumPy complétées par de nouvelles recettes (codes existants inchangés)"""
+    ajout = construire_colonnes_recettes(nouvelles)
+    fusion = {
+        'noms': colonnes['noms'] + ajout['noms'],
+        'budget': np.concatenate([colonnes['budget'], ajout['budget']]),
+        'duree': np.concatenate([colonnes['duree'], ajout['duree']])
+    }
+    for champ, valeurs in (('difficulte', 'difficultes'), ('saison', 'saisons'), ('pays', 'pays_valeurs')):
+        vocabulaire = {valeur: code for code, valeur in enumerate(colonnes[valeurs])}
+        recodage = np.array([vocabulaire.setdefault(v, len(vocabulaire)) for v in ajout[valeurs]], dtype=np.int32)
+        fusion[champ] = np.concatenate([colonnes[champ], recodage[ajout[champ]]])
+        fusion[valeurs] = tuple(vocabulaire)
+    return fusion
+
+def etendre_index_recherche(recherche, nouvelles, registre, masques, colonnes):
+    """Index BM25 complété: seules les nouvelles recettes sont tokenisées, les poids sont recalculés"""
+    vocabulaire = {
+        'ids_mots': dict(recherche['vocabulaire']['ids_mots']),
+        'ids_ingredients': list(recherche['vocabulaire']['ids_ingredients'])
+    }
+    anciennes = recherche['occurrences']
+    ajout = occurrences_recherche(nouvelles, registre, vocabulaire, len(anciennes['longueurs']))
+    
+    mots = np.concatenate([anciennes['mots'], ajout['mots']])
+    rangs = np.concatenate([anciennes['rangs'], ajout['rangs']])
+    ordre = np.lexsort((rangs, mots))
+    occurrences = {
+        'mots': mots[ordre],
+        'rangs': rangs[ordre],
+        'tf': np.concatenate([anciennes['tf'], ajout['tf']])[ordre],
+        'longueurs': np.concatenate([anciennes['longueurs'], ajout['longueurs']])
+    }
+    masques = np.concatenate([
+        recherche['masques'],
+        np.fromiter((masques[nom] for nom in nouvelles), dtype=np.int64, count=len(nouvelles))
+    ])
+    return assembler_index_recherche(occurrences, vocabulaire, masques, colonnes)
+
+def etendre_index_catalogue(index, nouvelles, prix_enseignes, prix_ingredients):
+    """
+    Index d'une version du catalogue complétée par de nouvelles recettes: seules
+    celles-ci sont analysées, les structures existantes sont réutilisées (non modifiées).
+    """
+    registre = etendre_registre_ingredients(
+        index['registre'], [ing for recette in nouvelles.values() for ing in recette.get('ingredients', {})]
+    )
+    ajout_prix = construire_matrice_prix(nouvelles, prix_enseignes, prix_ingredients, registre)
+    masques = construire_masques_allergenes(nouvelles)
+    nouvel_index = {
+        'registre': registre,
+        'ingredients': etendre_index_ingredients(index['ingredients'], nouvelles, registre),
+        'allergenes': {**index['allergenes'], **masques},
+        'colonnes': etendre_colonnes_recettes(index['colonnes'], nouvelles),
+        # Prix inchangés: les coûts des recettes existantes restent valables
+        'prix': dict(
+            ajout_prix,
+            noms=index['prix']['noms'] + ajout_prix['noms'],
+            couts_recettes=np.vstack([index['prix']['couts_recettes'], ajout_prix['couts_recettes']]),
+            sans_prix=tuple(sorted(set(index['prix']['sans_prix']) | set(ajout_prix['sans_prix'])))
+        )
+    }
+    nouvel_index['recherche'] = etendre_index_recherche(index['recherche'], nouvelles, registre, masques, nouvel_index['colonnes'])
     
-    "Soupe de Légumes": {
-        "pays": "🇫🇷 France",
-        "categorie": "Soupe",
-        "budget_assiette": 0.90,
-        "duree_min": 50,
-        "difficulte": "Facile",
-        "saison": "Toute",
-        "ingredients": {
-            "legumes_kg": 1.2,
-            "pomme_terre_kg": 0.4,
-            "oignon_kg": 0.15,
-            "huile_olive_kg": 0.03,
-            "beurre_kg": 0.02
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🔪 Préparation des légumes (15 min)",
-                "description": "Éplucher et couper tous les légumes en morceaux moyens: carottes, poireaux, céleri, pommes de terre, courgettes selon saison.",
-                "temperature": "Température ambiante",
-                "duree": "15 minutes",
-                "astuce": "Morceaux réguliers = cuisson homogène!"
-            },
-            {
-                "num": 2,
-                "titre": "🧅 Faire suer les légumes (10 min)",
-                "description": "Faire revenir l'oignon dans beurre et huile. Ajouter les légumes durs (carottes, céleri, navets). Faire suer 5 min à couvert.",
-                "temperature": "Feu doux",
-                "duree": "10 minutes",
-                "astuce": "Faire suer développe les saveurs!"
-            },
-            {
-                "num": 3,
-                "titre": "💧 Cuisson (30 min)",
-                "description": "Ajouter pommes de terre et légumes tendres. Couvrir d'eau. Saler. Porter à ébullition puis laisser mijoter jusqu'à ce que tout soit tendre.",
-                "temperature": "Feu moyen puis doux",
-                "duree": "30 minutes",
-                "astuce": "Les légumes doivent se défaire facilement!"
-            },
-            {
-                "num": 4,
-                "titre": "🥄 Mixer ou moulinette (5 min)",
-                "description": "Passer au mixer plongeant pour une soupe veloutée, ou au moulin à légumes pour une texture plus rustique. Ou laisser en morceaux.",
-                "temperature": "Chaud",
-                "duree": "5 minutes",
-                "astuce": "Ajuster la consistance avec le bouillon!"
-            },
-            {
-                "num": 5,
-                "titre": "✨ Finitions",
-                "description": "Vérifier l'assaisonnement. Ajouter une noisette de beurre ou un filet de crème pour plus d'onctuosité.",
-                "temperature": "Chaud",
-                "duree": "2 minutes",
-                "astuce": "Le beurre final = touche du chef!"
-            },
-            {
-                "num": 6,
-                "titre": "🍽️ Service",
-                "description": "Servir bien chaud avec des croûtons, du pain grillé ou du fromage râpé.",
-                "temperature": "Très chaud",
-                "duree": "Immédiat",
-                "astuce": "La soupe de grand-mère française!"
-            }
-        ],
-        "anecdote": "La soupe de légumes est le plat familial par excellence en France. Chaque région a sa variante selon les légumes locaux!"
-    },
+    if ajout_prix['sans_prix']:
+        logger.warning("Ingrédients sans prix (comptés 0€): %s", ', '.join(ajout_prix['sans_prix']))
     
-    "Poisson Vapeur": {
-        "pays": "🇫🇷 France",
-        "categorie": "Plat léger",
-        "budget_assiette": 3.80,
-        "duree_min": 25,
-        "difficulte": "Facile",
-        "saison": "Toute",
-        "ingredients": {
-            "poisson_blanc_kg": 0.6,
-            "citron_kg": 0.1,
-            "beurre_kg": 0.05,
-            "herbes_kg": 0.02,
-            "legumes_kg": 0.4
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🔪 Préparation du poisson (5 min)",
-                "description": "Rincer le poisson (cabillaud, lieu, dorade). Sécher. Saler, poivrer. Arroser de jus de citron.",
-                "temperature": "Température ambiante",
-                "duree": "5 minutes",
-                "astuce": "Poisson bien sec = meilleure cuisson!"
-            },
-            {
-                "num": 2,
-                "titre": "🥕 Préparation des légumes (8 min)",
-                "description": "Éplucher et tailler les légumes (carottes, courgettes, brocolis) en julienne ou petits morceaux.",
-                "temperature": "Température ambiante",
-                "duree": "8 minutes",
-                "astuce": "Taille fine pour cuisson rapide!"
-            },
-            {
-                "num": 3,
-                "titre": "💨 Cuisson vapeur (12 min)",
-                "description": "Dans un cuiseur vapeur, disposer d'abord les légumes, puis le poisson dessus. Parsemer de rondelles de citron et d'herbes (aneth, cerfeuil). Cuire à la vapeur.",
-                "temperature": "Vapeur 100°C",
-                "duree": "12 minutes",
-                "astuce": "Le poisson est cuit quand la chair est opaque!"
-            },
-            {
-                "num": 4,
-                "titre": "🧈 Sauce légère (5 min)",
-                "description": "Faire fondre le beurre avec jus de citron et herbes ciselées. Ou préparer une sauce au yaourt-citron-aneth.",
-                "temperature": "Feu doux",
-                "duree": "5 minutes",
-                "astuce": "Sauce légère pour rester diététique!"
-            },
-            {
-                "num": 5,
-                "titre": "🍽️ Service",
-                "description": "Dresser le poisson sur les légumes. Napper de sauce légère. Décorer de rondelles de citron et herbes fraîches.",
-                "temperature": "Chaud",
-                "duree": "Immédiat",
-                "astuce": "Plat sain et léger parfait!"
-            }
-        ],
-        "anecdote": "La cuisson vapeur préserve tous les nutriments et la texture délicate du poisson. C'est la cuisson santé par excellence!"
-    },
-    
-    # ========== 5 RECETTES SUPPLÉMENTAIRES ==========
-    
-    "Tajine Kefta aux Œufs": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Plat principal",
-        "budget_assiette": 2.20,
-        "duree_min": 35,
-        "difficulte": "Facile",
-        "saison": "Toute",
-        "darija": "طاجين كفتة بالبيض - Tajine kefta b lbid!",
-        "ingredients": {
-            "viande_hachee_kg": 0.5,
-            "tomates_kg": 0.4,
-            "oignon_kg": 0.15,
-            "oeuf_kg": 0.2,
-            "persil_kg": 0.03,
-            "cumin_kg": 0.01
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🥩 Préparation des boulettes (10 min)",
-                "description": "Mélanger la viande hachée avec oignon râpé, persil haché, cumin, paprika, sel et poivre. Former des boulettes de la taille d'une noix.",
-                "temperature": "Température ambiante",
-                "duree": "10 minutes",
-                "astuce": "Des petites boulettes cuisent plus vite!"
-            },
-            {
-                "num": 2,
-                "titre": "🍅 Préparation de la sauce (10 min)",
-                "description": "Dans le tajine ou une poêle, faire revenir l'oignon émincé. Ajouter les tomates pelées concassées, sel, poivre, cumin, paprika. Laisser mijoter.",
-                "temperature": "Feu moyen",
-                "duree": "10 minutes",
-                "astuce": "La sauce doit épaissir!"
-            },
-            {
-                "num": 3,
-                "titre": "🥘 Cuisson des keftas (10 min)",
-                "description": "Déposer les boulettes dans la sauce tomate. Couvrir et laisser cuire à feu doux.",
-                "temperature": "Feu doux",
-                "duree": "10 minutes",
-                "astuce": "Ne pas trop remuer pour garder les boulettes entières!"
-            },
-            {
-                "num": 4,
-                "titre": "🥚 Ajout des œufs (5 min)",
-                "description": "Créer des petits puits dans la sauce. Casser un œuf dans chaque puits. Couvrir et cuire jusqu'à ce que les blancs soient pris mais les jaunes encore coulants.",
-                "temperature": "Feu doux",
-                "duree": "5 minutes",
-                "astuce": "Jaunes coulants, c'est meilleur!"
-            },
-            {
-                "num": 5,
-                "titre": "🍽️ Service",
-                "description": "Servir directement dans le tajine avec du pain marocain pour saucer.",
-                "temperature": "Très chaud",
-                "duree": "Immédiat",
-                "astuce": "On trempe le pain dans le jaune, un délice!"
-            }
-        ],
-        "anecdote": "Ce tajine est un classique du dîner familial marocain. Simple, rapide et tout le monde l'adore!"
-    },
+    return nouvel_index
+
+def obtenir_index_catalogue():
+    """Retourne les index de la version du catalogue utilisée par ce run"""
+    return INDEX_CATALOGUE
+
+def ingredients_correspondants(ingredients_disponibles):
+    """Retourne les identifiants d'ingrédients du catalogue qui correspondent aux ingrédients donnés"""
+    par_token = obtenir_index_catalogue()['ingredients']['par_token']
+    trouves = set()
+    for dispo in ingredients_disponibles:
+        for token in tokens_ingredient(dispo):
+            trouves.update(par_token.get(token, ()))
+    return trouves
+
+def rechercher_recettes(texte, nb_max, allergies=None, contexte=None):
+    """
+    Les nb_max recettes les plus pertinentes pour un message (BM25), sans les
+    allergènes donnés, complétées par des recettes variées si peu correspondent.
+    """
+    index = obtenir_index_catalogue()
+    recherche = index['recherche']
+    noms = index['colonnes']['noms']
+    
+    # Le message compte plus que les échanges précédents
+    scores = np.zeros(len(noms), dtype=np.float64)
+    for poids_requete, requete in ((1.0, texte), (0.5, contexte)):
+        for mot in set(mots_texte(requete or '')):
+            if mot in recherche['postings']:
+                rangs, poids = recherche['postings'][mot]
+                scores[rangs] += poids_requete * poids
+    
+    exclues = (recherche['masques'] & masque_allergies(allergies)) != 0
+    scores[exclues] = 0
+    
+    # Top-k par argpartition, puis tri stable (score décroissant, ordre du catalogue)
+    pertinents = np.flatnonzero(scores > 0)
+    if len(pertinents) > nb_max:
+        pertinents = pertinents[np.argpartition(-scores[pertinents], nb_max - 1)[:nb_max]]
+    choisis = sorted(pertinents.tolist(), key=lambda r: (-scores[r], r))
+    
+    if len(choisis) < nb_max:
+        deja = set(choisis)
+        for rang in recherche['ordre_repli'].tolist():
+            if len(choisis) >= nb_max:
+                break
+            if rang not in deja and not exclues[rang]:
+                choisis.append(rang)
     
-    "Crêpes Suzette": {
-        "pays": "🇫🇷 France",
-        "categorie": "Dessert",
-        "budget_assiette": 2.00,
-        "duree_min": 40,
-        "difficulte": "Moyen",
-        "saison": "Toute",
-        "ingredients": {
-            "farine_kg": 0.125,
-            "oeuf_kg": 0.1,
-            "lait_kg": 0.25,
-            "beurre_kg": 0.1,
-            "sucre_kg": 0.08,
-            "orange_kg": 0.3
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🥣 Pâte à crêpes (10 min + repos)",
-                "description": "Mélanger farine, œufs, lait et une pincée de sel. Laisser reposer 30 min minimum.",
-                "temperature": "Température ambiante",
-                "duree": "10 minutes + repos",
-                "astuce": "Pâte sans grumeaux = crêpes fines!"
-            },
-            {
-                "num": 2,
-                "titre": "🍳 Cuisson des crêpes (15 min)",
-                "description": "Dans une poêle beurrée bien chaude, verser une louche de pâte. Cuire 1-2 min de chaque côté.",
-                "temperature": "Feu vif",
-                "duree": "15 minutes",
-                "astuce": "Crêpes fines et dorées!"
-            },
-            {
-                "num": 3,
-                "titre": "🍊 Beurre d'orange (5 min)",
-                "description": "Faire fondre le beurre avec le sucre. Ajouter le zeste et le jus des oranges. Faire caraméliser légèrement.",
-                "temperature": "Feu moyen",
-                "duree": "5 minutes",
-                "astuce": "Le beurre doit mousser et devenir ambré!"
-            },
-            {
-                "num": 4,
-                "titre": "🔥 Flambage (2 min)",
-                "description": "Plier les crêpes en quatre, les disposer dans la sauce. Ajouter un peu de Grand Marnier et flamber.",
-                "temperature": "Feu vif",
-                "duree": "2 minutes",
-                "astuce": "Attention aux flammes! Spectaculaire!"
-            },
-            {
-                "num": 5,
-                "titre": "🍽️ Service",
-                "description": "Servir immédiatement 2 crêpes par personne, nappées de sauce à l'orange.",
-                "temperature": "Chaud",
-                "duree": "Immédiat",
-                "astuce": "Un dessert de restaurant à la maison!"
-            }
-        ],
-        "anecdote": "Les Crêpes Suzette auraient été inventées par accident en 1895 au Café de Paris à Monte-Carlo, pour le Prince de Galles!"
-    },
+    return [noms[r] for r in choisis]
+
+# =============================================================================
+# RECETTES GÉNÉRÉES (base persistante + file des tâches de génération)
+# =============================================================================
+
+# Recettes générées par IA et tâches de génération, partagées par les réplicas de la machine
+FICHIER_RECETTES_GENEREES = os.getenv(
+    "SARAHMIAM_RECETTES_GENEREES",
+    os.path.join(DOSSIER_DONNEES, 'recettes_generees.db')
+)
+
+# Tentatives d'une tâche avant abandon (les pannes Groq et le quota ne comptent pas)
+MAX_ESSAIS_TACHE = 2
+
+# Une tâche en cours sans nouvelles depuis ce délai est reprise (processus arrêté) (secondes)
+EXPIRATION_TACHE = 300
+
+# États d'une tâche; les trois derniers sont définitifs
+ETATS_TACHE_FINIS = ('terminee', 'doublon', 'echec')
+
+class MagasinRecettesGenerees:
+    """
+    Base SQLite des recettes générées (même table que les bases compilées: détails
+    lus à la demande) et file persistante des tâches de génération.
+    """
     
-    "Mhancha aux Amandes": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Dessert",
-        "budget_assiette": 2.80,
-        "duree_min": 60,
-        "difficulte": "Difficile",
-        "saison": "Toute",
-        "darija": "المحنشة - Mhancha dial les fêtes!",
-        "ingredients": {
-            "amandes_kg": 0.3,
-            "sucre_kg": 0.15,
-            "feuilles_brick_kg": 0.2,
-            "beurre_kg": 0.1,
-            "miel_kg": 0.1,
-            "eau_fleur_oranger_kg": 0.02
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🥜 Pâte d'amandes (15 min)",
-                "description": "Mixer les amandes avec le sucre, l'eau de fleur d'oranger et un peu de beurre fondu jusqu'à obtenir une pâte.",
-                "temperature": "Température ambiante",
-                "duree": "15 minutes",
-                "astuce": "Pas trop fine, garder du croquant!"
-            },
-            {
-                "num": 2,
-                "titre": "📜 Montage des boudins (15 min)",
-                "description": "Étaler la pâte d'amandes en boudin sur chaque feuille de brick beurrée. Rouler serré pour former des cigares.",
-                "temperature": "Température ambiante",
-                "duree": "15 minutes",
-                "astuce": "Bien serrer pour que ça tienne!"
-            },
-            {
-                "num": 3,
-                "titre": "🐍 Formation du serpent (10 min)",
-                "description": "Dans un plat rond beurré, enrouler le premier cigare en spirale au centre, puis ajouter les autres bout à bout pour former un serpent enroulé.",
-                "temperature": "Température ambiante",
-                "duree": "10 minutes",
-                "astuce": "C'est cette forme qui donne le nom mhancha (serpent)!"
-            },
-            {
-                "num": 4,
-                "titre": "🔥 Cuisson (25 min)",
-                "description": "Badigeonner de beurre fondu et jaune d'œuf. Enfourner jusqu'à ce que ce soit bien doré.",
-                "temperature": "Four 180°C",
-                "duree": "25 minutes",
-                "astuce": "Surveiller la coloration!"
-            },
-            {
-                "num": 5,
-                "titre": "🍯 Finition au miel (5 min)",
-                "description": "À la sortie du four, arroser généreusement de miel chaud. Décorer d'amandes effilées.",
-                "temperature": "Chaud",
-                "duree": "5 minutes",
-                "astuce": "Le miel doit être chaud pour bien pénétrer!"
-            },
-            {
-                "num": 6,
-                "titre": "🍽️ Service",
-                "description": "Laisser tiédir et couper en parts. Servir avec du thé à la menthe.",
-                "temperature": "Tiède",
-                "duree": "Immédiat",
-                "astuce": "Indispensable aux fêtes marocaines!"
-            }
-        ],
-        "anecdote": "La mhancha (serpent en arabe) est le gâteau des grandes occasions au Maroc: mariages, baptêmes, fêtes religieuses!"
-    },
+    def __init__(self, fichier=FICHIER_RECETTES_GENEREES):
+        if not os.access(os.path.dirname(os.path.abspath(fichier)), os.W_OK):
+            # Dossier en lecture seule: base dans le dossier temporaire
+            fichier = os.path.join(tempfile.gettempdir(), "sarahmiam-recettes-generees.db")
+        self.fichier = fichier
+        with closing(self._connexion()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS recettes (rang INTEGER PRIMARY KEY AUTOINCREMENT, nom TEXT UNIQUE, entete TEXT,"
+                " cles_details TEXT, details TEXT, signature TEXT UNIQUE, description TEXT, cree_le REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS taches (id INTEGER PRIMARY KEY AUTOINCREMENT, description TEXT, cle TEXT,"
+                " source TEXT, etat TEXT, essais INTEGER DEFAULT 0, nom TEXT, progression TEXT, erreur TEXT,"
+                " cree_le REAL, maj_le REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS taches_etat ON taches (etat, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS taches_cle ON taches (cle)")
+    
+    def _connexion(self):
+        return sqlite3.connect(self.fichier, timeout=10, isolation_level=None)
+    
+    def ajouter_tache(self, description, cle, source):
+        """Ajoute une tâche (ou retourne celle déjà demandée pour la même description, hors échec)"""
+        maintenant = time.time()
+        with closing(self._connexion()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                existante = conn.execute(
+                    "SELECT id FROM taches WHERE cle = ? AND etat != 'echec' ORDER BY id DESC LIMIT 1", (cle,)
+                ).fetchone()
+                id_tache = existante[0] if existante else conn.execute(
+                    "INSERT INTO taches (description, cle, source, etat, cree_le, maj_le) VALUES (?, ?, ?, 'en_attente', ?, ?)",
+                    (description, cle, source, maintenant, maintenant)
+                ).lastrowid
+                conn.execute("COMMIT")
+                return id_tache
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+    
+    def prendre_tache(self):
+        """Réserve la plus ancienne tâche en attente (ou abandonnée par un processus arrêté); None si la file est vide"""
+        maintenant = time.time()
+        with closing(self._connexion()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                ligne = conn.execute(
+                    "SELECT id, description FROM taches WHERE etat = 'en_attente' OR (etat = 'en_cours' AND maj_le < ?)"
+                    " ORDER BY id LIMIT 1", (maintenant - EXPIRATION_TACHE,)
+                ).fetchone()
+                if ligne:
+                    conn.execute(
+                        "UPDATE taches SET etat = 'en_cours', progression = NULL, maj_le = ? WHERE id = ?", (maintenant, ligne[0])
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return {'id': ligne[0], 'description': ligne[1]} if ligne else None
+    
+    def noter_progression(self, id_tache, progression):
+        """Recette partielle (nom, étapes déjà écrites) d'une tâche en cours"""
+        with closing(self._connexion()) as conn:
+            conn.execute(
+                "UPDATE taches SET progression = ?, maj_le = ? WHERE id = ?",
+                (json.dumps(progression, ensure_ascii=False), time.time(), id_tache)
+            )
     
-    "Soupe à l'Oignon": {
-        "pays": "🇫🇷 France",
-        "categorie": "Soupe",
-        "budget_assiette": 1.50,
-        "duree_min": 50,
-        "difficulte": "Facile",
-        "saison": "Hiver",
-        "ingredients": {
-            "oignon_kg": 0.6,
-            "beurre_kg": 0.05,
-            "farine_kg": 0.03,
-            "vin_rouge_kg": 0.1,
-            "fromage_rape_kg": 0.1,
-            "pain_kg": 0.1
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🧅 Caramélisation des oignons (30 min)",
-                "description": "Émincer finement les oignons. Les faire revenir dans le beurre à feu doux jusqu'à ce qu'ils soient bien dorés et caramélisés.",
-                "temperature": "Feu doux",
-                "duree": "30 minutes",
-                "astuce": "Patience! C'est la caramélisation qui fait tout!"
-            },
-            {
-                "num": 2,
-                "titre": "🍷 Déglaçage (5 min)",
-                "description": "Saupoudrer de farine, mélanger. Déglacer au vin blanc ou rouge. Ajouter 1.5L de bouillon de bœuf ou d'eau. Saler, poivrer, thym, laurier.",
-                "temperature": "Feu moyen",
-                "duree": "5 minutes",
-                "astuce": "Bien gratter les sucs de cuisson!"
-            },
-            {
-                "num": 3,
-                "titre": "💧 Cuisson (15 min)",
-                "description": "Laisser mijoter à feu doux pour que les saveurs se développent.",
-                "temperature": "Feu doux",
-                "duree": "15 minutes",
-                "astuce": "Plus ça mijote, meilleur c'est!"
-            },
-            {
-                "num": 4,
-                "titre": "🧀 Gratinage (5 min)",
-                "description": "Verser la soupe dans des bols allant au four. Ajouter des croûtons de pain. Couvrir généreusement de gruyère râpé. Gratiner sous le gril.",
-                "temperature": "Gril du four",
-                "duree": "5 minutes",
-                "astuce": "Le fromage doit être bien doré et filant!"
-            },
-            {
-                "num": 5,
-                "titre": "🍽️ Service",
-                "description": "Servir immédiatement, attention c'est très chaud!",
-                "temperature": "Brûlant",
-                "duree": "Immédiat",
-                "astuce": "La soupe des nuits parisiennes!"
-            }
-        ],
-        "anecdote": "La soupe à l'oignon gratinée était servie aux Halles de Paris aux travailleurs de nuit. Un classique réconfortant!"
-    },
+    def terminer_tache(self, id_tache, etat, nom=None, erreur=None):
+        """Clôt une tâche: 'terminee', 'doublon' (nom de la recette existante) ou 'echec'"""
+        with closing(self._connexion()) as conn:
+            conn.execute(
+                "UPDATE taches SET etat = ?, nom = ?, erreur = ?, maj_le = ? WHERE id = ?",
+                (etat, nom, erreur, time.time(), id_tache)
+            )
     
-    "Cornes de Gazelle": {
-        "pays": "🇲🇦 Maroc",
-        "categorie": "Dessert",
-        "budget_assiette": 2.50,
-        "duree_min": 75,
-        "difficulte": "Difficile",
-        "saison": "Toute",
-        "darija": "كعب الغزال - Kaab lghzal, le must!",
-        "ingredients": {
-            "farine_kg": 0.25,
-            "amandes_kg": 0.25,
-            "sucre_kg": 0.15,
-            "beurre_kg": 0.1,
-            "eau_fleur_oranger_kg": 0.03
-        },
-        "etapes": [
-            {
-                "num": 1,
-                "titre": "🥜 Pâte d'amandes (20 min)",
-                "description": "Mixer les amandes mondées avec le sucre glace, l'eau de fleur d'oranger et un peu de beurre fondu jusqu'à obtenir une pâte souple.",
-                "temperature": "Température ambiante",
-                "duree": "20 minutes",
-                "astuce": "La pâte doit être malléable mais pas collante!"
-            },
-            {
-                "num": 2,
-                "titre": "🥟 Pâte extérieure (15 min)",
-                "description": "Mélanger farine, beurre fondu, eau de fleur d'oranger et un peu d'eau. Pétrir jusqu'à obtenir une pâte élastique. Laisser reposer.",
-                "temperature": "Température ambiante",
-                "duree": "15 minutes",
-                "astuce": "Pâte très fine et élastique!"
-            },
-            {
-                "num": 3,
-                "titre": "🌙 Façonnage (25 min)",
-                "description": "Former des petits boudins de pâte d'amandes. Étaler finement la pâte, y déposer les boudins, replier et former des croissants en pinçant les bords.",
-                "temperature": "Température ambiante",
-                "duree": "25 minutes",
-                "astuce": "La forme doit évoquer une corne de gazelle!"
-            },
-            {
-                "num": 4,
-                "titre": "🔥 Cuisson (15 min)",
-                "description": "Disposer sur une plaque beurrée. Piquer avec une aiguille pour éviter qu'ils éclatent. Enfourner jusqu'à légère coloration.",
-                "temperature": "Four 180°C",
-                "duree": "15 minutes",
-                "astuce": "Ils ne doivent PAS dorer, juste cuire!"
-            },
-            {
-                "num": 5,
-                "titre": "✨ Finition",
-                "description": "À la sortie du four, saupoudrer légèrement de sucre glace.",
-                "temperature": "Tiède",
-                "duree": "5 minutes",
-                "astuce": "Délicats et fondants en bouche!"
-            },
-            {
-                "num": 6,
-                "titre": "🍽️ Service",
-                "description": "Servir avec du thé à la menthe. Se conservent plusieurs jours dans une boîte hermétique.",
-                "temperature": "Température ambiante",
-                "duree": "Immédiat",
-                "astuce": "Le roi des gâteaux marocains!"
-            }
-        ],
-        "anecdote": "Les cornes de gazelle (kaab lghzal) sont considérées comme le summum de la pâtisserie marocaine. Leur finesse est un signe de maîtrise!"
-    }
-}
+    def reprendre_tache(self, id_tache, erreur, compter_essai=True):
+        """Remet une tâche en attente après une erreur, ou la passe en échec après MAX_ESSAIS_TACHE essais"""
+        with closing(self._connexion()) as conn:
+            conn.execute(
+                "UPDATE taches SET essais = essais + ?, erreur = ?, maj_le = ?,"
+                " etat = CASE WHEN essais + ? >= ? THEN 'echec' ELSE 'en_attente' END WHERE id = ?",
+                (int(compter_essai), erreur, time.time(), int(compter_essai), MAX_ESSAIS_TACHE, id_tache)
+            )
+    
+    def etat_tache(self, id_tache):
+        """État d'une tâche (avec sa position dans la file si elle attend), None si inconnue"""
+        with closing(self._connexion()) as conn:
+            ligne = conn.execute(
+                "SELECT description, etat, nom, progression, erreur FROM taches WHERE id = ?", (id_tache,)
+            ).fetchone()
+            if ligne is None:
+                return None
+            tache = dict(zip(('description', 'etat', 'nom', 'progression', 'erreur'), ligne), id=id_tache)
+            tache['progression'] = json.loads(tache['progression']) if tache['progression'] else None
+            if tache['etat'] == 'en_attente':
+                tache['position'] = conn.execute(
+                    "SELECT COUNT(*) FROM taches WHERE etat = 'en_attente' AND id <= ?", (id_tache,)
+                ).fetchone()[0]
+        return tache
+    
+    def enregistrer_recette(self, nom, recette, signature, description):
+        """Ajoute une recette validée; retourne son rang, None si le nom ou la signature existe déjà"""
+        entete = {k: v for k, v in recette.items() if k in CHAMPS_ENTETE}
+        details = {k: v for k, v in recette.items() if k not in CHAMPS_ENTETE}
+        try:
+            with closing(self._connexion()) as conn:
+                return conn.execute(
+                    "INSERT INTO recettes (nom, entete, cles_details, details, signature, description, cree_le)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (nom, json.dumps(entete, ensure_ascii=False), json.dumps(list(details)),
+                     json.dumps(details, ensure_ascii=False), signature, description, time.time())
+                ).lastrowid
+        except sqlite3.IntegrityError:
+            return None
+    
+    def nom_par_signature(self, signature):
+        """Nom de la recette générée de même signature, None sinon"""
+        with closing(self._connexion()) as conn:
+            ligne = conn.execute("SELECT nom FROM recettes WHERE signature = ?", (signature,)).fetchone()
+        return ligne[0] if ligne else None
+    
+    def dernier_rang(self):
+        """Rang de la dernière recette enregistrée (0 si aucune)"""
+        with closing(self._connexion()) as conn:
+            return conn.execute("SELECT COALESCE(MAX(rang), 0) FROM recettes").fetchone()[0]
+    
+    def recettes_depuis(self, rang):
+        """Recettes enregistrées après ce rang (en-têtes, détails lus à la demande) et dernier rang lu"""
+        with closing(self._connexion()) as conn:
+            lignes = conn.execute(
+                "SELECT rang, nom, entete, cles_details FROM recettes WHERE rang > ? ORDER BY rang", (rang,)
+            ).fetchall()
+        recettes = {
+            sys.intern(nom): Recette(json.loads(entete), json.loads(cles_details), base=self.fichier, rang=rang_recette)
+            for rang_recette, nom, entete, cles_details in lignes
+        }
+        return recettes, (lignes[-1][0] if lignes else rang)
+    
+    def stats(self):
+        """Nombre de recettes générées et de tâches par état"""
+        with closing(self._connexion()) as conn:
+            stats = dict(conn.execute("SELECT etat, COUNT(*) FROM taches GROUP BY etat").fetchall())
+            stats['recettes'] = conn.execute("SELECT COUNT(*) FROM recettes").fetchone()[0]
+        return stats
+
+@st.cache_resource(show_spinner=False)
+def obtenir_magasin_recettes():
+    """Base des recettes générées unique par processus"""
+    return MagasinRecettesGenerees()
 
 # =============================================================================
-# PRIX INGRÉDIENTS (référence)
+# CATALOGUE VERSIONNÉ (rechargement à chaud sans redémarrer Streamlit)
 # =============================================================================
 
-PRIX_INGREDIENTS = {
-    "viande_mouton_kg": 12.50, "viande_hachee_kg": 8.90, "poulet_kg": 6.50,
-    "merguez_kg": 9.50, "dinde_kg": 7.80, "veau_kg": 18.00, "boeuf_kg": 15.00,
-    "lardons_kg": 10.00, "jambon_kg": 12.00, "chair_saucisse_kg": 8.50,
-    "pigeon_ou_poulet_kg": 8.00, "thon_kg": 20.00, "anchois_kg": 35.00,
-    "poisson_blanc_kg": 16.00, "tomates_kg": 2.80, "oignon_kg": 1.50,
-    "carotte_kg": 1.20, "courgette_kg": 2.50, "aubergine_kg": 3.00,
-    "poivron_kg": 4.00, "pomme_terre_kg": 1.30, "legumes_kg": 2.50,
-    "navet_kg": 1.80, "poireau_kg": 2.20, "celeri_kg": 2.00,
-    "champignon_kg": 7.00, "oignon_grelot_kg": 3.50, "lentilles_kg": 3.50,
-    "pois_chiches_kg": 3.20, "feves_seches_kg": 4.00, "farine_kg": 1.20,
-    "semoule_couscous_kg": 2.00, "semoule_fine_kg": 1.80, "vermicelles_kg": 2.50,
-    "pain_mie_kg": 2.50, "pate_brisee_kg": 3.50, "feuilles_brick_kg": 8.00,
-    "msemmen_ou_crepes_kg": 5.00, "coriandre_kg": 8.00, "persil_kg": 8.00,
-    "ail_kg": 6.00, "thym_kg": 20.00, "herbes_kg": 15.00, "fines_herbes_kg": 20.00,
-    "creme_kg": 5.00, "lait_kg": 1.10, "beurre_kg": 10.00, "smen_beurre_kg": 15.00,
-    "fromage_rape_kg": 12.00, "gruyere_kg": 14.00, "jaune_oeuf_kg": 8.00,
-    "oeuf_kg": 3.50, "oeuf_dur_kg": 3.50, "citron_kg": 3.50,
-    "citron_confit_kg": 12.00, "citron_frais_kg": 3.50, "marron_kg": 18.00,
-    "olives_kg": 8.00, "olive_kg": 8.00, "huile_olive_kg": 8.00, "huile_kg": 5.00,
-    "huile_friture_kg": 4.00, "sucre_kg": 1.50, "miel_kg": 15.00,
-    "chocolat_kg": 12.00, "cacao_kg": 8.00, "amandes_kg": 18.00,
-    "sesame_kg": 10.00, "raisins_secs_kg": 8.00, "cannelle_kg": 25.00,
-    "muscade_kg": 30.00, "cumin_kg": 15.00, "paprika_kg": 12.00,
-    "fenugrec_kg": 10.00, "levure_kg": 8.00, "sel_kg": 1.00,
-    "vin_rouge_kg": 8.00, "eau_fleur_oranger_kg": 12.00, "os_moelle_kg": 5.00,
-    "orange_kg": 2.50, "pain_kg": 2.00
-}
+# Fréquence de vérification des fichiers de data/ (secondes)
+INTERVALLE_SURVEILLANCE_CATALOGUE = 2
+
+class Catalogue:
+    """Instantané immuable du catalogue: recettes, prix et index d'une version"""
+    __slots__ = ('version', 'recettes', 'prix_enseignes', 'prix_ingredients', 'index', 'charge_le')
+    
+    def __init__(self, version, recettes, prix_enseignes, prix_ingredients, index=None):
+        self.version = version
+        self.recettes = MappingProxyType(dict(recettes))
+        self.prix_enseignes = MappingProxyType({e: MappingProxyType(dict(p)) for e, p in prix_enseignes.items()})
+        self.prix_ingredients = MappingProxyType(dict(prix_ingredients))
+        if index is None:
+            index = construire_index_catalogue(self.recettes, self.prix_enseignes, self.prix_ingredients)
+        self.index = MappingProxyType(index)
+        self.charge_le = datetime.now()
+    
+    def etendre(self, nouvelles, version):
+        """Nouvel instantané avec des recettes en plus (index complétés, pas reconstruits)"""
+        index = etendre_index_catalogue(self.index, nouvelles, self.prix_enseignes, self.prix_ingredients)
+        return Catalogue(version, {**self.recettes, **nouvelles}, self.prix_enseignes, self.prix_ingredients, index)
+
+def charger_instantane(fichier_recettes=FICHIER_RECETTES, fichier_prix=FICHIER_PRIX):
+    """Construit un instantané du catalogue à partir des fichiers de data/"""
+    with open(fichier_recettes, 'rb') as f:
+        contenu_recettes = f.read()
+    with open(fichier_prix, 'rb') as f:
+        contenu_prix = f.read()
+    
+    prix = json.loads(contenu_prix)
+    empreinte = hashlib.sha1(contenu_recettes).hexdigest()[:12]
+    recettes = charger_recettes(contenu_recettes, empreinte, os.path.dirname(os.path.abspath(fichier_recettes)))
+    version = hashlib.sha1(contenu_recettes + contenu_prix).hexdigest()[:12]
+    
+    return Catalogue(version, recettes, prix['enseignes'], prix['reference'])
+
+class GestionnaireCatalogue:
+    """
+    Surveille data/ et remplace atomiquement l'instantané actif quand un fichier change;
+    les recettes générées (base persistante) sont ajoutées à chaque instantané.
+    """
+    
+    def __init__(self, fichier_recettes=FICHIER_RECETTES, fichier_prix=FICHIER_PRIX,
+                 intervalle=INTERVALLE_SURVEILLANCE_CATALOGUE, magasin=None):
+        self.fichiers = (fichier_recettes, fichier_prix)
+        self.intervalle = intervalle
+        self.magasin = magasin
+        self.derniere_erreur = None
+        self._verrou = threading.Lock()
+        self._signature = self._signature_sources()
+        base = charger_instantane(*self.fichiers)
+        self._version_fichiers = base.version
+        self.actif, self._dernier_genere = self._completer(base, base.version)
+        self.historique = [(self.actif.version, self.actif.charge_le)]
+        
+        threading.Thread(target=self._surveiller, name="sarahmiam-catalogue", daemon=True).start()
+    
+    def _signature_sources(self):
+        """Signature légère des fichiers surveillés (taille + date de modification)"""
+        signature = []
+        for chemin in self.fichiers:
+            try:
+                infos = os.stat(chemin)
+                signature.append((infos.st_size, infos.st_mtime_ns))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+    
+    def _surveiller(self):
+        while True:
+            time.sleep(self.intervalle)
+            try:
+                self.verifier()
+            except Exception as e:
+                logger.exception("Surveillance du catalogue: %s", e)
+    
+    def _completer(self, catalogue, version_fichiers, depuis=0):
+        """Instantané complété par les recettes générées après le rang donné (sauf noms déjà présents) et dernier rang lu"""
+        if self.magasin is None:
+            return catalogue, depuis
+        nouvelles, dernier = self.magasin.recettes_depuis(depuis)
+        nouvelles = {nom: recette for nom, recette in nouvelles.items() if nom not in catalogue.recettes}
+        if not nouvelles:
+            return catalogue, dernier
+        # Version déterminée par (fichiers, dernière recette générée): les réplicas convergent
+        version = hashlib.sha1(f"{version_fichiers}+{dernier}".encode()).hexdigest()[:12]
+        return catalogue.etendre(nouvelles, version), dernier
+    
+    def integrer_generees(self):
+        """Ajoute à l'instantané actif les recettes générées depuis (ici ou par un autre réplica); True si ajout"""
+        if self.magasin is None or self.magasin.dernier_rang() == self._dernier_genere:
+            return False
+        with self._verrou:
+            nouveau, self._dernier_genere = self._completer(self.actif, self._version_fichiers, self._dernier_genere)
+            return nouveau is not self.actif and self.installer(nouveau)
+    
+    def verifier(self, forcer=False):
+        """Recharge le catalogue si un fichier a changé; retourne True si la version a changé"""
+        signature = self._signature_sources()
+        if signature == self._signature and not forcer:
+            return self.integrer_generees()
+        
+        with self._verrou:
+            self._signature = signature
+            try:
+                base = charger_instantane(*self.fichiers)
+                nouveau, dernier = self._completer(base, base.version)
+            except (OSError, ValueError, KeyError, sqlite3.Error) as e:
+                # Fichier invalide ou en cours d'écriture: on garde la version active
+                self.derniere_erreur = f"{type(e).__name__}: {e}"
+                logger.warning("Catalogue non rechargé (%s), version %s conservée", self.derniere_erreur, self.actif.version)
+                return False
+            
+            self.derniere_erreur = None
+            self._version_fichiers, self._dernier_genere = base.version, dernier
+            if nouveau.version == self.actif.version:
+                return False
+            return self.installer(nouveau)
+    
+    def installer(self, catalogue):
+        """Remplace l'instantané actif (les runs en cours gardent le leur)"""
+        ancien = self.actif
+        self.actif = catalogue
+        self.historique = (self.historique + [(catalogue.version, catalogue.charge_le)])[-20:]
+        logger.info("Catalogue %s -> %s (%d recettes)", ancien.version, catalogue.version, len(catalogue.recettes))
+        bases = {getattr(r, '_base', None) for c in (ancien, catalogue) for r in c.recettes.values()} - {None}
+        if self.magasin is not None:
+            bases.discard(self.magasin.fichier)
+        if os.path.isdir(DOSSIER_DONNEES):
+            nettoyer_catalogues_compiles(DOSSIER_DONNEES, bases)
+        return True
+
+@st.cache_resource(show_spinner=False)
+def obtenir_gestionnaire_catalogue():
+    """Gestionnaire de catalogue unique par processus (partagé entre sessions)"""
+    return GestionnaireCatalogue(magasin=obtenir_magasin_recettes())
+
+def utiliser_catalogue(catalogue):
+    """Lie les globales de ce run à un instantané, cohérent jusqu'au prochain rerun"""
+    global CATALOGUE, RECETTES_DETAILLEES, PRIX_ENSEIGNES, PRIX_INGREDIENTS, INDEX_CATALOGUE
+    CATALOGUE = catalogue
+    RECETTES_DETAILLEES = catalogue.recettes
+    PRIX_ENSEIGNES = catalogue.prix_enseignes
+    PRIX_INGREDIENTS = catalogue.prix_ingredients
+    INDEX_CATALOGUE = catalogue.index
+
+def version_catalogue():
+    """Version active du catalogue dans ce processus (pour vérifier la convergence des réplicas)"""
+    return obtenir_gestionnaire_catalogue().actif.version
+
+# Chaque rerun Streamlit repart de l'instantané actif à cet instant
+utiliser_catalogue(obtenir_gestionnaire_catalogue().actif)
 
 # =============================================================================
 # INITIALISATION SESSION STATE
@@ -2930,7 +2082,14 @@ def init_session_state():
         'nb_personnes': 4,
         'ingredients_disponibles': [],
         'timers': [],
-        'meteo_cache': None
+        'meteo_cache': None,
+        'reponses_en_direct': True,
+        'id_session': uuid.uuid4().hex,
+        'resume_conversation': '',
+        'a_resumer': [],
+        'nb_en_resume': 0,
+        'nb_archives': 0,
+        'taches_recettes': []
     }
     
     for key, value in defaults.items():
@@ -3140,9 +2299,22 @@ def verifier_allergenes(recette_nom, allergies_utilisateur):
     if not allergies_utilisateur:
         return True, []
     
+    masque_recette = obtenir_index_catalogue()['allergenes'].get(recette_nom)
+    if masque_recette is None:
+        return True, []
+    
+    # Un seul ET binaire; le détail n'est calculé que si la recette est concernée
+    if not masque_recette & masque_allergies(allergies_utilisateur):
+        return True, []
+    
+    allergenes_trouves = details_allergenes(recette_nom, allergies_utilisateur)
+    return len(allergenes_trouves) == 0, allergenes_trouves
+
+def details_allergenes(recette_nom, allergies_utilisateur):
+    """Liste les ingrédients allergènes d'une recette (texte d'avertissement)"""
     recette = RECETTES_DETAILLEES.get(recette_nom)
     if not recette:
-        return True, []
+        return []
     
     allergenes_trouves = []
     ingredients = list(recette.get('ingredients', {}).keys())
@@ -3154,16 +2326,13 @@ def verifier_allergenes(recette_nom, allergies_utilisateur):
                     if ingredient_allergie in ing.lower():
                         allergenes_trouves.append(f"{allergie}: {ing}")
     
-    return len(allergenes_trouves) == 0, allergenes_trouves
+    return allergenes_trouves
 
 def filtrer_recettes_allergies(allergies):
     """Retourne les recettes sans les allergènes spécifiés"""
-    recettes_ok = []
-    for nom in RECETTES_DETAILLEES.keys():
-        ok, _ = verifier_allergenes(nom, allergies)
-        if ok:
-            recettes_ok.append(nom)
-    return recettes_ok
+    masque = masque_allergies(allergies)
+    masques = obtenir_index_catalogue()['allergenes']
+    return [nom for nom, masque_recette in masques.items() if not masque_recette & masque]
 
 def detecter_allergies(texte):
     """Détecte les allergies mentionnées dans un texte"""
@@ -3201,21 +2370,14 @@ def verifier_ingredients(recette_nom, ingredients_disponibles):
     if not recette:
         return [], []
     
-    ingredients_recette = list(recette.get('ingredients', {}).keys())
-    disponibles = [i.lower().replace(' ', '_') for i in ingredients_disponibles]
+    trouves = ingredients_correspondants(ingredients_disponibles)
+    id_par_cle = obtenir_index_catalogue()['registre']['id_par_cle']
     
     manquants = []
     presents = []
     
-    for ing in ingredients_recette:
-        ing_clean = ing.lower().replace('_kg', '').replace('_litre', '').replace('_unite', '')
-        trouve = False
-        for dispo in disponibles:
-            if ing_clean in dispo or dispo in ing_clean:
-                trouve = True
-                break
-        
-        if trouve:
+    for ing in recette.get('ingredients', {}):
+        if id_par_cle.get(ing) in trouves:
             presents.append(ing)
         else:
             manquants.append(ing)
@@ -3228,24 +2390,15 @@ def generer_liste_courses(recette_nom, nb_personnes=4):
     if not recette:
         return []
     
+    registre = obtenir_index_catalogue()['registre']
     multiplicateur = nb_personnes / 4  # Recettes de base pour 4
     liste = []
     
     for ing, quantite in recette.get('ingredients', {}).items():
-        ing_clean = ing.replace('_kg', '').replace('_litre', '').replace('_unite', '').replace('_', ' ')
-        qte_ajustee = round(quantite * multiplicateur, 2)
-        
-        if '_kg' in ing:
-            unite = 'kg'
-        elif '_litre' in ing:
-            unite = 'L'
-        else:
-            unite = 'unité(s)'
-        
         liste.append({
-            'ingredient': ing_clean.capitalize(),
-            'quantite': qte_ajustee,
-            'unite': unite
+            'ingredient': registre['noms'][registre['id_par_cle'][ing]],
+            'quantite': round(quantite * multiplicateur, 2),
+            'unite': AFFICHAGE_UNITES[registre['unite_par_cle'][ing]]
         })
     
     return liste
@@ -3278,45 +2431,59 @@ def multiplier_recette(recette_nom, nb_personnes):
 # FONCTIONS SUGGESTIONS INTELLIGENTES (NOUVELLE)
 # =============================================================================
 
-def suggerer_recettes(budget_max=None, temps_max=None, difficulte=None, saison=None):
-    """Suggère des recettes selon les critères"""
-    suggestions = []
-    
-    for nom, recette in RECETTES_DETAILLEES.items():
-        score = 0
-        
-        # Filtre budget
-        if budget_max and recette.get('budget_assiette', 0) <= budget_max:
-            score += 1
-        elif budget_max:
-            continue
-        
-        # Filtre temps
-        if temps_max and recette.get('duree_min', 0) <= temps_max:
-            score += 1
-        elif temps_max:
-            continue
-        
-        # Filtre difficulté
-        if difficulte:
-            diff_recette = recette.get('difficulte', '').lower()
-            if difficulte.lower() == diff_recette:
-                score += 1
-            elif difficulte.lower() == 'facile' and diff_recette != 'facile':
-                continue
-        
-        # Filtre saison
-        if saison:
-            saison_recette = recette.get('saison', 'Toute').lower()
-            if saison.lower() in saison_recette or saison_recette == 'toute':
-                score += 1
-        
-        suggestions.append((nom, score, recette))
+def suggerer_recettes(budget_max=None, temps_max=None, difficulte=None, saison=None, pays=None, nb_max=6):
+    """Suggère des recettes selon les critères (filtres vectorisés sur la vue en colonnes)"""
+    colonnes = obtenir_index_catalogue()['colonnes']
+    nb_recettes = len(colonnes['noms'])
+    garde = np.ones(nb_recettes, dtype=bool)
+    score = np.zeros(nb_recettes, dtype=np.int64)
+    
+    # Filtre budget
+    if budget_max:
+        ok = colonnes['budget'] <= budget_max
+        garde &= ok
+        score += ok
+    
+    # Filtre temps
+    if temps_max:
+        ok = colonnes['duree'] <= temps_max
+        garde &= ok
+        score += ok
+    
+    # Filtre difficulté (les critères texte sont évalués une fois par valeur distincte)
+    if difficulte:
+        difficulte = difficulte.lower()
+        table = np.array([d == difficulte for d in colonnes['difficultes']], dtype=bool)
+        ok = table[colonnes['difficulte']]
+        score += ok
+        if difficulte == 'facile':
+            garde &= ok
+    
+    # Filtre saison
+    if saison:
+        saison = saison.lower()
+        table = np.array([saison in s or s == 'toute' for s in colonnes['saisons']], dtype=bool)
+        score += table[colonnes['saison']]
+    
+    # Filtre pays
+    if pays:
+        table = np.array([pays in p for p in colonnes['pays_valeurs']], dtype=bool)
+        garde &= table[colonnes['pays']]
+    
+    candidats = np.flatnonzero(garde)
+    if len(candidats) == 0:
+        return []
     
-    # Trier par score décroissant
-    suggestions.sort(key=lambda x: x[1], reverse=True)
+    # Top-k par score décroissant, à égalité dans l'ordre du catalogue
+    cle = -score[candidats] * nb_recettes + candidats
+    k = min(nb_max, len(candidats))
+    if k < len(candidats):
+        selection = np.argpartition(cle, k - 1)[:k]
+    else:
+        selection = np.arange(len(candidats))
+    selection = selection[np.argsort(cle[selection])]
     
-    return [(s[0], s[2]) for s in suggestions[:6]]
+    return [(colonnes['noms'][i], RECETTES_DETAILLEES[colonnes['noms'][i]]) for i in candidats[selection]]
 
 # =============================================================================
 # FONCTION DÉTECTION STRESS (NOUVELLE)
@@ -3340,24 +2507,9 @@ def detecter_stress(texte):
     
     return score_stress >= 2
 
-def detecter_recette_dans_message(texte):
-    """
-    Détecte si l'utilisateur mentionne une recette et veut la préparer.
-    Retourne le nom de la recette si trouvée, None sinon.
-    """
+def recette_mentionnee(texte):
+    """Recette du catalogue citée dans le message (nom complet ou mot clé le plus long), None sinon"""
     texte_lower = texte.lower()
-    
-    # Mots qui indiquent une intention de cuisiner
-    mots_action = [
-        "préparer", "preparer", "faire", "cuisiner", "guide", "guidez",
-        "oui", "ok", "d'accord", "daccord", "allons-y", "go", "commence",
-        "je veux", "j'aimerais", "montre", "aide", "aidez", "aider"
-    ]
-    
-    # Vérifier si c'est une demande d'action
-    est_demande_action = any(mot in texte_lower for mot in mots_action)
-    
-    # Chercher une recette mentionnée
     recette_trouvee = None
     meilleur_score = 0
     
@@ -3380,6 +2532,28 @@ def detecter_recette_dans_message(texte):
                         meilleur_score = score
                         recette_trouvee = nom_recette
     
+    return recette_trouvee
+
+def detecter_recette_dans_message(texte):
+    """
+    Détecte si l'utilisateur mentionne une recette et veut la préparer.
+    Retourne le nom de la recette si trouvée, None sinon.
+    """
+    texte_lower = texte.lower()
+    
+    # Mots qui indiquent une intention de cuisiner
+    mots_action = [
+        "préparer", "preparer", "faire", "cuisiner", "guide", "guidez",
+        "oui", "ok", "d'accord", "daccord", "allons-y", "go", "commence",
+        "je veux", "j'aimerais", "montre", "aide", "aidez", "aider"
+    ]
+    
+    # Vérifier si c'est une demande d'action
+    est_demande_action = any(mot in texte_lower for mot in mots_action)
+    
+    # Chercher une recette mentionnée
+    recette_trouvee = recette_mentionnee(texte)
+    
     # Si on a trouvé une recette ET c'est une demande d'action, lancer
     if recette_trouvee and est_demande_action:
         return recette_trouvee
@@ -3387,14 +2561,21 @@ def detecter_recette_dans_message(texte):
     # Si le message est juste "oui" ou confirmation, vérifier l'historique
     if texte_lower.strip() in ["oui", "ok", "oui.", "ok.", "d'accord", "yes", "yep", "ouais", "go", "allons-y", "oui ?"]:
         # Chercher la dernière recette mentionnée dans l'historique
-        for entry in reversed(st.session_state.historique[-6:]):
-            if entry['role'] == 'assistant':
-                for nom_recette in RECETTES_DETAILLEES.keys():
-                    if nom_recette.lower() in entry['content'].lower():
-                        return nom_recette
+        derniere = derniere_recette_citee()
+        if derniere:
+            return derniere
     
     return recette_trouvee if est_demande_action else None
 
+def derniere_recette_citee():
+    """Dernière recette nommée par Sarah dans les 6 derniers échanges, None sinon"""
+    for entry in reversed(st.session_state.historique[-6:]):
+        if entry['role'] == 'assistant':
+            for nom_recette in RECETTES_DETAILLEES.keys():
+                if nom_recette.lower() in entry['content'].lower():
+                    return nom_recette
+    return None
+
 def lancer_mode_cuisine(nom_recette):
     """Lance le mode cuisine pour une recette donnée"""
     if nom_recette in RECETTES_DETAILLEES:
@@ -3416,28 +2597,44 @@ def recettes_anti_stress():
 # FONCTIONS AUDIO
 # =============================================================================
 
-def transcribe_audio_whisper(audio_bytes):
-    """Transcription Whisper via Groq"""
+MODELE_WHISPER = "whisper-large-v3"
+
+def duree_audio(audio_bytes):
+    """Durée d'un enregistrement WAV en secondes (None si le format n'est pas lisible)"""
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as tmp_file:
-            tmp_file.write(audio_bytes)
-            tmp_path = tmp_file.name
-        
-        with open(tmp_path, 'rb') as audio_file:
-            transcription = client.audio.transcriptions.create(
-                file=audio_file,
-                model="whisper-large-v3",
-                language="fr",
-                response_format="text"
-            )
-        
-        os.unlink(tmp_path)
-        return transcription.strip()
-    except Exception as e:
+        with wave.open(io.BytesIO(audio_bytes)) as enregistrement:
+            return enregistrement.getnframes() / enregistrement.getframerate()
+    except (wave.Error, EOFError, ZeroDivisionError):
         return None
 
-def lire_texte_vocal(texte):
-    """Synthèse vocale via JavaScript"""
+def transcribe_audio_whisper(audio_bytes):
+    """Transcription Whisper via Groq"""
+    with mesurer_appel('transcribe_audio_whisper', MODELE_WHISPER) as mesure:
+        # Whisper est facturé à la durée d'audio, pas aux tokens
+        mesure.audio_secondes = duree_audio(audio_bytes)
+        try:
+            with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as tmp_file:
+                tmp_file.write(audio_bytes)
+                tmp_path = tmp_file.name
+            
+            try:
+                with open(tmp_path, 'rb') as audio_file:
+                    transcription = appel_groq(lambda c: c.audio.transcriptions.create(
+                        file=audio_file,
+                        model=MODELE_WHISPER,
+                        language="fr",
+                        response_format="text"
+                    ), jetons=0)
+            finally:
+                os.unlink(tmp_path)
+            return transcription.strip()
+        except Exception as e:
+            logger.warning("Transcription impossible: %s", e)
+            mesure.noter_echec(e)
+            return None
+
+def lire_texte_vocal(texte, interrompre=True):
+    """Synthèse vocale via JavaScript (interrompre=False: s'ajoute à la file de lecture)"""
     if not texte or len(texte) < 3:
         return
     
@@ -3470,8 +2667,14 @@ def lire_texte_vocal(texte):
     <script>
     (function() {{
         try {{
-            if (window.speechSynthesis) {{
-                window.speechSynthesis.cancel();
+            // File de lecture de la page (survit aux iframes successives et au rerun)
+            let synth = window.speechSynthesis;
+            try {{
+                if (window.parent && window.parent.speechSynthesis) synth = window.parent.speechSynthesis;
+            }} catch(e) {{}}
+            
+            if (synth && {'true' if interrompre else 'false'}) {{
+                synth.cancel();
             }}
             
             function speak() {{
@@ -3483,21 +2686,21 @@ def lire_texte_vocal(texte):
                     utterance.pitch = 1.0;
                     utterance.volume = 1.0;
                     
-                    const voices = window.speechSynthesis.getVoices();
+                    const voices = synth.getVoices();
                     const frVoice = voices.find(v => v.lang.startsWith('fr'));
                     if (frVoice) utterance.voice = frVoice;
                     
-                    window.speechSynthesis.speak(utterance);
+                    synth.speak(utterance);
                 }} catch(e) {{}}
             }}
             
-            if (window.speechSynthesis.getVoices().length === 0) {{
-                window.speechSynthesis.onvoiceschanged = function() {{
+            if (synth.getVoices().length === 0) {{
+                synth.onvoiceschanged = function() {{
                     speak();
-                    window.speechSynthesis.onvoiceschanged = null;
+                    synth.onvoiceschanged = null;
                 }};
             }} else {{
-                setTimeout(speak, 300);
+                setTimeout(speak, {300 if interrompre else 0});
             }}
         }} catch(error) {{}}
     }})();
@@ -3509,28 +2712,170 @@ def lire_texte_vocal(texte):
 # FONCTIONS COMPARATEUR ET GPS
 # =============================================================================
 
+def vecteur_ingredients(ingredients):
+    """Identifiants et quantités (unité de base) d'un dict d'ingrédients, pour la matrice de prix"""
+    colonne_inconnue = obtenir_index_catalogue()['prix']['colonne_inconnue']
+    colonnes = []
+    quantites = []
+    for ing, qte in ingredients.items():
+        id_ing, facteur = resoudre_ingredient(ing)
+        colonnes.append(colonne_inconnue if id_ing is None else id_ing)
+        quantites.append(qte * facteur)
+    return colonnes, np.array(quantites, dtype=np.float64)
+
 def comparer_prix(ingredients):
     """Compare les prix entre enseignes"""
+    index_prix = obtenir_index_catalogue()['prix']
+    noms_ing = list(ingredients.keys())
+    colonnes, quantites = vecteur_ingredients(ingredients)
+    
+    # Coût de chaque ingrédient dans chaque enseigne, en une opération
+    couts = index_prix['matrice'][:, colonnes] * quantites
+    
     comparaison = {}
     details = {}
-    
-    for enseigne, prix in PRIX_ENSEIGNES.items():
-        total = 0
-        detail_enseigne = {}
-        for ing, qte in ingredients.items():
-            prix_ing = prix.get(ing, PRIX_INGREDIENTS.get(ing, 0))
-            cout = prix_ing * qte
-            total += cout
-            detail_enseigne[ing] = round(cout, 2)
-        
-        comparaison[enseigne] = round(total, 2)
-        details[enseigne] = detail_enseigne
+    for e, enseigne in enumerate(index_prix['enseignes']):
+        couts_enseigne = couts[e].tolist()
+        comparaison[enseigne] = round(sum(couts_enseigne), 2)
+        details[enseigne] = {ing: round(cout, 2) for ing, cout in zip(noms_ing, couts_enseigne)}
     
     # Trier par prix croissant
     comparaison = dict(sorted(comparaison.items(), key=lambda x: x[1]))
     
     return comparaison, details
 
+def cout_reel_recette(recette_nom):
+    """Retourne (enseigne la moins chère, coût) pour une recette du catalogue"""
+    index = obtenir_index_catalogue()
+    rang = index['ingredients']['rang'].get(recette_nom)
+    if rang is None:
+        return None, 0
+    index_prix = index['prix']
+    couts = index_prix['couts_recettes'][rang]
+    e = int(np.argmin(couts))
+    return index_prix['enseignes'][e], round(float(couts[e]), 2)
+
+def recettes_moins_cheres(enseigne, nb_max=5):
+    """Recettes les moins chères à préparer dans une enseigne donnée"""
+    index_prix = obtenir_index_catalogue()['prix']
+    if enseigne not in index_prix['enseignes']:
+        return []
+    couts = index_prix['couts_recettes'][:, index_prix['enseignes'].index(enseigne)]
+    k = min(nb_max, len(couts))
+    if k == 0:
+        return []
+    selection = np.argpartition(couts, k - 1)[:k] if k < len(couts) else np.arange(len(couts))
+    selection = selection[np.argsort(couts[selection], kind='stable')]
+    return [(index_prix['noms'][i], round(float(couts[i]), 2)) for i in selection]
+
+def recettes_triees_par_cout():
+    """Noms des recettes triés par coût réel (enseigne la moins chère)"""
+    index_prix = obtenir_index_catalogue()['prix']
+    ordre = np.argsort(index_prix['couts_recettes'].min(axis=1), kind='stable')
+    return [index_prix['noms'][i] for i in ordre]
+
+def ingredients_menu(noms_recettes, nb_personnes=4):
+    """Additionne les ingrédients de plusieurs recettes (menu de la semaine)"""
+    multiplicateur = nb_personnes / 4  # Recettes de base pour 4
+    total = {}
+    for nom in noms_recettes:
+        recette = RECETTES_DETAILLEES.get(nom)
+        if not recette:
+            continue
+        for ing, qte in recette.get('ingredients', {}).items():
+            total[ing] = total.get(ing, 0) + qte * multiplicateur
+    return total
+
+def _cout_panier(couts, magasins, penalite_magasin):
+    """Coût d'un ensemble de magasins: chaque ingrédient au moins cher + pénalité"""
+    return float(couts[magasins].min(axis=0).sum()) + penalite_magasin * (len(magasins) - 1)
+
+def optimiser_panier(ingredients, penalite_magasin=0.0, ville=None):
+    """
+    Répartit les ingrédients entre enseignes pour minimiser le coût total.
+    Chaque magasin en plus du premier coûte penalite_magasin (déplacement).
+    Recherche locale ajout/retrait/échange de magasins: chaque mouvement est
+    évalué en une opération vectorisée, sans énumérer tous les sous-ensembles.
+    """
+    index_prix = obtenir_index_catalogue()['prix']
+    enseignes = index_prix['enseignes']
+    
+    noms_ing = list(ingredients.keys())
+    colonnes, quantites = vecteur_ingredients(ingredients)
+    couts = index_prix['matrice'][:, colonnes] * quantites
+    
+    # Ingrédients sans prix nulle part: signalés, hors optimisation
+    prix_connu = couts.max(axis=0) > 0
+    non_trouves = [ing for ing, ok in zip(noms_ing, prix_connu) if not ok]
+    noms_ing = [ing for ing, ok in zip(noms_ing, prix_connu) if ok]
+    couts = couts[:, prix_connu]
+    
+    totaux_uniques = couts.sum(axis=1)
+    meilleur_unique = int(np.argmin(totaux_uniques))
+    
+    if not noms_ing:
+        magasins = [meilleur_unique]
+    elif penalite_magasin <= 0:
+        # Sans pénalité: chaque ingrédient dans son magasin le moins cher (optimal)
+        magasins = sorted(set(np.argmin(couts, axis=0).tolist()))
+    else:
+        magasins = [meilleur_unique]
+        meilleur_cout = _cout_panier(couts, magasins, penalite_magasin)
+        while True:
+            voisins = []
+            autres = [e for e in range(len(enseignes)) if e not in magasins]
+            for e in autres:
+                voisins.append(sorted(magasins + [e]))
+            if len(magasins) > 1:
+                for m in magasins:
+                    voisins.append([x for x in magasins if x != m])
+            for m in magasins:
+                for e in autres:
+                    voisins.append(sorted([x for x in magasins if x != m] + [e]))
+            
+            amelioration = None
+            for voisin in voisins:
+                cout = _cout_panier(couts, voisin, penalite_magasin)
+                if cout < meilleur_cout - 1e-9:
+                    meilleur_cout, amelioration = cout, voisin
+            if amelioration is None:
+                break
+            magasins = amelioration
+    
+    # Répartition finale: chaque ingrédient dans le magasin retenu le moins cher
+    choix = np.array(magasins)[np.argmin(couts[magasins], axis=0)] if noms_ing else np.array([], dtype=int)
+    repartition = {}
+    for m in magasins:
+        enseigne = enseignes[m]
+        repartition[enseigne] = {'ingredients': {}, 'total': 0, 'gps': None}
+        if ville and enseigne in LIENS_ENSEIGNES:
+            repartition[enseigne]['gps'] = LIENS_ENSEIGNES[enseigne]['gps'].format(ville=ville)
+    for j, ing in enumerate(noms_ing):
+        cout = float(couts[choix[j], j])
+        panier = repartition[enseignes[int(choix[j])]]
+        panier['ingredients'][ing] = round(cout, 2)
+        panier['total'] += cout
+    for panier in repartition.values():
+        panier['total'] = round(panier['total'], 2)
+    
+    # Un magasin retenu sans aucun ingrédient n'a pas d'intérêt
+    repartition = {e: p for e, p in repartition.items() if p['ingredients'] or len(repartition) == 1}
+    
+    total = round(float(couts[choix, np.arange(len(noms_ing))].sum()), 2) if noms_ing else 0
+    penalite = round(float(penalite_magasin) * (len(repartition) - 1), 2)
+    total_unique = round(float(totaux_uniques[meilleur_unique]), 2)
+    
+    return {
+        'repartition': repartition,
+        'total': total,
+        'penalite': penalite,
+        'total_avec_penalite': round(total + penalite, 2),
+        'meilleur_magasin_unique': (enseignes[meilleur_unique], total_unique),
+        # Sur les totaux arrondis et jamais négatif (ni -0.0) quand un seul magasin est déjà le meilleur choix
+        'economie': max(0.0, round(total_unique - total - penalite, 2)) + 0.0,
+        'non_trouves': non_trouves
+    }
+
 # =============================================================================
 # FONCTIONS CONVERSION
 # =============================================================================
@@ -3620,47 +2965,953 @@ def creer_timer_html(duree_minutes, nom_timer):
     }})();
     </script>
     """
-    return html
+    return html
+
+# =============================================================================
+# CACHE DES RÉPONSES DE SARAH (mémoire LRU + base SQLite optionnelle)
+# =============================================================================
+
+TAILLE_CACHE_REPONSES = 512
+TTL_CACHE_MEMOIRE = 3600  # secondes
+TTL_CACHE_DISQUE = 24 * 3600
+
+# Base SQLite partagée entre réplicas (chemin commun); vide = cache en mémoire seulement
+FICHIER_CACHE_DISQUE = os.getenv("SARAHMIAM_CACHE_DISQUE", "")
+
+# Le prénom et la ville sont remplacés par des marqueurs: une réponse sert à tous les profils équivalents
+MARQUEURS_PROFIL = {'prenom': "{prenom}", 'ville': "{ville}"}
+
+# Le prénom n'est remplacé qu'aux places où Sarah s'adresse à l'utilisateur (un prénom peut être un mot courant: Rose, Olive...)
+SALUTATIONS = ("salut", "bonjour", "bonsoir", "coucou", "hello", "marhaba", "salam", "merci", "bravo", "allez", "courage", "yallah")
+
+class CacheReponses:
+    """Cache des réponses: LRU en mémoire avec expiration + tier SQLite optionnel"""
+    
+    def __init__(self, taille=TAILLE_CACHE_REPONSES, ttl_memoire=TTL_CACHE_MEMOIRE, fichier=FICHIER_CACHE_DISQUE, ttl_disque=TTL_CACHE_DISQUE):
+        self.taille = taille
+        self.ttl_memoire = ttl_memoire
+        self.ttl_disque = ttl_disque
+        self.fichier = fichier
+        self._entrees = OrderedDict()
+        self._verrou = threading.Lock()
+        self.stats = {'hits_memoire': 0, 'hits_disque': 0, 'misses': 0, 'ecritures': 0, 'evictions': 0, 'expirations': 0}
+        
+        if self.fichier:
+            try:
+                with closing(self._connexion()) as conn, conn:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("CREATE TABLE IF NOT EXISTS reponses (cle TEXT PRIMARY KEY, version TEXT, reponse TEXT, expire_le REAL)")
+            except sqlite3.Error as e:
+                logger.warning("Cache disque désactivé (%s): %s", self.fichier, e)
+                self.fichier = ""
+    
+    def _connexion(self):
+        return sqlite3.connect(self.fichier, timeout=2)
+    
+    def lire(self, cle):
+        """Réponse en cache pour cette clé, ou None"""
+        maintenant = time.time()
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree:
+                if entree[1] > maintenant:
+                    self._entrees.move_to_end(cle)
+                    self.stats['hits_memoire'] += 1
+                    return entree[0]
+                del self._entrees[cle]
+                self.stats['expirations'] += 1
+        
+        if self.fichier:
+            try:
+                with closing(self._connexion()) as conn:
+                    ligne = conn.execute("SELECT reponse FROM reponses WHERE cle = ? AND expire_le > ?", (cle, maintenant)).fetchone()
+            except sqlite3.Error as e:
+                logger.warning("Lecture du cache disque impossible: %s", e)
+                ligne = None
+            if ligne:
+                self._memoriser(cle, ligne[0], maintenant)
+                with self._verrou:
+                    self.stats['hits_disque'] += 1
+                return ligne[0]
+        
+        with self._verrou:
+            self.stats['misses'] += 1
+        return None
+    
+    def _memoriser(self, cle, reponse, maintenant):
+        with self._verrou:
+            self._entrees[cle] = (reponse, maintenant + self.ttl_memoire)
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.taille:
+                self._entrees.popitem(last=False)
+                self.stats['evictions'] += 1
+    
+    def ecrire(self, cle, reponse, version):
+        """Met une réponse en cache (les entrées d'autres versions du catalogue sont purgées du disque)"""
+        maintenant = time.time()
+        self._memoriser(cle, reponse, maintenant)
+        with self._verrou:
+            self.stats['ecritures'] += 1
+        
+        if self.fichier:
+            try:
+                with closing(self._connexion()) as conn, conn:
+                    conn.execute("INSERT OR REPLACE INTO reponses VALUES (?, ?, ?, ?)", (cle, version, reponse, maintenant + self.ttl_disque))
+                    conn.execute("DELETE FROM reponses WHERE expire_le <= ? OR version != ?", (maintenant, version))
+            except sqlite3.Error as e:
+                logger.warning("Écriture du cache disque impossible: %s", e)
+    
+    def taux_hits(self):
+        """Part des lectures servies par le cache (mémoire + disque)"""
+        hits = self.stats['hits_memoire'] + self.stats['hits_disque']
+        total = hits + self.stats['misses']
+        return hits / total if total else 0.0
+
+@st.cache_resource(show_spinner=False)
+def obtenir_cache_reponses():
+    """Cache des réponses unique par processus (partagé entre sessions)"""
+    return CacheReponses()
+
+def normaliser_message(texte):
+    """Message normalisé pour le cache: minuscules, sans accents ni ponctuation"""
+    texte = texte.lower().replace('œ', 'oe')
+    if not texte.isascii():
+        texte = ''.join(c for c in unicodedata.normalize('NFKD', texte) if not unicodedata.combining(c))
+    return ' '.join(re.findall(r"\w+", texte))
+
+def tranche_meteo(meteo):
+    """Météo grossière pour le cache (la réponse ne dépend que de l'ambiance)"""
+    if not meteo:
+        return 'inconnue'
+    if meteo['temp'] < 10:
+        return 'froid'
+    return 'doux' if meteo['temp'] < 22 else 'chaud'
+
+def contexte_cache_reponse():
+    """Champs du profil qui changent la réponse + version du catalogue"""
+    profil = st.session_state.profil
+    return [
+        sorted(profil.get('allergies', [])),
+        st.session_state.nb_personnes,
+        tranche_meteo(obtenir_meteo()),
+        bool(profil.get('nom')),
+        CATALOGUE.version
+    ]
+
+def cle_cache_reponse(user_input):
+    """Clé de cache: message normalisé + contexte du profil"""
+    composantes = [normaliser_message(user_input)] + contexte_cache_reponse()
+    return hashlib.sha1(json.dumps(composantes, ensure_ascii=False).encode()).hexdigest()
+
+def valeurs_profil():
+    """Prénom et ville de la session, associés à leur marqueur"""
+    return {
+        MARQUEURS_PROFIL['prenom']: st.session_state.profil.get('nom', ''),
+        MARQUEURS_PROFIL['ville']: st.session_state.ville_utilisateur or ''
+    }
+
+def motif_adresse(prenom):
+    """Prénom en position d'adresse: après une salutation, en apostrophe («Rose, ...») ou en fin de phrase («..., Rose!»)"""
+    nom = re.escape(prenom)
+    salutations = '|'.join(SALUTATIONS)
+    return re.compile(
+        rf"(?P<avant>\b(?i:{salutations})[\s,]+){nom}\b"
+        rf"|(?P<debut>(?:^|[.!?:\n]\s*)){nom}(?=\s*[,!?])"
+        rf"|(?P<virgule>,\s*){nom}(?=\s*(?:[.!?]|$))",
+        re.MULTILINE
+    )
+
+def anonymiser_reponse(reponse):
+    """Remplace le prénom (aux places d'adresse) et la ville par leurs marqueurs avant mise en cache"""
+    valeurs = valeurs_profil()
+    prenom = valeurs.pop(MARQUEURS_PROFIL['prenom'])
+    if len(prenom) >= 2:
+        reponse = motif_adresse(prenom).sub(
+            lambda m: next(g for g in m.groups() if g is not None) + MARQUEURS_PROFIL['prenom'], reponse
+        )
+    for marqueur, valeur in valeurs.items():
+        if len(valeur) >= 2:
+            reponse = re.sub(rf"\b{re.escape(valeur)}\b", marqueur, reponse)
+    return reponse
+
+def personnaliser_reponse(reponse):
+    """Remet le prénom et la ville de la session dans une réponse du cache"""
+    for marqueur, valeur in valeurs_profil().items():
+        reponse = reponse.replace(marqueur, valeur)
+    return reponse
+
+def reponse_en_cache(user_input):
+    """Retourne (clés, réponse personnalisée ou None): cache exact puis cache sémantique"""
+    if not message_autonome(user_input):
+        # Réponse liée à la conversation: ni lue ni écrite dans le cache
+        return None, None
+    cle = cle_cache_reponse(user_input)
+    reponse = obtenir_cache_reponses().lire(cle)
+    requete = None
+    cache_semantique = obtenir_cache_semantique()
+    if reponse is None and cache_semantique is not None:
+        requete = requete_semantique('sarah', user_input, contexte_cache_reponse())
+        reponse = cache_semantique.chercher(*requete)
+    return (cle, requete), (personnaliser_reponse(reponse) if reponse is not None else None)
+
+def memoriser_reponse(cles, reponse):
+    """Met en cache une réponse valide de Sarah (exact + sémantique)"""
+    if cles and reponse and not any(m in reponse for m in (MESSAGE_ERREUR_SARAH, MESSAGE_QUOTA_SARAH, MARQUEUR_REPONSE_LOCALE)):
+        cle, requete = cles
+        reponse = anonymiser_reponse(reponse)
+        obtenir_cache_reponses().ecrire(cle, reponse, CATALOGUE.version)
+        if requete:
+            obtenir_cache_semantique().ajouter(*requete, reponse)
+
+# =============================================================================
+# CACHE SÉMANTIQUE (paraphrases: embeddings locaux + index LSH en mémoire)
+# =============================================================================
+
+# Modèle sentence-transformers local (CPU), ex: "paraphrase-multilingual-MiniLM-L12-v2"; vide = n-grammes hachés
+MODELE_EMBEDDINGS = os.getenv("SARAHMIAM_MODELE_EMBEDDINGS", "")
+
+# Similarité cosinus minimale pour servir une réponse (sinon seuil propre au vectoriseur)
+SEUIL_CACHE_SEMANTIQUE = float(os.getenv("SARAHMIAM_SEUIL_SEMANTIQUE", "0") or 0)
+
+TAILLE_CACHE_SEMANTIQUE = 2048
+TTL_CACHE_SEMANTIQUE = 6 * 3600  # secondes
+
+# Peu de plans par table: les partitions sont petites, on privilégie le rappel des candidats
+NB_TABLES_LSH = 8
+NB_PLANS_LSH = 4
+
+class VectoriseurNgrammes:
+    """Vecteurs de n-grammes de caractères et de mots hachés (sans modèle, stables entre processus)"""
+    nom = "n-grammes"
+    # Pas de seuil sûr: paraphrases et questions différentes se recouvrent (0,12-0,96 contre 0-0,81 sur
+    # data/paraphrases.json), le cache sémantique n'est activé que si SARAHMIAM_SEUIL_SEMANTIQUE est défini
+    seuil = None
+    
+    def __init__(self, dimension=4096, tailles=(3, 4)):
+        self.dimension = dimension
+        self.tailles = tailles
+    
+    def encoder(self, texte):
+        texte = normaliser_message(texte)
+        vecteur = np.zeros(self.dimension, dtype=np.float32)
+        traits = [f"m:{mot}" for mot in texte.split()]
+        bordee = f" {texte} "
+        traits += [bordee[i:i + n] for n in self.tailles for i in range(len(bordee) - n + 1)]
+        for trait in traits:
+            h = zlib.crc32(trait.encode())
+            vecteur[h % self.dimension] += 1.0 if h & 0x80000000 else -1.0
+        norme = np.linalg.norm(vecteur)
+        return vecteur / norme if norme else vecteur
+
+class VectoriseurModele:
+    """Embeddings d'un petit modèle sentence-transformers exécuté sur CPU"""
+    seuil = 0.88
+    
+    def __init__(self, modele, nom):
+        self.modele = modele
+        self.nom = nom
+        self.dimension = modele.get_sentence_embedding_dimension()
+    
+    def encoder(self, texte):
+        return self.modele.encode(texte, normalize_embeddings=True).astype(np.float32)
+
+@st.cache_resource(show_spinner=False)
+def obtenir_vectoriseur():
+    """Modèle d'embeddings local si disponible, sinon vectoriseur de n-grammes"""
+    if MODELE_EMBEDDINGS:
+        try:
+            from sentence_transformers import SentenceTransformer
+            return VectoriseurModele(SentenceTransformer(MODELE_EMBEDDINGS, device='cpu'), MODELE_EMBEDDINGS)
+        except Exception as e:
+            logger.warning("Modèle d'embeddings %s indisponible (%s), repli sur les n-grammes", MODELE_EMBEDDINGS, e)
+    return VectoriseurNgrammes()
+
+class CacheSemantique:
+    """
+    Réponses retrouvées par similarité cosinus: index LSH (hyperplans aléatoires)
+    par partition, vecteurs dans un tampon circulaire, expiration par TTL.
+    """
+    
+    def __init__(self, dimension, seuil, taille=TAILLE_CACHE_SEMANTIQUE, ttl=TTL_CACHE_SEMANTIQUE, nb_tables=NB_TABLES_LSH, nb_plans=NB_PLANS_LSH):
+        self.seuil = seuil
+        self.taille = taille
+        self.ttl = ttl
+        self._plans = np.random.default_rng(0).standard_normal((nb_tables, nb_plans, dimension)).astype(np.float32)
+        self._poids_bits = 1 << np.arange(nb_plans)
+        self._vecteurs = np.zeros((taille, dimension), dtype=np.float32)
+        self._entrees = [None] * taille  # (partition, signatures, réponse, expire_le)
+        self._seaux = {}
+        self._prochain = 0
+        self._verrou = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'ajouts': 0}
+        self.similarites = deque(maxlen=1000)
+    
+    def _signatures(self, vecteur):
+        bits = (self._plans @ vecteur) > 0
+        return tuple(int(s) for s in bits @ self._poids_bits)
+    
+    def chercher(self, partition, vecteur):
+        """Réponse la plus proche dans la partition si sa similarité atteint le seuil, sinon None"""
+        signatures = self._signatures(vecteur)
+        maintenant = time.time()
+        with self._verrou:
+            candidats = set()
+            for table, signature in enumerate(signatures):
+                candidats.update(self._seaux.get((partition, table, signature), ()))
+            candidats = [i for i in candidats if self._entrees[i][3] > maintenant]
+            
+            meilleure, similarite = None, 0.0
+            if candidats:
+                similarites = self._vecteurs[candidats] @ vecteur
+                j = int(np.argmax(similarites))
+                meilleure, similarite = candidats[j], float(similarites[j])
+            self.similarites.append(similarite)
+            
+            if meilleure is not None and similarite >= self.seuil:
+                self.stats['hits'] += 1
+                return self._entrees[meilleure][2]
+            self.stats['misses'] += 1
+            return None
+    
+    def ajouter(self, partition, vecteur, reponse):
+        """Indexe une réponse (remplace la plus ancienne quand le tampon est plein)"""
+        signatures = self._signatures(vecteur)
+        with self._verrou:
+            i = self._prochain
+            self._prochain = (i + 1) % self.taille
+            ancienne = self._entrees[i]
+            if ancienne:
+                for table, signature in enumerate(ancienne[1]):
+                    seau = self._seaux.get((ancienne[0], table, signature))
+                    if seau:
+                        seau.discard(i)
+                        if not seau:
+                            del self._seaux[(ancienne[0], table, signature)]
+            self._vecteurs[i] = vecteur
+            self._entrees[i] = (partition, signatures, reponse, time.time() + self.ttl)
+            for table, signature in enumerate(signatures):
+                self._seaux.setdefault((partition, table, signature), set()).add(i)
+            self.stats['ajouts'] += 1
+    
+    def taux_hits(self):
+        """Part des recherches servies par le cache sémantique"""
+        total = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / total if total else 0.0
+    
+    def distribution_similarites(self, nb_tranches=10):
+        """Histogramme des meilleures similarités observées (tranches de 0 à 1)"""
+        comptes, bornes = np.histogram(np.clip(list(self.similarites), 0, 1), bins=nb_tranches, range=(0, 1))
+        return {f"{bornes[i]:.1f}-{bornes[i + 1]:.1f}": int(c) for i, c in enumerate(comptes)}
+
+@st.cache_resource(show_spinner=False)
+def obtenir_cache_semantique():
+    """Cache sémantique unique par processus (partagé entre sessions), None sans seuil fiable"""
+    vectoriseur = obtenir_vectoriseur()
+    seuil = SEUIL_CACHE_SEMANTIQUE or vectoriseur.seuil
+    if not seuil:
+        return None
+    return CacheSemantique(vectoriseur.dimension, seuil)
+
+def entites_message(texte):
+    """Termes du catalogue cités (recettes, ingrédients, catégories): deux questions sur des plats différents ne se mélangent pas"""
+    postings = obtenir_index_catalogue()['recherche']['postings']
+    return sorted({mot for mot in mots_texte(texte) if mot in postings})
+
+def requete_semantique(espace, texte, contexte):
+    """Retourne (partition, vecteur) d'une question: les entités partitionnent, le reste (l'intention) est vectorisé"""
+    entites = entites_message(texte)
+    composantes = [espace, entites] + list(contexte)
+    partition = hashlib.sha1(json.dumps(composantes, ensure_ascii=False).encode()).hexdigest()
+    intention = ' '.join(mot for mot in texte.split() if not set(mots_texte(mot)) & set(entites))
+    return partition, obtenir_vectoriseur().encoder(intention or texte)
+
+# =============================================================================
+# MÉMOIRE DE CONVERSATION (fenêtre en tokens + résumé glissant + archive)
+# =============================================================================
+
+# Tokens des derniers échanges envoyés avec chaque question
+BUDGET_TOKENS_HISTORIQUE = 600
+
+# Messages gardés dans la session; au-delà les plus anciens sont archivés et résumés
+NB_MESSAGES_SESSION = 20
+NB_MESSAGES_APRES_ARCHIVAGE = 10
+
+MODELE_RESUME = "llama-3.1-8b-instant"
+FICHIER_ARCHIVE_CONVERSATIONS = os.getenv(
+    "SARAHMIAM_ARCHIVE_CONVERSATIONS",
+    os.path.join(tempfile.gettempdir(), "sarahmiam-conversations.db")
+)
+
+# Messages archivés gardés N jours, purge au plus une fois par INTERVALLE_PURGE_ARCHIVE secondes
+RETENTION_ARCHIVE_JOURS = float(os.getenv("SARAHMIAM_RETENTION_CONVERSATIONS", "30"))
+INTERVALLE_PURGE_ARCHIVE = 3600
+
+# Résumé terminé mais jamais relu (session fermée sans rerun): oublié après ce délai (secondes)
+EXPIRATION_RESUME = 3600
+
+# Mots qui renvoient à un échange précédent: la réponse dépend de l'historique
+MOTS_SUITE = {'oui', 'non', 'ok', 'ca', 'cela', 'ceci', 'celle', 'celui', 'ceux', 'meme', 'aussi',
+              'plutot', 'autre', 'pareil', 'encore', 'suite', 'ensuite', 'apres', 'elle', 'lui'}
+
+def estimer_tokens(texte):
+    """Estimation rapide du nombre de tokens (~4 caractères par token)"""
+    return len(texte) // 4 + 1
+
+def fenetre_historique(user_input, budget=BUDGET_TOKENS_HISTORIQUE):
+    """Derniers échanges (hors question en cours) qui tiennent dans le budget de tokens"""
+    historique = st.session_state.historique
+    if historique and historique[-1]['role'] == 'user' and historique[-1]['content'] == user_input:
+        historique = historique[:-1]
+    
+    fenetre = []
+    for entry in reversed(historique):
+        budget -= estimer_tokens(entry['content'])
+        if budget < 0:
+            break
+        fenetre.append({'role': entry['role'], 'content': entry['content']})
+    return fenetre[::-1]
+
+def message_autonome(user_input):
+    """Vrai si la réponse ne dépend pas des échanges précédents (peut alors être mise en cache)"""
+    anterieurs = [e for e in st.session_state.historique if e['content'] != user_input]
+    if not anterieurs and not st.session_state.resume_conversation:
+        return True
+    mots = normaliser_message(user_input).split()
+    return len(mots) >= 3 and not MOTS_SUITE & set(mots) and bool(entites_message(user_input))
+
+class MemoireConversations:
+    """Résumés glissants calculés en arrière-plan + archive SQLite des anciens messages"""
+    
+    def __init__(self, fichier=FICHIER_ARCHIVE_CONVERSATIONS, retention_jours=RETENTION_ARCHIVE_JOURS):
+        self.fichier = fichier
+        self.retention = retention_jours * 86400
+        self._executeur = ThreadPoolExecutor(max_workers=2, thread_name_prefix="sarahmiam-resume")
+        self._resumes = {}  # session -> Future en cours
+        self._prets = {}    # session -> (résumé, terminé_le), en attente du prochain rerun de la session
+        self._verrou = threading.Lock()
+        self._purge_le = 0.0
+        try:
+            with closing(sqlite3.connect(self.fichier, timeout=2)) as conn, conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS messages (session TEXT, role TEXT, contenu TEXT, archive_le REAL)")
+                conn.execute("CREATE INDEX IF NOT EXISTS messages_archive_le ON messages (archive_le)")
+        except sqlite3.Error as e:
+            logger.warning("Archive des conversations désactivée (%s): %s", self.fichier, e)
+            self.fichier = ""
+    
+    def archiver(self, session, messages):
+        """Écrit des messages sortis de la session dans l'archive (et purge ceux qui ont dépassé la rétention)"""
+        if not self.fichier:
+            return
+        maintenant = time.time()
+        try:
+            with closing(sqlite3.connect(self.fichier, timeout=2)) as conn, conn:
+                conn.executemany(
+                    "INSERT INTO messages VALUES (?, ?, ?, ?)",
+                    [(session, m['role'], m['content'], maintenant) for m in messages]
+                )
+                if maintenant - self._purge_le >= INTERVALLE_PURGE_ARCHIVE:
+                    self._purge_le = maintenant
+                    conn.execute("DELETE FROM messages WHERE archive_le < ?", (maintenant - self.retention,))
+        except sqlite3.Error as e:
+            logger.warning("Archivage impossible: %s", e)
+    
+    def lancer_resume(self, session, resume, messages):
+        """Lance le résumé (ancien résumé + messages archivés) en arrière-plan; False si un résumé est en cours ou pas encore lu"""
+        with self._verrou:
+            if session in self._resumes or session in self._prets:
+                return False
+            futur = self._resumes[session] = self._executeur.submit(resumer_conversation, resume, messages)
+        # Hors du verrou: le rappel s'exécute tout de suite si le résumé est déjà terminé
+        futur.add_done_callback(lambda f: self._terminer(session, f))
+        return True
+    
+    def _terminer(self, session, futur):
+        """Range le résumé terminé (le Future n'est pas gardé) et oublie ceux que personne n'est venu chercher"""
+        try:
+            resume = futur.result()
+        except Exception as e:
+            logger.warning("Résumé de conversation échoué: %s", e)
+            resume = None
+        maintenant = time.time()
+        with self._verrou:
+            if self._resumes.get(session) is futur:
+                del self._resumes[session]
+            if resume:
+                self._prets[session] = (resume, maintenant)
+            for autre, (_, termine_le) in list(self._prets.items()):
+                if maintenant - termine_le > EXPIRATION_RESUME:
+                    del self._prets[autre]
+    
+    def resume_pret(self, session):
+        """Résumé terminé pour cette session (None si rien de neuf)"""
+        with self._verrou:
+            resume, _ = self._prets.pop(session, (None, None))
+        return resume
+
+@st.cache_resource(show_spinner=False)
+def obtenir_memoire_conversations():
+    """Mémoire des conversations unique par processus (partagée entre sessions)"""
+    return MemoireConversations()
+
+def resumer_conversation(resume, messages):
+    """Résumé glissant: intègre des messages archivés à l'ancien résumé (appel Groq, modèle léger)"""
+    echanges = '\n'.join(f"{'Utilisateur' if m['role'] == 'user' else 'Sarah'}: {m['content']}" for m in messages)
+    messages = [
+        {"role": "system", "content": "Tu résumes une conversation de cuisine entre un utilisateur et Sarah. "
+                                      "Garde en 5 lignes max: recettes choisies ou écartées, préférences, contraintes, étape en cours. "
+                                      "Réponds uniquement avec le résumé."},
+        {"role": "user", "content": f"Résumé actuel:\n{resume or '(aucun)'}\n\nNouveaux échanges:\n{echanges}"}
+    ]
+    jetons = cout_tokens(messages, 200)
+    
+    # Hors du script Streamlit (thread de fond): attente simple du Future
+    with mesurer_appel('resumer_conversation', MODELE_RESUME):
+        completion = lancer_groq(lambda c: c.chat.completions.create(
+            model=MODELE_RESUME,
+            messages=messages,
+            temperature=0.2,
+            max_tokens=200
+        ), jetons).result(timeout=TIMEOUT_GROQ + 5)
+        reconcilier_tokens(completion, jetons)
+    return completion.choices[0].message.content.strip()
+
+def entretenir_memoire():
+    """Récupère le résumé prêt, archive l'historique trop long et relance le résumé si besoin"""
+    memoire = obtenir_memoire_conversations()
+    session = st.session_state.id_session
+    
+    resume = memoire.resume_pret(session)
+    if resume:
+        st.session_state.resume_conversation = resume
+        # Seuls les messages intégrés au résumé quittent la file (un résumé échoué est relancé avec les mêmes)
+        st.session_state.a_resumer = st.session_state.a_resumer[st.session_state.nb_en_resume:]
+        st.session_state.nb_en_resume = 0
+    
+    historique = st.session_state.historique
+    if len(historique) > NB_MESSAGES_SESSION:
+        anciens = historique[:-NB_MESSAGES_APRES_ARCHIVAGE]
+        st.session_state.historique = historique[-NB_MESSAGES_APRES_ARCHIVAGE:]
+        memoire.archiver(session, anciens)
+        st.session_state.nb_archives += len(anciens)
+        st.session_state.a_resumer = st.session_state.a_resumer + anciens
+    
+    if st.session_state.a_resumer:
+        if memoire.lancer_resume(session, st.session_state.resume_conversation, st.session_state.a_resumer):
+            st.session_state.nb_en_resume = len(st.session_state.a_resumer)
+
+# =============================================================================
+# FONCTION IA - SARAH
+# =============================================================================
+
+# Au-delà, le prompt ne liste que les recettes pertinentes pour le message (taille constante)
+NB_RECETTES_PROMPT = 40
+
+MESSAGE_ERREUR_SARAH = "Désolée, j'ai un petit souci technique. Réessaie dans un instant!"
+MESSAGE_QUOTA_SARAH = "Il y a beaucoup de monde en cuisine en ce moment! Réessaie dans une minute, je suis à toi juste après."
+
+MAX_TOKENS_SARAH = 300
+
+def message_quota_sature(erreur):
+    """Message d'attente quand le quota Groq est saturé (un refus du fournisseur ralentit tout le monde)"""
+    if isinstance(erreur, RateLimitError):
+        obtenir_limiteur_groq().vider()
+    logger.warning("Quota Groq saturé: %s", erreur)
+    return MESSAGE_QUOTA_SARAH
+
+# =============================================================================
+# RÉPONDEUR LOCAL (Groq indisponible: réponse immédiate sans IA)
+# =============================================================================
+
+# Présent dans toutes les réponses locales (jamais mises en cache comme réponses de Sarah)
+MARQUEUR_REPONSE_LOCALE = "(mode express)"
+
+# Mots du message -> critères de suggerer_recettes
+CRITERES_LOCAUX = {
+    "rapide": {'temps_max': 30}, "vite": {'temps_max': 30}, "pressé": {'temps_max': 30},
+    "pas cher": {'budget_max': 3}, "petit budget": {'budget_max': 3}, "économique": {'budget_max': 3},
+    "facile": {'difficulte': 'Facile'}, "simple": {'difficulte': 'Facile'},
+    "maroc": {'pays': 'Maroc'}, "marocain": {'pays': 'Maroc'},
+    "france": {'pays': 'France'}, "français": {'pays': 'France'},
+}
+
+MOTS_SALUTATION = ("bonjour", "salut", "salam", "coucou", "hello", "bonsoir")
+
+# Mots de l'index du catalogue trop généraux pour filtrer (ou déjà lus comme critères): « un plat », « il fait chaud »
+TERMES_NON_FILTRANTS = {'plat', 'recette', 'chaud', 'rapide', 'facile', 'maroc', 'france'}
+
+# Régime végétarien: recettes sans ces ingrédients (mots des clés d'ingrédients, au singulier)
+MOTS_VEGETARIEN = ("vegetarien", "vegetarienne", "sans viande")
+MOTS_VIANDE_POISSON = {
+    'viande', 'mouton', 'agneau', 'boeuf', 'veau', 'poulet', 'pigeon', 'dinde', 'canard', 'lapin', 'merguez',
+    'saucisse', 'lardon', 'jambon', 'moelle', 'poisson', 'thon', 'anchoi', 'sardine', 'saumon', 'crevette', 'calamar'
+}
+
+# Demandes que les suggestions locales ne savent pas honorer (régimes, boissons...): la question va à Sarah
+MOTS_HORS_SUGGESTION = {
+    'vegan', 'vegetalien', 'halal', 'casher', 'kasher', 'porc', 'vin', 'boisson', 'boire', 'cocktail',
+    'calorie', 'regime', 'keto', 'diabetique', 'proteine', 'minceur'
+}
+
+def criteres_message(texte):
+    """Critères de suggerer_recettes lus dans le message (mots clés, « moins de 3€ », « en 20 min »)"""
+    texte = texte.lower()
+    criteres = {}
+    for mot, critere in CRITERES_LOCAUX.items():
+        if mot in texte:
+            criteres.update(critere)
+    budget = re.search(r"(\d+(?:[.,]\d+)?)\s*(?:€|euros?)", texte)
+    if budget:
+        criteres['budget_max'] = float(budget.group(1).replace(',', '.'))
+    duree = re.search(r"(\d+)\s*(?:min\b|minutes?)", texte)
+    if duree:
+        criteres['temps_max'] = int(duree.group(1))
+    return criteres
+
+def recettes_avec_termes(termes):
+    """Recettes qui contiennent tous les termes du catalogue (catégorie, ingrédient, nom), par score BM25 décroissant"""
+    index = obtenir_index_catalogue()
+    postings = index['recherche']['postings']
+    scores = {}
+    for i, terme in enumerate(termes):
+        rangs, poids = postings[terme]
+        trouves = dict(zip(rangs.tolist(), poids.tolist()))
+        scores = trouves if i == 0 else {r: s + trouves[r] for r, s in scores.items() if r in trouves}
+    noms = index['colonnes']['noms']
+    return [noms[r] for r in sorted(scores, key=lambda r: (-scores[r], r))]
+
+def est_vegetarienne(nom):
+    """Aucun ingrédient de viande ou de poisson"""
+    return not any(
+        set(mots_texte(ing.replace('_', ' '))) & MOTS_VIANDE_POISSON
+        for ing in RECETTES_DETAILLEES[nom].get('ingredients', {})
+    )
+
+def recettes_suggerees(texte, nb=3):
+    """
+    Recettes à proposer sans IA: catégorie, ingrédient et régime cités, critères du message
+    (météo d'abord si le message n'en donne aucun), sans allergènes; [] si la demande ne peut pas être honorée.
+    """
+    allergies = st.session_state.profil.get('allergies', [])
+    mots = set(mots_texte(texte))
+    normalise = normaliser_message(texte)
+    vegetarien = any(m in normalise for m in MOTS_VEGETARIEN)
+    # « sans poulet », « sans sucre »: exclusion que seule Sarah sait traiter (sauf la viande)
+    if mots & MOTS_HORS_SUGGESTION or (re.search(r"\bsans\b", normalise) and not vegetarien):
+        return []
+    
+    criteres = criteres_message(texte)
+    postings = obtenir_index_catalogue()['recherche']['postings']
+    # « avec des crevettes »: ingrédient demandé absent du catalogue
+    mots_criteres = {m for cle in CRITERES_LOCAUX for m in normaliser_message(cle).split()}
+    for demande in re.findall(r"\bavec (?:du |de la |de l |des |d |un |une )?(\w+)", normalise):
+        if demande not in mots_criteres and not all(m in postings for m in mots_texte(demande)):
+            return []
+    termes = [m for m in mots_texte(texte) if m in postings and m not in TERMES_NON_FILTRANTS]
+    if termes:
+        candidats = recettes_avec_termes(termes)
+        if criteres:
+            permises = {nom for nom, _ in suggerer_recettes(nb_max=len(RECETTES_DETAILLEES), **criteres)}
+            candidats = [nom for nom in candidats if nom in permises]
+    else:
+        candidats = [] if criteres or vegetarien else suggestion_meteo(obtenir_meteo())
+        candidats += [nom for nom, _ in suggerer_recettes(nb_max=len(RECETTES_DETAILLEES) if vegetarien else 4 * nb, **criteres)]
+    
+    noms = []
+    for nom in candidats:
+        if (nom in RECETTES_DETAILLEES and nom not in noms and verifier_allergenes(nom, allergies)[0]
+                and (not vegetarien or est_vegetarienne(nom))):
+            noms.append(nom)
+    return noms[:nb]
+
+def reponse_locale(user_input):
+    """Réponse déterministe sans Groq: recette citée, sinon suggestions météo et critères du message"""
+    texte = user_input.lower()
+    allergies = st.session_state.profil.get('allergies', [])
+    salutation = EXPRESSIONS_DARIJA['bienvenue'] if any(m in texte for m in MOTS_SALUTATION) else EXPRESSIONS_DARIJA['regarde']
+    
+    recette = recette_mentionnee(user_input)
+    if recette:
+        rec = RECETTES_DETAILLEES[recette]
+        ok, _ = verifier_allergenes(recette, allergies)
+        avertissement = "" if ok else " Attention, elle contient un de tes allergènes!"
+        return (
+            f"{salutation} {MARQUEUR_REPONSE_LOCALE} {recette}: {rec.get('duree_min', '?')} min, "
+            f"{str(rec.get('difficulte', '')).lower()}, environ {rec.get('budget_assiette', 0):.2f}€ l'assiette.{avertissement} "
+            f"Dis-moi « je veux préparer {recette} » et je te guide étape par étape. {EXPRESSIONS_DARIJA['commence']}"
+        )
+    
+    noms = recettes_suggerees(user_input)
+    if not noms:
+        return f"{salutation} {MARQUEUR_REPONSE_LOCALE} Je n'ai rien trouvé avec ces critères, essaie avec un plat ou un ingrédient!"
+    return (
+        f"{salutation} {MARQUEUR_REPONSE_LOCALE} Je te propose: {', '.join(noms)}. "
+        f"Dis-moi laquelle te tente et on cuisine ensemble! {EXPRESSIONS_DARIJA['bon_appetit']}"
+    )
 
 # =============================================================================
-# FONCTION IA - SARAH
+# INTENTIONS SIMPLES (classifieur local: mots clés + modèle linéaire, sans IA)
 # =============================================================================
 
-def demander_sarah(user_input, contexte="conversation"):
-    """Appelle Groq pour obtenir une réponse de Sarah"""
-    
-    # Récupérer infos contextuelles
-    meteo = obtenir_meteo()
-    profil = st.session_state.profil
+FICHIER_INTENTIONS = os.path.join(DOSSIER_DONNEES, 'intentions.json')
+
+INTENTION_CONVERSATION = 'conversation'
+
+# Probabilité minimum du modèle pour une intention hors conversation (sinon: Sarah)
+SEUIL_INTENTION = 0.6
+
+# Un mot clé ne suffit pas si le modèle donne moins que ça à son intention
+SEUIL_MOTS_CLES = 0.2
+
+# Automate de mots clés sur le message normalisé (minuscules, sans accents ni ponctuation)
+MOTS_CLES_INTENTIONS = {
+    'conversion': [
+        r"\bconver(?:ti|sion)\w*",
+        r"\bcombien de (?:grammes|tasses|ml|millilitres|kilos|kg|livres|onces|cuilleres)\b",
+        r"\b\d+ ?(?:g|kg|ml|oz|lb|c|f|grammes?|kilos?|livres?|onces?|tasses?|cups?|cuilleres?|degres?) (?:\w+ )*?(?:en|vers) \w+",
+        r"\bfahrenheit\b",
+    ],
+    'allergies': [
+        r"\ballergi\w*",
+        r"\bintolerant\w*",
+        r"\bcoeliaque\b",
+        r"\bsans (?:gluten|lactose|lait|oeufs?|poisson|soja|sesame|celeri|noix|noisettes?|amandes?|arachides?|crustaces|crevettes?|crabe|ble|fruits a coque|fruits de mer|produits laitiers)\b",
+    ],
+    'prix': [
+        r"\bcombien (?:\w+ ){0,3}?(?:coute\w*|payer|paye|depense|revien\w*)",
+        r"\brevien\w* (?:a )?combien",
+        r"\bprix\b",
+        r"\bcouts?\b",
+        r"\btarifs?\b",
+        r"(?<!pas )\bcher\b",
+    ],
+    'suggestion': [
+        r"\bidees?\b",
+        r"\bpropos\w*",
+        r"\bsugger\w*|\bsuggestions?\b",
+        r"\bconseill\w*|\brecommand\w*|\binspir\w*",
+        r"\bquoi (?:manger|cuisiner|faire a manger)\b",
+        r"\bqu est ce (?:que|qu) (?:je|j|on) (?:cuisine|mange|prepare)\w*",
+    ],
+}
+
+AUTOMATE_INTENTIONS = re.compile('|'.join(
+    f"(?P<{intention}>{'|'.join(motifs)})" for intention, motifs in MOTS_CLES_INTENTIONS.items()
+))
+
+# Mots remplacés par leur forme dans les traits du modèle
+UNITES_MESURE = {
+    'g', 'kg', 'ml', 'oz', 'lb', 'c', 'f', 'gramme', 'grammes', 'kilo', 'kilos', 'kilogramme', 'kilogrammes',
+    'millilitre', 'millilitres', 'tasse', 'tasses', 'cup', 'cups', 'cuillere', 'cuilleres', 'once', 'onces',
+    'livre', 'livres', 'degre', 'degres', 'celsius', 'fahrenheit'
+}
+
+def mots_intention(texte):
+    """Mots du message normalisé, nombres séparés des unités (« 200g » -> 200, g)"""
+    return re.findall(r"\d+|[^\W\d_]+", normaliser_message(texte))
+
+def traits_intention(mots):
+    """Traits binaires du modèle: mots, formes (<nombre>, <unite>) et paires de formes consécutives"""
+    formes = ['<nombre>' if m.isdigit() else '<unite>' if m in UNITES_MESURE else m for m in mots]
+    traits = set(mots)
+    traits.update(formes)
+    traits.update(f"{a}_{b}" for a, b in zip(formes, formes[1:]))
+    return traits
+
+class ClassifieurIntentions:
+    """Automate de mots clés + régression logistique multinomiale entraînée (entrainer_intentions.py)"""
+    
+    def __init__(self, modele):
+        self.classes = modele['classes']
+        self.biais = modele['biais']
+        self.poids = modele['poids']
+        self.seuil = modele.get('seuil', SEUIL_INTENTION)
+        self.stats = dict.fromkeys(self.classes, 0)
+    
+    @classmethod
+    def depuis_fichier(cls, fichier=FICHIER_INTENTIONS):
+        with open(fichier, encoding='utf-8') as f:
+            return cls(json.load(f))
+    
+    def probabilites(self, mots):
+        """Softmax des scores linéaires (biais + poids des traits présents)"""
+        scores = list(self.biais)
+        for trait in traits_intention(mots):
+            poids = self.poids.get(trait)
+            if poids:
+                scores = [s + p for s, p in zip(scores, poids)]
+        plus_haut = max(scores)
+        exps = [math.exp(s - plus_haut) for s in scores]
+        total = sum(exps)
+        return {classe: e / total for classe, e in zip(self.classes, exps)}
+    
+    def classer(self, texte, mots_cles=True):
+        """Retourne (intention, probabilité du modèle)"""
+        mots = mots_intention(texte)
+        probas = self.probabilites(mots)
+        
+        # Mots clés: intention certaine si le modèle ne la contredit pas franchement
+        if mots_cles:
+            trouvees = {m.lastgroup for m in AUTOMATE_INTENTIONS.finditer(' '.join(mots))}
+            if trouvees:
+                intention = max(trouvees, key=probas.get)
+                if probas[intention] >= SEUIL_MOTS_CLES:
+                    return intention, probas[intention]
+        
+        intention = max(probas, key=probas.get)
+        if intention != INTENTION_CONVERSATION and probas[intention] < self.seuil:
+            intention = INTENTION_CONVERSATION
+        return intention, probas[intention]
+
+@st.cache_resource(show_spinner=False)
+def obtenir_classifieur_intentions():
+    """Classifieur d'intentions unique par processus (None sans fichier modèle: tout va à Sarah)"""
+    try:
+        return ClassifieurIntentions.depuis_fichier()
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning("Classifieur d'intentions indisponible: %s", e)
+        return None
+
+# Mot du message -> unité de convertir_mesure
+UNITES_CONVERSION = {
+    'g': 'g', 'gramme': 'g', 'grammes': 'g', 'kg': 'kg', 'kilo': 'kg', 'kilos': 'kg', 'kilogramme': 'kg', 'kilogrammes': 'kg',
+    'ml': 'ml', 'millilitre': 'ml', 'millilitres': 'ml', 'tasse': 'tasse', 'tasses': 'tasse', 'cup': 'tasse', 'cups': 'tasse',
+    'cuillere': 'cuillere_soupe', 'cuilleres': 'cuillere_soupe', 'oz': 'oz', 'once': 'oz', 'onces': 'oz',
+    'lb': 'lb', 'livre': 'lb', 'livres': 'lb', 'c': 'celsius', 'celsius': 'celsius', 'f': 'fahrenheit', 'fahrenheit': 'fahrenheit'
+}
+
+# Unité cible quand le message n'en donne pas
+CIBLE_CONVERSION_DEFAUT = {
+    'g': 'oz', 'kg': 'lb', 'ml': 'tasse', 'tasse': 'ml', 'tasse_farine': 'g', 'tasse_sucre': 'g',
+    'cuillere_soupe': 'ml', 'oz': 'g', 'lb': 'kg', 'celsius': 'fahrenheit', 'fahrenheit': 'celsius'
+}
+
+LIBELLES_UNITES = {
+    'tasse': 'tasse(s)', 'tasse_farine': 'tasse(s) de farine', 'tasse_sucre': 'tasse(s) de sucre',
+    'cuillere_soupe': 'cuillère(s) à soupe', 'celsius': '°C', 'fahrenheit': '°F'
+}
+
+# Mots d'une question de prix qui ne désignent rien (au singulier, sans accents): le reste nomme un plat ou un ingrédient
+MOTS_QUESTION_PRIX = {
+    'abordable', 'acheter', 'avec', 'budget', 'calcule', 'cette', 'cher', 'chez', 'combien', 'comme', 'comparateur',
+    'compare', 'comparer', 'course', 'cout', 'coute', 'coutent', 'couter', 'couterait', 'depense', 'dis', 'donne',
+    'economique', 'enseigne', 'entre', 'est', 'euro', 'faire', 'fait', 'faut', 'ingredient', 'magasin', 'meilleur',
+    'moi', 'moin', 'par', 'paye', 'payer', 'personne', 'plait', 'plat', 'pour', 'pri', 'que', 'quel', 'quelle', 'quoi',
+    'recette', 'repa', 'reviendrait', 'revient', 'savoir', 'semaine', 'supermarche', 'tarif', 'total', 'tout', 'une',
+    'vai', 'veu', 'voudrai', 'intermarche'
+}
+
+def reponse_prix(user_input):
+    """Prix de la recette citée (ou en cours de discussion si le message ne nomme rien d'autre) par enseigne, via comparer_prix"""
+    recette = recette_mentionnee(user_input)
+    if recette is None:
+        # « le prix du safran »: prix d'un ingrédient, que seule Sarah sait donner
+        enseignes = {m for enseigne in CATALOGUE.prix_enseignes for m in mots_texte(enseigne)}
+        if set(mots_texte(user_input)) - MOTS_QUESTION_PRIX - enseignes:
+            return None
+        recette = st.session_state.recette_en_cours or derniere_recette_citee()
+    if recette not in RECETTES_DETAILLEES:
+        return None
+    comp, _ = comparer_prix(RECETTES_DETAILLEES[recette]['ingredients'])
+    (meilleur, prix), *autres = comp.items()
+    ailleurs = f" Ailleurs: {', '.join(f'{e} {p:.2f}€' for e, p in autres)}." if autres else ""
+    return f"💰 {recette}: le moins cher chez {meilleur}, {prix:.2f}€ d'ingrédients.{ailleurs} {EXPRESSIONS_DARIJA['bon_appetit']}"
+
+def reponse_conversion(user_input):
+    """Conversion de mesure lue dans le message (« 200 g de farine en tasses »), via convertir_mesure"""
+    mots = mots_intention(user_input)
+    nombre = re.search(r"\d+(?:[.,]\d+)?", user_input)
+    valeur = float(nombre.group().replace(',', '.')) if nombre else 1.0
+    
+    source, cible = None, None
+    for i, mot in enumerate(mots):
+        unite = UNITES_CONVERSION.get(mot)
+        if unite is None or (mot == 'c' and mots[i + 1:i + 2] == ['est']):
+            continue
+        # « en tasses », « vers celsius », « combien de grammes »: unité cible
+        if i and (mots[i - 1] in ('en', 'vers') or mots[max(0, i - 2):i] == ['combien', 'de']):
+            cible = cible or unite
+        else:
+            source = source or unite
+    if source is None and cible in ('celsius', 'fahrenheit') and ('degre' in mots or 'degres' in mots):
+        source = CIBLE_CONVERSION_DEFAUT[cible]
+    if source is None:
+        return None
     
-    # Construire le contexte
-    contexte_info = f"""
-PROFIL UTILISATEUR:
-- Prénom: {profil.get('nom', 'Ami')}
-- Ville: {st.session_state.ville_utilisateur or 'Non renseignée'}
-- Allergies: {', '.join(profil.get('allergies', [])) or 'Aucune'}
-- Nombre de personnes: {st.session_state.nb_personnes}
-"""
+    # Tasses de farine / de sucre: le poids dépend de l'ingrédient
+    for ingredient in ('farine', 'sucre'):
+        if ingredient in mots:
+            source = f"tasse_{ingredient}" if source == 'tasse' else source
+            cible = f"tasse_{ingredient}" if cible == 'tasse' or (cible is None and source == 'g') else cible
+    cible = cible or CIBLE_CONVERSION_DEFAUT.get(source)
     
-    # Météo en info secondaire seulement
-    meteo_info = ""
-    if meteo:
-        meteo_info = f"(Info: il fait {meteo['temp']}°C dehors)"
+    resultat = convertir_mesure(valeur, source, cible) if cible else None
+    if resultat is None:
+        return None
+    return f"🔄 {valeur:g} {LIBELLES_UNITES.get(source, source)} = {resultat:g} {LIBELLES_UNITES.get(cible, cible)}"
 
-    # Liste des recettes disponibles
-    recettes_ma = [n for n, r in RECETTES_DETAILLEES.items() if '🇲🇦' in r['pays']]
-    recettes_fr = [n for n, r in RECETTES_DETAILLEES.items() if '🇫🇷' in r['pays']]
-    
-    system_prompt = f"""Tu es Sarah, assistante culinaire PROFESSIONNELLE bi-culturelle France-Maroc.
+def reponse_allergies(user_input):
+    """Recette citée compatible ou non (verifier_allergenes), sinon recettes sans les allergènes cités (ou ceux du profil)"""
+    allergies = detecter_allergies(user_input) or st.session_state.profil.get('allergies', [])
+    if not allergies:
+        return None
+    libelle = ' ni '.join(a.replace('_', ' ') for a in allergies)
+    
+    # « allergique aux arachides, je peux faire la pastilla ? »: réponse sur cette recette
+    # (mais « sans poisson » ne désigne pas le Poisson Vapeur: le mot cité doit être autre chose que l'allergène)
+    recette = recette_mentionnee(user_input)
+    mots_allergenes = set(mots_texte(' '.join(m for a in allergies for m in ALLERGENES.get(a, []) + [a]).replace('_', ' ')))
+    if recette and (
+        normaliser_message(recette) in normaliser_message(user_input)
+        or (set(mots_texte(recette)) & set(mots_texte(user_input))) - mots_allergenes
+    ):
+        ok, trouves = verifier_allergenes(recette, allergies)
+        if ok:
+            return f"✅ Oui, {recette} est sans {libelle}. {EXPRESSIONS_DARIJA['bon_appetit']}"
+        ingredients = sorted({t.split(': ', 1)[1].rsplit('_', 1)[0].replace('_', ' ') for t in trouves})
+        return f"⚠️ Non, {recette} contient {', '.join(ingredients)}. Demande-moi une recette sans {libelle}!"
+    noms = filtrer_recettes_allergies(allergies)
+    if not noms:
+        return f"Aucune recette du catalogue n'est sans {libelle} pour l'instant, désolée!"
+    return (
+        f"🛡️ Sans {libelle}: {len(noms)} recettes, par exemple {', '.join(noms[:5])}. "
+        f"Laquelle te tente? {EXPRESSIONS_DARIJA['courage']}"
+    )
+
+def reponse_suggestion(user_input):
+    """Quelques recettes selon les critères du message et la météo, via suggerer_recettes"""
+    noms = recettes_suggerees(user_input)
+    if not noms:
+        return None
+    details = ', '.join(
+        f"{nom} ({RECETTES_DETAILLEES[nom].get('duree_min', '?')} min, {RECETTES_DETAILLEES[nom].get('budget_assiette', 0):.2f}€)"
+        for nom in noms
+    )
+    return f"{EXPRESSIONS_DARIJA['regarde']} Je te propose: {details}. Laquelle te tente?"
 
-{contexte_info}
-{meteo_info}
+GESTIONNAIRES_INTENTIONS = {
+    'prix': reponse_prix,
+    'conversion': reponse_conversion,
+    'allergies': reponse_allergies,
+    'suggestion': reponse_suggestion,
+}
+
+def repondre_intention(user_input):
+    """Réponse immédiate si le message est une intention simple, None s'il faut demander à Sarah"""
+    classifieur = obtenir_classifieur_intentions()
+    if classifieur is None:
+        return None
+    intention, _ = classifieur.classer(user_input)
+    gestionnaire = GESTIONNAIRES_INTENTIONS.get(intention)
+    reponse = gestionnaire(user_input) if gestionnaire else None
+    if reponse is not None:
+        classifieur.stats[intention] += 1
+    return reponse
 
-RECETTES DISPONIBLES (40 au total):
-🇲🇦 Marocaines: {', '.join(recettes_ma)}
-🇫🇷 Françaises: {', '.join(recettes_fr)}
+# Fin de phrase suivie d'un espace: la phrase est complète et peut être lue
+FIN_PHRASE = re.compile(r'[.!?…]+(?=\s)')
 
-RÈGLE CRITIQUE - RESPECTE LA DEMANDE DE L'UTILISATEUR:
+# Partie fixe du prompt système (règles + exemples), identique pour tous les appels
+REGLES_SARAH = """RÈGLE CRITIQUE - RESPECTE LA DEMANDE DE L'UTILISATEUR:
 - Si l'utilisateur demande une recette SPÉCIFIQUE (ex: "Pastilla", "Couscous", "Blanquette"), 
   tu DOIS parler de CETTE recette, PAS d'une autre!
 - Ne propose JAMAIS une autre recette si l'utilisateur en a déjà choisi une
@@ -3692,135 +3943,1057 @@ User: "Je veux une Pastilla"
 Sarah: "Par ce froid, je te recommande la Harira..." ❌ NON! L'utilisateur a choisi Pastilla!
 """
 
+def liste_recettes_prompt(noms, recettes):
+    """Noms de recettes groupés par pays, au format du prompt"""
+    recettes_ma = [n for n in noms if '🇲🇦' in recettes[n]['pays']]
+    recettes_fr = [n for n in noms if '🇫🇷' in recettes[n]['pays']]
+    return f"""🇲🇦 Marocaines: {', '.join(recettes_ma)}
+🇫🇷 Françaises: {', '.join(recettes_fr)}"""
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def prefixe_prompt_sarah(version, _recettes):
+    """Préfixe statique du prompt système (rôle, recettes, règles), construit une fois par version du catalogue"""
+    # Octet pour octet identique d'un appel à l'autre: le cache de prompt du fournisseur peut servir
+    if len(_recettes) <= NB_RECETTES_PROMPT:
+        return f"""Tu es Sarah, assistante culinaire PROFESSIONNELLE bi-culturelle France-Maroc.
+
+RECETTES DISPONIBLES ({len(_recettes)} au total):
+{liste_recettes_prompt(_recettes, _recettes)}
+
+{REGLES_SARAH}"""
+    
+    # Grand catalogue: seules les recettes pertinentes pour le message sont ajoutées ensuite
+    return f"""Tu es Sarah, assistante culinaire PROFESSIONNELLE bi-culturelle France-Maroc.
+Le catalogue compte {len(_recettes)} recettes; ta liste ci-dessous contient les plus pertinentes pour ce message.
+
+{REGLES_SARAH}"""
+
+def recettes_pertinentes_prompt(user_input):
+    """Liste des recettes du prompt pour un grand catalogue (taille constante)"""
+    if len(RECETTES_DETAILLEES) <= NB_RECETTES_PROMPT:
+        return ""
+    echanges = ' '.join(e['content'] for e in st.session_state.historique[-4:] if e['content'] != user_input)
+    noms = rechercher_recettes(
+        user_input, NB_RECETTES_PROMPT,
+        allergies=st.session_state.profil.get('allergies', []),
+        contexte=echanges
+    )
+    return f"""
+RECETTES DISPONIBLES ({len(noms)} les plus pertinentes):
+{liste_recettes_prompt(noms, RECETTES_DETAILLEES)}
+"""
+
+def contexte_prompt_sarah():
+    """Partie variable du prompt système: profil et météo de la session"""
+    meteo = obtenir_meteo()
+    profil = st.session_state.profil
+    
+    contexte_info = f"""
+PROFIL UTILISATEUR:
+- Prénom: {profil.get('nom', 'Ami')}
+- Ville: {st.session_state.ville_utilisateur or 'Non renseignée'}
+- Allergies: {', '.join(profil.get('allergies', [])) or 'Aucune'}
+- Nombre de personnes: {st.session_state.nb_personnes}
+"""
+    
+    # Météo en info secondaire seulement
+    if meteo:
+        contexte_info += f"(Info: il fait {meteo['temp']}°C dehors)\n"
+    return contexte_info
+
+def messages_sarah(user_input):
+    """Construit les messages (prompt système, résumé, derniers échanges, question) envoyés à Groq pour Sarah"""
+    system_prompt = (
+        prefixe_prompt_sarah(CATALOGUE.version, RECETTES_DETAILLEES)
+        + recettes_pertinentes_prompt(user_input)
+        + contexte_prompt_sarah()
+    )
+    if st.session_state.resume_conversation:
+        system_prompt += f"\nRÉSUMÉ DES ÉCHANGES PRÉCÉDENTS:\n{st.session_state.resume_conversation}\n"
+    return (
+        [{"role": "system", "content": system_prompt}]
+        + fenetre_historique(user_input)
+        + [{"role": "user", "content": user_input}]
+    )
+
+# =============================================================================
+# ROUTEUR DE MODÈLES (petit modèle rapide / 70B selon le message et les latences)
+# =============================================================================
+
+# Nom court -> modèle Groq et longueur maximum de réponse
+MODELES_SARAH = {
+    'rapide': {'modele': "llama-3.1-8b-instant", 'max_tokens': 150},
+    'complet': {'modele': "llama-3.3-70b-versatile", 'max_tokens': MAX_TOKENS_SARAH},
+}
+
+# Latences prises en compte (secondes): un modèle sans trafic récent redevient disponible
+FENETRE_LATENCES = 300
+MIN_MESURES_ROUTEUR = 5
+
+# Au-delà, le modèle est dégradé et l'autre prend le relais (p95 en secondes, taux d'échec)
+P95_MAX_MODELE = {'rapide': 4.0, 'complet': 10.0}
+TAUX_ECHEC_MAX_MODELE = 0.5
+
+# Messages qui demandent le grand modèle (explications, adaptations, histoire)
+MOTS_COMPLEXES = {'comment', 'pourquoi', 'explique', 'expliquer', 'difference', 'remplacer', 'remplace',
+                  'etapes', 'etape', 'histoire', 'origine', 'adapter', 'astuce', 'astuces', 'conseil', 'conseils'}
+
+# Journal tournant des décisions: un fichier par processus (la rotation n'est pas sûre entre processus)
+FICHIER_JOURNAL_ROUTAGE = os.getenv(
+    "SARAHMIAM_JOURNAL_ROUTAGE",
+    os.path.join(tempfile.gettempdir(), f"sarahmiam-routage-{os.getpid()}.jsonl")
+)
+TAILLE_MAX_JOURNAL_ROUTAGE = 5 * 1024 * 1024
+NB_FICHIERS_JOURNAL_ROUTAGE = 3
+
+def complexite_message(user_input):
+    """Modèle adapté au message seul ('rapide' ou 'complet') et la raison du choix"""
+    mots = normaliser_message(user_input).split()
+    if MOTS_COMPLEXES & set(mots) or len(mots) > 25 or user_input.count('?') > 1:
+        return 'complet', 'complexe'
+    if len(mots) <= 4:
+        return 'rapide', 'court'
+    # Une recette nommée en entier: le grand modèle suit mieux ses détails (ingrédients, étapes)
+    texte = user_input.lower()
+    if any(nom.lower() in texte for nom in RECETTES_DETAILLEES):
+        return 'complet', 'recette'
+    return ('rapide', 'simple') if len(mots) <= 12 else ('complet', 'long')
+
+class RouteurModeles:
+    """Choix du modèle par message, latences glissantes par modèle et journal JSONL des décisions"""
+    
+    def __init__(self, journal=FICHIER_JOURNAL_ROUTAGE):
+        self._mesures = {nom: deque(maxlen=200) for nom in MODELES_SARAH}
+        self._verrou = threading.Lock()
+        self.stats = dict.fromkeys(MODELES_SARAH, 0)
+        self.stats['replis'] = 0
+        
+        self._journal = logging.getLogger("sarahmiam.routage")
+        self._journal.propagate = False
+        if journal and not self._journal.handlers:
+            try:
+                gestionnaire = RotatingFileHandler(journal, maxBytes=TAILLE_MAX_JOURNAL_ROUTAGE,
+                                                   backupCount=NB_FICHIERS_JOURNAL_ROUTAGE, encoding='utf-8')
+                gestionnaire.setFormatter(logging.Formatter('%(message)s'))
+                self._journal.addHandler(gestionnaire)
+                self._journal.setLevel(logging.INFO)
+            except OSError as e:
+                logger.warning("Journal de routage impossible: %s", e)
+    
+    def _recentes(self, nom):
+        limite = time.time() - FENETRE_LATENCES
+        return [(latence, succes) for horodatage, latence, succes in self._mesures[nom] if horodatage >= limite]
+    
+    def latences(self, nom):
+        """(p50, p95) des appels réussis récents en secondes, None sans mesure"""
+        with self._verrou:
+            durees = [latence for latence, succes in self._recentes(nom) if succes]
+        if not durees:
+            return None
+        return float(np.percentile(durees, 50)), float(np.percentile(durees, 95))
+    
+    def degrade(self, nom):
+        """Vrai si le modèle est trop lent (p95) ou échoue trop souvent ces dernières minutes"""
+        with self._verrou:
+            recentes = self._recentes(nom)
+        if len(recentes) < MIN_MESURES_ROUTEUR:
+            return False
+        echecs = sum(not succes for _, succes in recentes) / len(recentes)
+        durees = [latence for latence, succes in recentes if succes]
+        return echecs >= TAUX_ECHEC_MAX_MODELE or (bool(durees) and np.percentile(durees, 95) > P95_MAX_MODELE[nom])
+    
+    def choisir(self, user_input):
+        """Décision de routage: nom du modèle, modèle Groq, max_tokens, raison, repli éventuel"""
+        nom, raison = complexite_message(user_input)
+        autre = 'complet' if nom == 'rapide' else 'rapide'
+        repli = self.degrade(nom) and not self.degrade(autre)
+        if repli:
+            raison = f"{raison}, {nom} dégradé"
+            nom = autre
+            self.stats['replis'] += 1
+        self.stats[nom] += 1
+        return dict(MODELES_SARAH[nom], nom=nom, raison=raison, repli=repli, nb_mots=len(user_input.split()))
+    
+    def enregistrer(self, choix, latence, succes, premier_token=None):
+        """Mesure d'un appel terminé + ligne de journal pour l'ajustement des règles"""
+        with self._verrou:
+            self._mesures[choix['nom']].append((time.time(), latence, succes))
+        ligne = dict(choix, horodatage=round(time.time(), 3), latence=round(latence, 3), succes=succes,
+                     premier_token=round(premier_token, 3) if premier_token is not None else None)
+        self._journal.info(json.dumps(ligne, ensure_ascii=False))
+
+@st.cache_resource(show_spinner=False)
+def obtenir_routeur():
+    """Routeur unique par processus (latences partagées par toutes les sessions)"""
+    return RouteurModeles()
+
+def requete_sarah(messages, stream=False, choix=None):
+    """Appel Groq commun aux réponses de Sarah (complètes ou en streaming), à lancer via la couche async"""
+    choix = choix or MODELES_SARAH['complet']
+    return lambda client: client.chat.completions.create(
+        model=choix['modele'],
+        messages=messages,
+        temperature=0.7,
+        max_tokens=choix['max_tokens'],
+        stream=stream
+    )
+
+def demander_sarah(user_input, contexte="conversation"):
+    """Appelle Groq pour obtenir une réponse de Sarah (ou la sert depuis le cache)"""
+    with mesurer_appel('demander_sarah') as mesure:
+        cle, reponse = reponse_en_cache(user_input)
+        if reponse is not None:
+            mesure.cache = 'hit'
+            return reponse
+        # Sans clé (question liée à la conversation): pas de cache possible
+        mesure.cache = 'miss' if cle is not None else None
+        
+        def completer():
+            messages = messages_sarah(user_input)
+            routeur = obtenir_routeur()
+            choix = routeur.choisir(user_input)
+            mesure.modele = choix['modele']
+            jetons = cout_tokens(messages, choix['max_tokens'])
+            debut = time.monotonic()
+            try:
+                completion = appel_groq(requete_sarah(messages, choix=choix), jetons)
+            except (GroqIndisponible, QuotaGroqDepasse, RateLimitError):
+                raise
+            except Exception:
+                routeur.enregistrer(choix, time.monotonic() - debut, False)
+                raise
+            routeur.enregistrer(choix, time.monotonic() - debut, True)
+            reconcilier_tokens(completion, jetons)
+            return completion.choices[0].message.content
+        
+        try:
+            if cle is None:
+                reponse = completer()
+            else:
+                # Question autonome: les sessions qui la posent en même temps partagent un seul appel
+                # (réponse anonymisée par le meneur, repersonnalisée pour chaque session)
+                reponse = personnaliser_reponse(partager_appel('sarah', cle[0], lambda: anonymiser_reponse(completer())))
+                if mesure.modele is None:
+                    mesure.cache = 'partage'
+        except GroqIndisponible as e:
+            mesure.noter_echec(e)
+            return reponse_locale(user_input)
+        except (QuotaGroqDepasse, RateLimitError) as e:
+            mesure.noter_echec(e)
+            return message_quota_sature(e)
+        except Exception as e:
+            logger.warning("Réponse de Sarah impossible: %s", e)
+            mesure.noter_echec(e)
+            return MESSAGE_ERREUR_SARAH
+        memoriser_reponse(cle, reponse)
+        return reponse
+
+def demander_sarah_flux(user_input, contexte="conversation"):
+    """Réponse de Sarah en streaming: génère le texte morceau par morceau"""
+    recu = False
+    routeur = obtenir_routeur()
+    choix = routeur.choisir(user_input)
+    mesure = MESURE_EN_COURS.get()
+    if mesure is not None:
+        mesure.modele = choix['modele']
+    debut = time.monotonic()
+    premier_token = None
     try:
-        completion = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_input}
-            ],
-            temperature=0.7,
-            max_tokens=300
-        )
-        return completion.choices[0].message.content
+        messages = messages_sarah(user_input)
+        jetons = cout_tokens(messages, choix['max_tokens'])
+        for chunk in flux_groq(requete_sarah(messages, stream=True, choix=choix), jetons):
+            usage = usage_chunk(chunk)
+            noter_usage(usage)
+            # Usage sur le dernier chunk seulement: la réservation est ajustée à la fin du flux
+            rembourser_tokens(usage, jetons)
+            morceau = chunk.choices[0].delta.content if chunk.choices else None
+            if morceau:
+                if premier_token is None:
+                    premier_token = time.monotonic() - debut
+                    noter_premier_token()
+                recu = True
+                yield morceau
+        routeur.enregistrer(choix, time.monotonic() - debut, True, premier_token)
+    except GroqIndisponible as e:
+        noter_echec(e)
+        yield reponse_locale(user_input)
+    except (QuotaGroqDepasse, RateLimitError) as e:
+        noter_echec(e)
+        yield (" " if recu else "") + message_quota_sature(e)
     except Exception as e:
-        return "Désolée, j'ai un petit souci technique. Réessaie dans un instant!"
-
-def generer_recette_ia(description):
-    """Génère une recette complète via IA"""
-    
-    system_prompt = """Tu es un chef cuisinier expert bi-culturel France-Maroc.
-Génère une recette COMPLÈTE au format JSON VALIDE avec cette structure:
-
-{
-  "nom": "Nom de la recette",
-  "pays": "🇫🇷 France" ou "🇲🇦 Maroc",
-  "categorie": "Plat principal/Dessert/Entrée/Soupe",
-  "budget_assiette": 2.50,
-  "duree_min": 45,
-  "difficulte": "Facile/Moyen/Difficile",
-  "saison": "Hiver/Été/Toute",
-  "ingredients": {"ingredient_kg": 0.5},
-  "etapes": [{"num": 1, "titre": "Titre", "description": "Description", "temperature": "Feu moyen", "duree": "10 min", "astuce": "Conseil"}],
-  "anecdote": "Histoire culturelle"
+        logger.warning("Streaming Sarah interrompu: %s", e)
+        noter_echec(e)
+        routeur.enregistrer(choix, time.monotonic() - debut, False, premier_token)
+        yield (" " if recu else "") + MESSAGE_ERREUR_SARAH
+
+def bulles_conversation(user_input, reponse, en_cours=False):
+    """HTML des bulles question/réponse (curseur pendant le streaming), textes échappés"""
+    curseur = "▌" if en_cours else ""
+    return f"""
+    <div class="message-user">
+        {echapper_html(user_input)}
+    </div>
+    <div class="message-assistant">
+        {echapper_html(reponse)}{curseur}
+    </div>
+    <div style="clear: both;"></div>
+    """
+
+def repondre_sarah(user_input, zone):
+    """Réponse de Sarah: affichée au fil des tokens (voix phrase par phrase) ou d'un bloc selon le réglage"""
+    # Prix, conversion, allergies, suggestions: réponse locale immédiate, sans appel au modèle
+    reponse = repondre_intention(user_input)
+    if reponse is not None:
+        zone.markdown(bulles_conversation(user_input, reponse), unsafe_allow_html=True)
+        lire_texte_vocal(reponse)
+        return reponse
+    
+    if not st.session_state.reponses_en_direct:
+        with st.spinner("💭 Sarah réfléchit..."):
+            reponse = demander_sarah(user_input)
+        lire_texte_vocal(reponse)
+        return reponse
+    
+    with mesurer_appel('demander_sarah_flux') as mesure:
+        cle, reponse = reponse_en_cache(user_input)
+        if reponse is not None:
+            mesure.cache = 'hit'
+            zone.markdown(bulles_conversation(user_input, reponse), unsafe_allow_html=True)
+            lire_texte_vocal(reponse)
+            return reponse
+        mesure.cache = 'miss' if cle is not None else None
+        
+        diffusee = False
+        
+        def diffuser():
+            nonlocal diffusee
+            diffusee = True
+            reponse = ""
+            deja_lu = 0
+            with zone.container():
+                bulles = st.empty()
+                bulles.markdown(bulles_conversation(user_input, "💭", en_cours=True), unsafe_allow_html=True)
+                for morceau in demander_sarah_flux(user_input):
+                    reponse += morceau
+                    bulles.markdown(bulles_conversation(user_input, reponse, en_cours=True), unsafe_allow_html=True)
+                    
+                    # Lire chaque phrase dès qu'elle est terminée (la première coupe la lecture précédente)
+                    for fin in FIN_PHRASE.finditer(reponse, deja_lu):
+                        lire_texte_vocal(reponse[deja_lu:fin.end()], interrompre=deja_lu == 0)
+                        deja_lu = fin.end()
+                
+                if reponse[deja_lu:].strip():
+                    lire_texte_vocal(reponse[deja_lu:], interrompre=deja_lu == 0)
+                bulles.markdown(bulles_conversation(user_input, reponse), unsafe_allow_html=True)
+            return reponse
+        
+        if cle is None:
+            reponse = diffuser()
+        else:
+            # Même question posée ailleurs au même moment: attendre la réponse déjà en cours de génération
+            zone.markdown(bulles_conversation(user_input, "💭", en_cours=True), unsafe_allow_html=True)
+            reponse = personnaliser_reponse(partager_appel('sarah', cle[0], lambda: anonymiser_reponse(diffuser())))
+            if not diffusee:
+                mesure.cache = 'partage'
+                zone.markdown(bulles_conversation(user_input, reponse), unsafe_allow_html=True)
+                lire_texte_vocal(reponse)
+        memoriser_reponse(cle, reponse)
+        return reponse
+
+# =============================================================================
+# RECETTES GÉNÉRÉES PAR IA (schéma JSON, analyse incrémentale, réparation ciblée)
+# =============================================================================
+
+MAX_TOKENS_RECETTE_IA = 1500
+MAX_TOKENS_REPARATION = 700
+
+# Schéma d'une entrée de RECETTES_DETAILLEES (sous-ensemble de JSON Schema, aussi donné au modèle)
+SCHEMA_RECETTE = {
+    'type': 'object',
+    'required': ['nom', 'pays', 'categorie', 'budget_assiette', 'duree_min', 'difficulte', 'saison', 'ingredients', 'etapes'],
+    'properties': {
+        'nom': {'type': 'string', 'minLength': 2},
+        'pays': {'type': 'string', 'enum': ["🇫🇷 France", "🇲🇦 Maroc"]},
+        'categorie': {'type': 'string', 'minLength': 2},
+        'budget_assiette': {'type': 'number', 'exclusiveMinimum': 0, 'maximum': 50},
+        'duree_min': {'type': 'integer', 'minimum': 1, 'maximum': 1440},
+        'difficulte': {'type': 'string', 'enum': ["Facile", "Moyen", "Difficile"]},
+        'saison': {'type': 'string', 'minLength': 3},
+        'darija': {'type': 'string'},
+        'anecdote': {'type': 'string'},
+        'ingredients': {
+            'type': 'object',
+            'minProperties': 1,
+            'propertyNames': {'pattern': r"^[a-z0-9_]+_(kg|litre|unite)$"},
+            'additionalProperties': {'type': 'number', 'exclusiveMinimum': 0},
+        },
+        'etapes': {
+            'type': 'array',
+            'minItems': 1,
+            'items': {
+                'type': 'object',
+                'required': ['num', 'titre', 'description'],
+                'properties': {
+                    'num': {'type': 'integer', 'minimum': 1},
+                    'titre': {'type': 'string', 'minLength': 2},
+                    'description': {'type': 'string', 'minLength': 10},
+                    'temperature': {'type': 'string'},
+                    'duree': {'type': 'string'},
+                    'astuce': {'type': 'string'},
+                },
+            },
+        },
+    },
+}
+
+TYPES_SCHEMA = {
+    'string': lambda v: isinstance(v, str),
+    'number': lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    'integer': lambda v: isinstance(v, int) and not isinstance(v, bool),
+    'object': lambda v: isinstance(v, dict),
+    'array': lambda v: isinstance(v, list),
 }
 
-IMPORTANT: Retourne UNIQUEMENT le JSON, rien d'autre."""
+def erreurs_schema(valeur, schema, chemin=''):
+    """Liste des (chemin, message) où la valeur ne respecte pas le schéma"""
+    type_attendu = schema.get('type')
+    if type_attendu and not TYPES_SCHEMA[type_attendu](valeur):
+        return [(chemin, f"doit être de type {type_attendu}")]
+    erreurs = []
+    if 'enum' in schema and valeur not in schema['enum']:
+        erreurs.append((chemin, f"doit valoir {' ou '.join(map(str, schema['enum']))}"))
+    if isinstance(valeur, str) and len(valeur.strip()) < schema.get('minLength', 0):
+        erreurs.append((chemin, "trop court"))
+    if type_attendu in ('number', 'integer'):
+        if 'minimum' in schema and valeur < schema['minimum']:
+            erreurs.append((chemin, f"doit être ≥ {schema['minimum']}"))
+        if 'exclusiveMinimum' in schema and valeur <= schema['exclusiveMinimum']:
+            erreurs.append((chemin, f"doit être > {schema['exclusiveMinimum']}"))
+        if 'maximum' in schema and valeur > schema['maximum']:
+            erreurs.append((chemin, f"doit être ≤ {schema['maximum']}"))
+    if isinstance(valeur, dict):
+        if len(valeur) < schema.get('minProperties', 0):
+            erreurs.append((chemin, "ne doit pas être vide"))
+        for cle in schema.get('required', []):
+            if cle not in valeur:
+                erreurs.append((f"{chemin}.{cle}".lstrip('.'), "manquant"))
+        proprietes = schema.get('properties', {})
+        for cle, sous_valeur in valeur.items():
+            sous_chemin = f"{chemin}.{cle}".lstrip('.')
+            if 'propertyNames' in schema and not re.match(schema['propertyNames']['pattern'], cle):
+                erreurs.append((sous_chemin, "nom invalide (attendu: ingredient_kg, ingredient_litre ou ingredient_unite)"))
+            sous_schema = proprietes.get(cle, schema.get('additionalProperties'))
+            if isinstance(sous_schema, dict):
+                erreurs.extend(erreurs_schema(sous_valeur, sous_schema, sous_chemin))
+    if isinstance(valeur, list):
+        if len(valeur) < schema.get('minItems', 0):
+            erreurs.append((chemin, "ne doit pas être vide"))
+        if 'items' in schema:
+            for i, element in enumerate(valeur):
+                erreurs.extend(erreurs_schema(element, schema['items'], f"{chemin}[{i}]"))
+    return erreurs
+
+def champs_invalides(erreurs):
+    """Regroupe les erreurs par champ de premier niveau (les étapes par indice: 'etapes[2]')"""
+    champs = {}
+    for chemin, message in erreurs:
+        champ = re.match(r"etapes\[\d+\]|[^.\[]+", chemin).group() if chemin else 'recette'
+        champs.setdefault(champ, []).append(f"{chemin}: {message}")
+    return champs
+
+def nombre_libre(valeur):
+    """Nombre lu dans une valeur texte (« 2,50 € » -> 2.5), la valeur telle quelle sinon"""
+    if isinstance(valeur, str):
+        nombre = re.search(r"\d+(?:[.,]\d+)?", valeur)
+        if nombre:
+            return float(nombre.group().replace(',', '.'))
+    return valeur
+
+def sans_balises(valeur):
+    """Valeur d'une recette générée sans balisage HTML (<, > et & retirés de tous les textes)"""
+    if isinstance(valeur, str):
+        return re.sub(r"\s+", " ", re.sub(r"<[^>]*>?|[<>&]", " ", valeur)).strip()
+    if isinstance(valeur, dict):
+        return {cle: sans_balises(sous_valeur) for cle, sous_valeur in valeur.items()}
+    if isinstance(valeur, list):
+        return [sans_balises(element) for element in valeur]
+    return valeur
+
+def reparer_localement(recette):
+    """Corrections sans IA des écarts fréquents (nombres en texte, casse, ingrédients, numéros d'étapes, balises)"""
+    # Les recettes générées rejoignent le catalogue partagé: aucun texte du modèle ne doit porter de HTML
+    recette = sans_balises(dict(recette))
+    for champ in ('budget_assiette', 'duree_min'):
+        if champ in recette:
+            recette[champ] = nombre_libre(recette[champ])
+    if isinstance(recette.get('duree_min'), float):
+        recette['duree_min'] = round(recette['duree_min'])
+    
+    for champ in ('pays', 'difficulte'):
+        valeur = recette.get(champ)
+        if isinstance(valeur, str):
+            for attendu in SCHEMA_RECETTE['properties'][champ]['enum']:
+                if normaliser_message(attendu) in normaliser_message(valeur) or normaliser_message(valeur).startswith(normaliser_message(attendu)[:5]):
+                    recette[champ] = attendu
+                    break
+    
+    if isinstance(recette.get('ingredients'), dict):
+        ingredients = {}
+        for nom, quantite in recette['ingredients'].items():
+            cle = '_'.join(normaliser_message(nom).split())
+            if not re.search(r"_(kg|litre|unite)$", cle):
+                cle += '_kg'
+            ingredients[cle] = nombre_libre(quantite)
+        recette['ingredients'] = ingredients
+    
+    if isinstance(recette.get('etapes'), list):
+        recette['etapes'] = [
+            dict(etape, num=i) if isinstance(etape, dict) else etape
+            for i, etape in enumerate(recette['etapes'], 1)
+        ]
+    return recette
+
+class AnalyseurRecetteJson:
+    """
+    Analyse incrémentale du JSON d'une recette reçu en streaming: signale chaque champ
+    de premier niveau et chaque étape dès qu'ils sont complets (texte autour ignoré).
+    """
+    
+    def __init__(self):
+        self.texte = ''
+        self.champs = {}
+        self.etapes = []
+        self.termine = False
+        self._pos = 0
+        self._pile = []  # conteneurs ouverts: (caractère, position)
+        self._debut_racine = None
+        self._chaine = False
+        self._echappe = False
+        self._debut_chaine = 0
+        self._attente_cle = False
+        self._cle = None
+        self._debut_valeur = None
+    
+    def ajouter(self, morceau):
+        """Ajoute un morceau de texte; retourne les événements ('champ', clé, valeur) et ('etape', étape) complétés"""
+        self.texte += morceau
+        texte = self.texte
+        evenements = []
+        for i in range(self._pos, len(texte)):
+            if self.termine:
+                break
+            c = texte[i]
+            if not self._pile:
+                # Avant l'objet racine (```json, phrase d'introduction): seule une accolade compte
+                if c == '{':
+                    self._pile.append((c, i))
+                    self._debut_racine = i
+                    self._attente_cle = True
+                continue
+            if self._chaine:
+                if self._echappe:
+                    self._echappe = False
+                elif c == '\\':
+                    self._echappe = True
+                elif c == '"':
+                    self._chaine = False
+                    if len(self._pile) == 1 and self._attente_cle:
+                        self._cle = json.loads(texte[self._debut_chaine:i + 1])
+                        self._attente_cle = False
+                continue
+            if c == '"':
+                self._chaine = True
+                self._debut_chaine = i
+            elif c in '{[':
+                self._pile.append((c, i))
+            elif c in '}]':
+                _, debut = self._pile.pop()
+                if not self._pile:
+                    self._fin_valeur(i, evenements)
+                    self.termine = True
+                elif len(self._pile) == 2 and c == '}' and self._cle == 'etapes' and self._pile[1][0] == '[':
+                    try:
+                        etape = json.loads(texte[debut:i + 1])
+                    except ValueError:
+                        continue
+                    self.etapes.append(etape)
+                    evenements.append(('etape', etape))
+            elif len(self._pile) == 1:
+                if c == ':':
+                    self._debut_valeur = i + 1
+                elif c == ',':
+                    self._fin_valeur(i, evenements)
+                    self._attente_cle = True
+        self._pos = len(texte)
+        return evenements
+    
+    def _fin_valeur(self, fin, evenements):
+        if self._cle is not None and self._debut_valeur is not None:
+            try:
+                valeur = json.loads(self.texte[self._debut_valeur:fin])
+            except ValueError:
+                valeur = None
+            else:
+                self.champs[self._cle] = valeur
+                evenements.append(('champ', self._cle, valeur))
+        self._cle = None
+        self._debut_valeur = None
+    
+    def resultat(self):
+        """Recette complète si le JSON est valide, sinon tout ce qui a pu être récupéré (champs + étapes complètes)"""
+        if self.termine:
+            try:
+                recette = json.loads(self.texte[self._debut_racine:self._pos])
+                if isinstance(recette, dict):
+                    return recette
+            except ValueError:
+                pass
+        recette = dict(self.champs)
+        if not isinstance(recette.get('etapes'), list) and self.etapes:
+            recette['etapes'] = list(self.etapes)
+        return recette
+
+def prompt_recette_ia():
+    """Prompt système de génération: schéma exact attendu, JSON seul"""
+    return f"""Tu es un chef cuisinier expert bi-culturel France-Maroc.
+Génère une recette COMPLÈTE sous forme d'un objet JSON respectant ce schéma (JSON Schema):
+
+{json.dumps(SCHEMA_RECETTE, ensure_ascii=False)}
 
+Exemple de forme:
+{{"nom": "Nom de la recette", "pays": "🇲🇦 Maroc", "categorie": "Plat principal", "budget_assiette": 2.5, "duree_min": 45,
+"difficulte": "Facile", "saison": "Toute", "ingredients": {{"tomates_kg": 0.5, "huile_olive_litre": 0.05, "oeufs_unite": 4}},
+"etapes": [{{"num": 1, "titre": "Titre", "description": "Description détaillée", "temperature": "Feu moyen", "duree": "10 min", "astuce": "Conseil"}}],
+"anecdote": "Histoire culturelle"}}
+
+Écris les étapes dans l'ordre, une par une. IMPORTANT: Retourne UNIQUEMENT le JSON, rien d'autre."""
+
+def reparer_avec_groq(recette, erreurs, description, appel=appel_groq):
+    """Redemande uniquement les champs (ou étapes) invalides, en mode JSON; retourne la recette fusionnée (inchangée si la réponse est illisible)"""
+    champs = champs_invalides(erreurs)
+    etapes_a_corriger = sorted(int(c[7:-1]) for c in champs if c.startswith('etapes['))
+    a_corriger = [c for c in champs if not c.startswith('etapes[')]
+    consignes = "\n".join(message for messages in champs.values() for message in messages)
+    format_reponse = ", ".join(f'"{c}"' for c in a_corriger)
+    if etapes_a_corriger:
+        format_reponse += (", " if format_reponse else "") + '"etapes_corrigees": {"<indice>": <étape complète>}'
+    
+    messages = [
+        {"role": "system", "content": "Tu corriges une recette JSON. Réponds UNIQUEMENT avec un objet JSON contenant "
+                                      f"les champs corrigés: {format_reponse}. Schéma: {json.dumps(SCHEMA_RECETTE, ensure_ascii=False)}"},
+        {"role": "user", "content": f"Demande: {description}\nRecette actuelle: {json.dumps(recette, ensure_ascii=False)}\n"
+                                    f"Erreurs à corriger:\n{consignes}\n"
+                                    f"Indices des étapes à réécrire: {etapes_a_corriger or 'aucun'}"}
+    ]
+    jetons = cout_tokens(messages, MAX_TOKENS_REPARATION)
+    completion = appel(lambda client: client.chat.completions.create(
+        model=MODELES_SARAH['complet']['modele'],
+        messages=messages,
+        temperature=0.2,
+        max_tokens=MAX_TOKENS_REPARATION,
+        response_format={"type": "json_object"}
+    ), jetons)
+    reconcilier_tokens(completion, jetons)
     try:
-        completion = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Crée une recette pour: {description}"}
-            ],
-            temperature=0.8,
-            max_tokens=1500
-        )
+        corrections = json.loads(completion.choices[0].message.content)
+    except ValueError:
+        corrections = None
+    if not isinstance(corrections, dict):
+        # Réponse illisible ou autre chose qu'un objet: réparation échouée, la recette reste invalide
+        logger.warning("Réparation de recette illisible: %.200s", completion.choices[0].message.content)
+        return recette
+    
+    recette = dict(recette)
+    for champ in a_corriger:
+        if champ in corrections:
+            recette[champ] = corrections[champ]
+    etapes = list(recette.get('etapes') or [])
+    for indice, etape in (corrections.get('etapes_corrigees') or {}).items():
+        if str(indice).isdigit() and int(indice) < len(etapes):
+            etapes[int(indice)] = etape
+    if etapes:
+        recette['etapes'] = etapes
+    return recette
+
+def finaliser_recette_ia(recette, description, complete=True, appel=appel_groq):
+    """Valide la recette; répare localement puis (une fois) via Groq les seuls champs invalides; None si irrécupérable"""
+    recette = reparer_localement(recette)
+    erreurs = erreurs_schema(recette, SCHEMA_RECETTE)
+    if not complete and 'etapes' in recette:
+        erreurs.append(('etapes', f"réponse coupée: garde les {len(recette['etapes'])} premières étapes et ajoute les suivantes"))
+    if not erreurs:
+        return recette
+    logger.info("Recette IA: %d champ(s) à réparer: %s", len(erreurs), erreurs[:5])
+    recette = reparer_localement(reparer_avec_groq(recette, erreurs, description, appel))
+    erreurs = erreurs_schema(recette, SCHEMA_RECETTE)
+    if erreurs:
+        logger.warning("Recette IA invalide après réparation: %s", erreurs[:5])
+        return None
+    return recette
+
+def generer_recette_ia(description, sur_evenement=None):
+    """
+    Génère une recette complète via IA depuis un thread de fond (sur_evenement(type, ...)
+    reçoit champs et étapes au fil du streaming, puis ('recette', recette) une fois validée
+    et réparée); None si la recette reste invalide.
+    """
+    messages = [
+        {"role": "system", "content": prompt_recette_ia()},
+        {"role": "user", "content": f"Crée une recette pour: {description}"}
+    ]
+    analyseur = AnalyseurRecetteJson()
+    modele = MODELES_SARAH['complet']['modele']
+    fabrique = lambda client: client.chat.completions.create(
+        model=modele,
+        messages=messages,
+        temperature=0.8,
+        max_tokens=MAX_TOKENS_RECETTE_IA,
+        stream=True
+    )
+    # Une mesure pour la génération et ses réparations éventuelles (tokens cumulés)
+    jetons = cout_tokens(messages, MAX_TOKENS_RECETTE_IA)
+    with mesurer_appel('generer_recette_ia', modele):
+        for chunk in flux_groq_hors_session(fabrique, jetons):
+            usage = usage_chunk(chunk)
+            noter_usage(usage)
+            rembourser_tokens(usage, jetons)
+            morceau = chunk.choices[0].delta.content if chunk.choices else None
+            if not morceau:
+                continue
+            noter_premier_token()
+            for evenement in analyseur.ajouter(morceau):
+                if sur_evenement:
+                    sur_evenement(*evenement)
+        
+        # JSON tronqué ou invalide: on garde ce qui est complet et on ne redemande que le reste
+        recette = finaliser_recette_ia(analyseur.resultat(), description, complete=analyseur.termine, appel=appel_groq_hors_session)
+        if recette is not None and sur_evenement:
+            sur_evenement('recette', recette)
+        return recette
+
+# =============================================================================
+# GÉNÉRATION DE RECETTES EN ARRIÈRE-PLAN (file persistante, threads, catalogue)
+# =============================================================================
+
+# Générations simultanées par processus (le reste attend dans la file persistante)
+NB_GENERATEURS_RECETTES = int(os.getenv("SARAHMIAM_GENERATEURS_RECETTES", "2"))
+
+# Attente d'un thread quand la file est vide ou Groq indisponible (secondes)
+INTERVALLE_FILE_RECETTES = 2
+
+# Liste de plats à générer au démarrage (un par ligne), facultative
+FICHIER_PLATS_A_GENERER = os.getenv("SARAHMIAM_PLATS_A_GENERER", "")
+
+# Fréquence de rafraîchissement des tâches affichées dans la session (secondes)
+INTERVALLE_SUIVI_TACHES = 2
+
+# Tâches en attente ou en cours par session, et longueur maximale d'une demande (caractères)
+MAX_TACHES_SESSION = 3
+LONGUEUR_MAX_DESCRIPTION = 200
+
+def signature_recette(recette):
+    """Empreinte d'une recette pour le dédoublonnage: catégorie + ingrédients canoniques"""
+    ingredients = sorted({nom_canonique(cle) for cle in recette.get('ingredients', {})})
+    contenu = json.dumps([normaliser_message(recette.get('categorie', '')), ingredients])
+    return hashlib.sha1(contenu.encode()).hexdigest()
+
+class GenerateurRecettes:
+    """
+    Threads qui vident la file persistante des tâches de génération: appel Groq,
+    validation, dédoublonnage, enregistrement dans la base des recettes générées
+    puis ajout incrémental au catalogue actif de toutes les sessions.
+    """
+    
+    def __init__(self, magasin, gestionnaire, nb_threads=NB_GENERATEURS_RECETTES):
+        self.magasin = magasin
+        self.gestionnaire = gestionnaire
+        self.stats = {'generees': 0, 'doublons': 0, 'erreurs': 0}
+        self._verrou = threading.Lock()
+        self._reveil = threading.Event()
+        self._noms_normalises = (None, {})
+        for i in range(nb_threads):
+            threading.Thread(target=self._travailler, name=f"sarahmiam-recettes-{i}", daemon=True).start()
+    
+    def soumettre(self, description, source='utilisateur'):
+        """Ajoute une tâche à la file (ou retrouve la même demande); retourne son identifiant, ValueError si invalide"""
+        description = ' '.join(description.split())
+        if not normaliser_message(description).strip():
+            raise ValueError("Décris ton envie en quelques mots!")
+        if len(description) > LONGUEUR_MAX_DESCRIPTION:
+            raise ValueError(f"Ta demande est trop longue: {LONGUEUR_MAX_DESCRIPTION} caractères maximum.")
+        id_tache = self.magasin.ajouter_tache(description, normaliser_message(description), source)
+        self._reveil.set()
+        return id_tache
+    
+    def _attendre(self):
+        self._reveil.wait(INTERVALLE_FILE_RECETTES)
+        self._reveil.clear()
+    
+    def _travailler(self):
+        while True:
+            try:
+                if not self._tache_suivante():
+                    self._attendre()
+            except Exception as e:
+                logger.exception("Générateur de recettes: %s", e)
+                self._attendre()
+    
+    def _tache_suivante(self):
+        """Traite la prochaine tâche de la file; False s'il faut patienter (file vide, Groq indisponible)"""
+        # Groq en panne: les tâches attendent dans la file au lieu d'épuiser leurs essais
+        if obtenir_disjoncteur().etat == 'ouvert':
+            return False
+        tache = self.magasin.prendre_tache()
+        if tache is None:
+            return False
+        try:
+            self._traiter(tache)
+        except (GroqIndisponible, QuotaGroqDepasse, RateLimitError) as e:
+            self.magasin.reprendre_tache(tache['id'], f"{type(e).__name__}: {e}", compter_essai=False)
+            return False
+        except Exception as e:
+            logger.warning("Génération de recette « %s » impossible: %s", tache['description'], e)
+            self.magasin.reprendre_tache(tache['id'], f"{type(e).__name__}: {e}")
+            with self._verrou:
+                self.stats['erreurs'] += 1
+        return True
+    
+    def _traiter(self, tache):
+        progression = {'nom': None, 'etapes': []}
         
-        response = completion.choices[0].message.content
+        def noter(type_evenement, *valeurs):
+            # Les sessions affichent chaque étape dès qu'elle est écrite, puis les étapes réparées
+            if type_evenement == 'champ' and valeurs[0] == 'nom':
+                progression['nom'] = valeurs[1]
+            elif type_evenement == 'etape':
+                progression['etapes'].append(valeurs[0])
+            elif type_evenement == 'recette':
+                progression.update(nom=valeurs[0].get('nom'), etapes=valeurs[0]['etapes'], finale=True)
+            else:
+                return
+            self.magasin.noter_progression(tache['id'], progression)
         
-        # Extraire le JSON
-        json_match = re.search(r'\{[\s\S]*\}', response)
-        if json_match:
-            recette = json.loads(json_match.group())
-            return recette
+        recette = generer_recette_ia(tache['description'], sur_evenement=noter)
+        if recette is None:
+            raise ValueError("recette invalide après réparation")
         
-        return None
-    except Exception as e:
-        return None
+        nom = ' '.join(str(recette.pop('nom')).split())
+        existante = self._nom_existant(nom)
+        signature = signature_recette(recette)
+        rang = None if existante else self.magasin.enregistrer_recette(nom, recette, signature, tache['description'])
+        if rang is None:
+            with self._verrou:
+                self.stats['doublons'] += 1
+            self.magasin.terminer_tache(tache['id'], 'doublon', existante or self.magasin.nom_par_signature(signature) or nom)
+            return
+        
+        with self._verrou:
+            self.stats['generees'] += 1
+        self.magasin.terminer_tache(tache['id'], 'terminee', nom)
+        self.gestionnaire.integrer_generees()
+    
+    def _nom_existant(self, nom):
+        """Nom de la recette du catalogue qui porte déjà ce nom (casse et accents ignorés), None sinon"""
+        catalogue = self.gestionnaire.actif
+        version, noms = self._noms_normalises
+        if version != catalogue.version:
+            noms = {normaliser_message(n): n for n in catalogue.recettes}
+            self._noms_normalises = (catalogue.version, noms)
+        return noms.get(normaliser_message(nom))
+    
+    def semer(self, fichier):
+        """Ajoute à la file les plats d'une liste (un par ligne, # pour commenter); déjà demandés ou invalides: ignorés"""
+        with open(fichier, encoding='utf-8') as f:
+            plats = [ligne.strip() for ligne in f if ligne.strip() and not ligne.startswith('#')]
+        ajoutes = 0
+        for plat in plats:
+            try:
+                self.soumettre(plat, source='liste')
+                ajoutes += 1
+            except ValueError as e:
+                logger.warning("Plat « %s » ignoré: %s", plat[:50], e)
+        return ajoutes
+
+def afficher_etapes(etapes):
+    """Étapes d'une recette (en cours d'écriture ou finale) dans un seul emplacement, redessiné en entier"""
+    with st.empty().container():
+        for etape in etapes:
+            st.markdown(f"**{etape.get('num', '')}. {echapper_html(str(etape.get('titre', '')))}** — "
+                        f"{echapper_html(str(etape.get('description', '')))}")
+
+def afficher_recette_generee(nom, recette):
+    """Résumé, ingrédients et étapes d'une recette générée"""
+    st.markdown(f"### {echapper_html(nom)}")
+    st.caption(f"{echapper_html(recette['pays'])} · {echapper_html(recette['categorie'])} · {recette['budget_assiette']}€/pers · "
+               f"{recette['duree_min']} min · {echapper_html(recette['difficulte'])} · {echapper_html(recette['saison'])}")
+    st.markdown("**Ingrédients:** " + ", ".join(
+        f"{cle.rsplit('_', 1)[0].replace('_', ' ')} ({quantite:g} {AFFICHAGE_UNITES[unite_ingredient(cle)]})"
+        for cle, quantite in recette['ingredients'].items()
+    ))
+    afficher_etapes(recette['etapes'])
+    if recette.get('anecdote'):
+        st.info(f"📖 {echapper_html(recette['anecdote'])}")
+
+def taches_session():
+    """Tâches de génération demandées dans la session, la plus récente d'abord"""
+    magasin = obtenir_magasin_recettes()
+    taches = (magasin.etat_tache(id_tache) for id_tache in reversed(st.session_state.taches_recettes))
+    return [tache for tache in taches if tache is not None]
+
+def tache_active(tache, catalogue):
+    """Vrai tant que la tâche attend, s'écrit ou que sa recette n'est pas encore au catalogue"""
+    return tache['etat'] in ('en_attente', 'en_cours') or (tache['etat'] == 'terminee' and tache['nom'] not in catalogue.recettes)
+
+@st.fragment(run_every=INTERVALLE_SUIVI_TACHES)
+def suivre_taches_recettes(ids_actifs):
+    """Relit les tâches actives de la session à intervalle régulier (la page n'attend jamais la génération)"""
+    catalogue = obtenir_gestionnaire_catalogue().actif
+    magasin = obtenir_magasin_recettes()
+    taches = [magasin.etat_tache(id_tache) for id_tache in ids_actifs]
+    if not all(tache and tache_active(tache, catalogue) for tache in taches):
+        # Une tâche s'est terminée: la page entière repart du catalogue à jour et le suivi s'arrête s'il n'en reste plus
+        st.rerun()
+    for tache in taches:
+        description = echapper_html(tache['description'])
+        if tache['etat'] == 'en_attente':
+            st.info(f"⏳ « {description} »: en attente (n°{tache['position']} dans la file)")
+        elif tache['etat'] == 'en_cours':
+            progression = tache['progression'] or {}
+            if progression.get('finale'):
+                st.info(f"✅ « {description} »: recette vérifiée, enregistrement...")
+            else:
+                st.info(f"👩‍🍳 « {description} »: Sarah écrit la recette...")
+            if progression.get('nom'):
+                st.markdown(f"### {echapper_html(str(progression['nom']))}")
+            # Étapes diffusées, remplacées par celles de la recette validée (réparées, sans les rejetées)
+            afficher_etapes(progression.get('etapes', []))
+        else:
+            st.info(f"📦 « {description} »: ajout au catalogue...")
+
+def afficher_tache_terminee(tache, catalogue):
+    """Issue d'une tâche de la session: recette ajoutée, déjà existante ou échec"""
+    description, nom = echapper_html(tache['description']), echapper_html(tache['nom'] or '')
+    if tache['etat'] == 'echec':
+        st.warning(f"Je n'ai pas réussi à écrire « {description} ». Reformule ton envie et réessaie!")
+        return
+    if tache['etat'] == 'doublon':
+        st.info(f"📖 Cette recette existe déjà dans le catalogue: **{nom}**")
+    else:
+        st.success(f"✅ **{nom}** ajoutée au catalogue")
+    if tache['nom'] in catalogue.recettes:
+        afficher_recette_generee(tache['nom'], catalogue.recettes[tache['nom']])
+
+@st.cache_resource(show_spinner=False)
+def obtenir_generateur_recettes():
+    """Threads de génération uniques par processus (la file est partagée par les réplicas)"""
+    generateur = GenerateurRecettes(obtenir_magasin_recettes(), obtenir_gestionnaire_catalogue())
+    if FICHIER_PLATS_A_GENERER:
+        try:
+            logger.info("%d plats de %s ajoutés à la file", generateur.semer(FICHIER_PLATS_A_GENERER), FICHIER_PLATS_A_GENERER)
+        except OSError as e:
+            logger.warning("Liste de plats illisible: %s", e)
+    return generateur
 
 # =============================================================================
 # FONCTION SCAN FRIGO (GROQ VISION)
 # =============================================================================
 
-def analyser_photo_frigo(image_bytes):
-    """Analyse une photo du frigo avec Groq Vision"""
-    try:
-        # Encoder en base64
-        image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-        
-        completion = client.chat.completions.create(
-            model="llama-3.2-90b-vision-preview",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": """Analyse cette photo de frigo/ingrédients. 
+MODELE_VISION = "llama-3.2-90b-vision-preview"
+
+# Image: ~1000 tokens de prompt estimés + 500 de réponse
+JETONS_VISION = 1500
+
+def lancer_analyse_photo_frigo(image_bytes):
+    """Lance l'analyse Groq Vision d'une photo du frigo sans attendre (Future, None si déjà en cours ailleurs)"""
+    if obtenir_vols_partages().en_vol(cle_vol('photo', image_bytes)):
+        return None
+    return requete_vision_frigo(image_bytes)
+
+def requete_vision_frigo(image_bytes):
+    """Appel Groq Vision sur une photo du frigo (Future)"""
+    # Encoder en base64
+    image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+    
+    return lancer_groq(lambda client: client.chat.completions.create(
+        model=MODELE_VISION,
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": """Analyse cette photo de frigo/ingrédients. 
 Liste UNIQUEMENT les ingrédients que tu vois clairement, un par ligne.
 Format: ingredient1, ingredient2, ingredient3
 Ne mets rien d'autre que la liste."""
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_base64}"
-                            }
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{image_base64}"
                         }
-                    ]
-                }
-            ],
-            max_tokens=500
-        )
+                    }
+                ]
+            }
+        ],
+        max_tokens=500
+    ), jetons=JETONS_VISION, signal=st.empty())
+
+def analyser_photo_frigo(image_bytes, analyse=None):
+    """Analyse une photo du frigo avec Groq Vision (analyse: Future déjà lancé)"""
+    analysee = False
+    
+    def analyser():
+        nonlocal analysee
+        analysee = True
+        completion = attendre_groq(analyse or requete_vision_frigo(image_bytes))
+        reconcilier_tokens(completion, JETONS_VISION)
         
         ingredients_texte = completion.choices[0].message.content
         # Parser la liste
-        ingredients = [i.strip() for i in ingredients_texte.replace('\n', ',').split(',') if i.strip()]
-        return ingredients
-        
-    except Exception as e:
-        return []
+        return [i.strip() for i in ingredients_texte.replace('\n', ',').split(',') if i.strip()]
+    
+    with mesurer_appel('analyser_photo_frigo', MODELE_VISION) as mesure:
+        try:
+            # Même photo envoyée par plusieurs sessions en même temps: un seul appel Vision
+            ingredients = list(partager_appel('photo', image_bytes, analyser))
+            if not analysee:
+                mesure.cache = 'partage'
+            return ingredients
+        except Exception as e:
+            logger.warning("Analyse de la photo impossible: %s", e)
+            mesure.noter_echec(e)
+            return []
+        finally:
+            # Appel lancé d'avance mais devenu inutile (résultat d'une autre session)
+            if analyse is not None and not analyse.done():
+                analyse.cancel()
 
 def suggerer_recettes_ingredients(ingredients_disponibles):
     """Suggère des recettes basées sur les ingrédients disponibles"""
     if not ingredients_disponibles:
         return []
     
-    suggestions = []
-    ingredients_lower = [i.lower() for i in ingredients_disponibles]
+    index_catalogue = obtenir_index_catalogue()
+    index = index_catalogue['ingredients']
+    postings = [index['par_ingredient'][id_ing] for id_ing in ingredients_correspondants(ingredients_disponibles)
+                if id_ing in index['par_ingredient']]
+    if not postings:
+        return []
     
-    for nom, recette in RECETTES_DETAILLEES.items():
-        ingredients_recette = list(recette.get('ingredients', {}).keys())
-        
-        # Compter combien d'ingrédients correspondent
-        matches = 0
-        for ing_recette in ingredients_recette:
-            ing_clean = ing_recette.lower().replace('_kg', '').replace('_', ' ')
-            for ing_dispo in ingredients_lower:
-                if ing_clean in ing_dispo or ing_dispo in ing_clean:
-                    matches += 1
-                    break
-        
-        if matches > 0:
-            pourcentage = (matches / len(ingredients_recette)) * 100
-            suggestions.append((nom, pourcentage, recette))
+    # Compter combien d'ingrédients correspondent par recette, en une passe NumPy sur les listes de l'index
+    nb = np.bincount(np.concatenate(postings), minlength=len(index['nb_ingredients']))
+    pourcentages = nb / np.maximum(index['nb_ingredients'], 1) * 100
+    candidats = np.flatnonzero(nb)
     
-    # Trier par pourcentage décroissant
-    suggestions.sort(key=lambda x: x[1], reverse=True)
+    # Les 5 meilleurs pourcentages sans trier tous les candidats (à égalité, ordre du catalogue)
+    if len(candidats) > 5:
+        seuil = np.partition(pourcentages[candidats], -5)[-5]
+        candidats = candidats[pourcentages[candidats] >= seuil]
+    meilleurs = candidats[np.lexsort((candidats, -pourcentages[candidats]))][:5]
     
-    return [(s[0], s[1], s[2]) for s in suggestions[:5]]
+    noms = index_catalogue['colonnes']['noms']
+    return [(noms[rang], float(pourcentages[rang]), RECETTES_DETAILLEES[noms[rang]]) for rang in meilleurs]
 
 
 # =============================================================================
@@ -3846,24 +5019,28 @@ def afficher_etape_cuisine():
         st.session_state.etape_cuisine = idx
     
     etape = etapes[idx]
+    # Textes du catalogue (recettes générées comprises) échappés avant d'entrer dans le HTML
+    texte = {cle: echapper_html(str(etape.get(cle, defaut))) for cle, defaut in (
+        ('titre', f'Étape {idx + 1}'), ('description', ''), ('temperature', 'N/A'), ('duree', 'N/A'), ('astuce', '')
+    )}
     
     # Affichage de l'étape
     st.markdown(f"""
     <div class="etape-box">
-        <h2>{etape.get('titre', f'Étape {idx + 1}')}</h2>
+        <h2>{texte['titre']}</h2>
         <p style="font-size: 20px; line-height: 1.6; margin: 20px 0;">
-            {etape.get('description', '')}
+            {texte['description']}
         </p>
         <div style="display: flex; justify-content: center; gap: 30px; margin-top: 20px;">
             <div style="background: rgba(255,255,255,0.2); padding: 10px 20px; border-radius: 10px;">
-                🌡️ {etape.get('temperature', 'N/A')}
+                🌡️ {texte['temperature']}
             </div>
             <div style="background: rgba(255,255,255,0.2); padding: 10px 20px; border-radius: 10px;">
-                ⏱️ {etape.get('duree', 'N/A')}
+                ⏱️ {texte['duree']}
             </div>
         </div>
         <div style="background: rgba(255,200,55,0.3); padding: 15px; border-radius: 10px; margin-top: 20px;">
-            💡 <strong>Astuce:</strong> {etape.get('astuce', '')}
+            💡 <strong>Astuce:</strong> {texte['astuce']}
         </div>
     </div>
     """, unsafe_allow_html=True)
@@ -4098,6 +5275,9 @@ def main():
     # CSS
     st.markdown(get_professional_css(), unsafe_allow_html=True)
     
+    # Mémoire de conversation: résumé prêt, archivage des anciens messages
+    entretenir_memoire()
+    
     # Géolocalisation HTML5 (prioritaire, fonctionne sur mobile)
     st.markdown(obtenir_geolocalisation_html5(), unsafe_allow_html=True)
     
@@ -4248,6 +5428,13 @@ def main():
         )
         st.session_state.profil['allergies'] = allergies_selectionnees
         
+        # Streaming des réponses
+        st.session_state.reponses_en_direct = st.checkbox(
+            "⚡ Réponses en direct (voix phrase par phrase)",
+            value=st.session_state.reponses_en_direct,
+            key="input_en_direct"
+        )
+        
         st.markdown("---")
         
         # COMPARATEUR
@@ -4279,6 +5466,39 @@ def main():
                 lien = LIENS_ENSEIGNES[meilleur]['gps'].format(ville=ville)
                 st.markdown(f'<a href="{lien}" target="_blank" class="gps-button">🚗 Y aller à {ville}</a>', unsafe_allow_html=True)
         
+        # Panier multi-magasins (recette ou menu de la semaine)
+        menu = st.multiselect("🧺 Panier malin (menu):", recettes_list, key="select_menu")
+        penalite_magasin = st.slider("Pénalité par magasin en plus (€):", 0.0, 10.0, 2.0, 0.5, key="penalite_magasin")
+        
+        if menu and st.button("🧮 Optimiser le panier", key="btn_panier"):
+            panier = optimiser_panier(ingredients_menu(menu, st.session_state.nb_personnes), penalite_magasin, ville)
+            
+            st.markdown(f"""
+            <div class="comparateur-card">
+                <div style="font-size: 18px; font-weight: bold; margin-bottom: 10px;">
+                    🧺 Panier optimisé ({len(panier['repartition'])} magasin(s))
+                </div>
+                <div class="prix-badge">{panier['total']}€</div>
+            </div>
+            """, unsafe_allow_html=True)
+            
+            for ens, detail in panier['repartition'].items():
+                st.write(f"**{ens}** · {detail['total']}€ : {', '.join(detail['ingredients'])}")
+                if detail['gps']:
+                    st.markdown(f'<a href="{detail["gps"]}" target="_blank" class="gps-button">🚗 {ens} à {ville}</a>', unsafe_allow_html=True)
+            
+            ens_unique, total_unique = panier['meilleur_magasin_unique']
+            if panier['economie'] > 0:
+                st.success(f"💡 {panier['economie']}€ d'économie vs tout chez {ens_unique} ({total_unique}€)")
+            if panier['non_trouves']:
+                st.caption(f"Sans prix: {', '.join(panier['non_trouves'])}")
+        
+        # Recettes les moins chères dans mon magasin
+        mon_enseigne = st.selectbox("Mon magasin:", list(PRIX_ENSEIGNES.keys()), key="select_enseigne")
+        if st.button("🏷️ Recettes les moins chères", key="btn_moins_cheres"):
+            for nom_moins_cher, cout in recettes_moins_cheres(mon_enseigne):
+                st.write(f"• {nom_moins_cher}: {cout}€")
+        
         st.markdown("---")
         
         # RECETTES
@@ -4286,18 +5506,28 @@ def main():
         
         # Filtres
         filtre_pays = st.radio("Filtrer:", ["Toutes", "🇲🇦 Maroc", "🇫🇷 France"], horizontal=True, key="filtre_pays")
+        tri_recettes = st.radio("Trier:", ["Catalogue", "Prix réel"], horizontal=True, key="tri_recettes")
+        
+        # Allergies de l'utilisateur en masque: un ET binaire par recette
+        masque_utilisateur = masque_allergies(allergies_selectionnees)
+        masques_recettes = obtenir_index_catalogue()['allergenes']
         
-        for nom_rec, rec in RECETTES_DETAILLEES.items():
+        noms_recettes = recettes_triees_par_cout() if tri_recettes == "Prix réel" else list(RECETTES_DETAILLEES.keys())
+        
+        for nom_rec in noms_recettes:
+            rec = RECETTES_DETAILLEES[nom_rec]
             if filtre_pays != "Toutes" and filtre_pays not in rec['pays']:
                 continue
             
-            # Vérifier allergies
-            ok, allergenes = verifier_allergenes(nom_rec, allergies_selectionnees)
-            
             with st.expander(f"{rec['pays'][:2]} {nom_rec}"):
                 st.write(f"💰 {rec['budget_assiette']}€ · ⏱️ {rec['duree_min']}min · {rec['difficulte']}")
                 
-                if not ok:
+                if tri_recettes == "Prix réel":
+                    enseigne_min, cout_min = cout_reel_recette(nom_rec)
+                    st.write(f"🛒 {cout_min}€ chez {enseigne_min} (pour 4)")
+                
+                if masques_recettes.get(nom_rec, 0) & masque_utilisateur:
+                    allergenes = details_allergenes(nom_rec, allergies_selectionnees)
                     st.warning(f"⚠️ Contient: {', '.join(allergenes)}")
                 
                 if st.button("🍳 Cuisiner", key=f"cook_{nom_rec}"):
@@ -4305,16 +5535,58 @@ def main():
                     st.session_state.mode_cuisine = True
                     st.session_state.etape_cuisine = 0
                     st.rerun()
+        
+        st.caption(f"📦 Catalogue v{CATALOGUE.version} · {len(RECETTES_DETAILLEES)} recettes")
+        generees = obtenir_magasin_recettes().stats()
+        en_file = generees.get('en_attente', 0) + generees.get('en_cours', 0)
+        if generees['recettes'] or en_file:
+            st.caption(f"✨ Recettes générées: {generees['recettes']} · {en_file} en préparation")
+        cache_reponses = obtenir_cache_reponses()
+        lectures = sum(cache_reponses.stats[k] for k in ('hits_memoire', 'hits_disque', 'misses'))
+        if lectures:
+            st.caption(f"💬 Cache réponses: {cache_reponses.taux_hits():.0%} ({lectures} questions)")
+        cache_semantique = obtenir_cache_semantique()
+        if cache_semantique is not None and cache_semantique.similarites:
+            st.caption(
+                f"🧠 Cache sémantique ({obtenir_vectoriseur().nom}): {cache_semantique.taux_hits():.0%} · "
+                f"similarité médiane {np.median(cache_semantique.similarites):.2f}"
+            )
+            with st.expander("📊 Similarités du cache sémantique"):
+                st.bar_chart(cache_semantique.distribution_similarites())
+                st.caption(f"Seuil: {cache_semantique.seuil:.2f}")
+        if obtenir_disjoncteur().etat != 'ferme':
+            st.caption("⚡ Sarah en mode express: Groq ne répond pas, réponses locales en attendant")
+        classifieur = obtenir_classifieur_intentions()
+        if classifieur and sum(classifieur.stats.values()):
+            st.caption(f"🎯 Réponses sans IA: {sum(classifieur.stats.values())} (prix, conversions, allergies, suggestions)")
+        routeur = obtenir_routeur()
+        latences = {nom: routeur.latences(nom) for nom in MODELES_SARAH}
+        if any(latences.values()):
+            st.caption("🧭 " + " · ".join(
+                f"{nom}: p50 {l[0]:.1f} s / p95 {l[1]:.1f} s" for nom, l in latences.items() if l
+            ))
+        vols = obtenir_vols_partages().stats
+        if vols['suiveurs']:
+            st.caption(f"🤝 Appels Groq évités: {vols['suiveurs']} (demandes identiques simultanées)")
+        telemetrie = obtenir_telemetrie().resume()
+        if telemetrie['appels']:
+            annules = f" · {telemetrie['annules']} annulés" if telemetrie['annules'] else ""
+            st.caption(f"💸 IA: {telemetrie['appels']} appels · ~${telemetrie['cout']:.4f} · {telemetrie['erreurs']} erreurs{annules}")
     
     # MODE CUISINE
+    if st.session_state.mode_cuisine and st.session_state.recette_en_cours not in RECETTES_DETAILLEES:
+        # Recette retirée du catalogue depuis le dernier rerun
+        st.session_state.mode_cuisine = False
+        st.session_state.recette_en_cours = None
+    
     if st.session_state.mode_cuisine and st.session_state.recette_en_cours:
         rec_nom = st.session_state.recette_en_cours
         rec = RECETTES_DETAILLEES[rec_nom]
         
         st.markdown(f"""
         <div class="card">
-            <h2 style="color: #FF6B35; text-align: center;">🍳 {rec_nom}</h2>
-            <p style="text-align: center; color: #666;">{rec['pays']} · {rec['categorie']} · {rec['duree_min']} min</p>
+            <h2 style="color: #FF6B35; text-align: center;">🍳 {echapper_html(rec_nom)}</h2>
+            <p style="text-align: center; color: #666;">{echapper_html(rec['pays'])} · {echapper_html(rec['categorie'])} · {rec['duree_min']} min</p>
         </div>
         """, unsafe_allow_html=True)
         
@@ -4371,11 +5643,14 @@ def main():
             role_class = "message-user" if entry['role'] == 'user' else "message-assistant"
             st.markdown(f"""
             <div class="{role_class}">
-                {entry['content']}
+                {echapper_html(entry['content'])}
             </div>
             <div style="clear: both;"></div>
             """, unsafe_allow_html=True)
     
+    # Réponse de Sarah en cours de streaming (sous l'historique)
+    zone_reponse = st.empty()
+    
     # ZONE INPUT
     st.markdown("""
     <div class="micro-container">
@@ -4434,10 +5709,8 @@ def main():
                     
                     # PRIORITÉ 3: Conversation normale
                     else:
-                        with st.spinner("💭 Sarah réfléchit..."):
-                            reponse = demander_sarah(text_audio)
+                        reponse = repondre_sarah(text_audio, zone_reponse)
                         st.session_state.historique.append({'role': 'assistant', 'content': reponse})
-                        lire_texte_vocal(reponse)
                         st.rerun()
     
     with col_txt:
@@ -4473,10 +5746,8 @@ def main():
             
             # PRIORITÉ 3: Conversation normale avec Sarah
             else:
-                with st.spinner("💭 Sarah réfléchit..."):
-                    reponse = demander_sarah(user_input)
+                reponse = repondre_sarah(user_input, zone_reponse)
                 st.session_state.historique.append({'role': 'assistant', 'content': reponse})
-                lire_texte_vocal(reponse)
                 st.rerun()
     
     # FONCTIONNALITÉS SUPPLÉMENTAIRES
@@ -4492,7 +5763,10 @@ def main():
             
             if st.button("🔍 Analyser"):
                 with st.spinner("🔍 Analyse en cours..."):
-                    ingredients = analyser_photo_frigo(image_bytes)
+                    # Vision Groq et météo en parallèle
+                    analyse = lancer_analyse_photo_frigo(image_bytes)
+                    suggestions_saison = suggestion_meteo(obtenir_meteo())
+                    ingredients = analyser_photo_frigo(image_bytes, analyse)
                 
                 if ingredients:
                     st.success(f"Ingrédients détectés: {', '.join(ingredients)}")
@@ -4501,10 +5775,38 @@ def main():
                     if suggestions:
                         st.markdown("### 🍳 Recettes possibles:")
                         for nom, pourcent, rec in suggestions:
-                            st.markdown(f"- **{nom}** ({pourcent:.0f}% des ingrédients)")
+                            de_saison = " 🌤️ idéal avec la météo" if nom in suggestions_saison else ""
+                            st.markdown(f"- **{nom}** ({pourcent:.0f}% des ingrédients){de_saison}")
                 else:
                     st.warning("Je n'ai pas pu identifier d'ingrédients. Essaie avec une meilleure photo!")
     
+    with st.expander("✨ Recette sur mesure"):
+        st.markdown("Décris ton envie: Sarah l'écrit en cuisine pendant que tu continues, puis l'ajoute au catalogue!")
+        description = st.text_input("Ton envie:", placeholder="Ex: un tajine végétarien aux pois chiches", key="recette_ia")
+        
+        catalogue = obtenir_gestionnaire_catalogue().actif
+        if st.button("✨ Créer"):
+            actives = [tache for tache in taches_session() if tache_active(tache, catalogue)]
+            if len(actives) >= MAX_TACHES_SESSION:
+                st.warning(f"Sarah a déjà {len(actives)} recettes en cuisine pour toi: attends qu'une soit prête!")
+            else:
+                try:
+                    id_tache = obtenir_generateur_recettes().soumettre(description)
+                except ValueError as e:
+                    st.warning(str(e))
+                else:
+                    if id_tache not in st.session_state.taches_recettes:
+                        st.session_state.taches_recettes.append(id_tache)
+        
+        # Seules les tâches actives sont relues périodiquement; les autres sont affichées une fois
+        taches = taches_session()
+        ids_actifs = [tache['id'] for tache in taches if tache_active(tache, catalogue)]
+        if ids_actifs:
+            suivre_taches_recettes(ids_actifs)
+        for tache in taches:
+            if tache['id'] not in ids_actifs:
+                afficher_tache_terminee(tache, catalogue)
+    
     with st.expander("🔄 Convertisseur"):
         st.markdown("Convertis tes mesures culinaires!")
         col1, col2, col3 = st.columns(3)
@@ -0,0 +1,337 @@
+"""
+📊 SARAH'MIAM - Catalogues synthétiques et benchmark des requêtes recettes
+
+Génère des catalogues réalistes (schéma de RECETTES_DETAILLEES, vocabulaire
+d'ingrédients et prix de data/) et mesure latence + mémoire de chaque fonction
+de requête quand le catalogue grossit.
+
+Usage:
+    python benchmark.py                                   # 1k, 10k, 100k recettes
+    python benchmark.py --tailles 1000 10000 --repetitions 50
+    python benchmark.py --json resultats.json             # sauvegarde des mesures
+    python benchmark.py --reference resultats.json        # compare à une exécution précédente
+    python benchmark.py --generer 10000 --sortie recettes_10k.json
+"""
+
+# =============================================================================
+# IMPORTS
+# =============================================================================
+
+import argparse
+import gc
+import json
+import math
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import app
+
+# =============================================================================
+# CONSTANTES
+# =============================================================================
+
+TAILLES_DEFAUT = (1_000, 10_000, 100_000)
+REPETITIONS_DEFAUT = 30
+
+# Au-delà de cet exposant (latence ~ n^k), la fonction ne passe pas à l'échelle
+EXPOSANT_ALERTE = 1.2
+
+# Ralentissement toléré par rapport à une exécution de référence
+RALENTISSEMENT_ALERTE = 1.5
+
+VARIANTES_NOMS = [
+    "de Mamie", "express", "du marché", "façon Fès", "façon Lyon", "façon Marrakech",
+    "de saison", "du dimanche", "à l'ancienne", "revisité", "du Sud", "familial",
+]
+
+QUANTITES_PAR_UNITE = {'kg': (0.05, 0.6), 'litre': (0.05, 0.5), 'unite': (1, 6)}
+
+# =============================================================================
+# GÉNÉRATEUR DE CATALOGUES
+# =============================================================================
+
+def vocabulaire_catalogue(recettes=None, prix_ingredients=None):
+    """Vocabulaire du catalogue réel: valeurs d'en-tête, quantités observées, étapes, textes"""
+    recettes = app.RECETTES_DETAILLEES if recettes is None else recettes
+    prix_ingredients = app.PRIX_INGREDIENTS if prix_ingredients is None else prix_ingredients
+
+    vocabulaire = {
+        'noms': list(recettes), 'pays': [], 'categories': [], 'difficultes': [], 'saisons': [],
+        'durees': [], 'nb_ingredients': [], 'quantites': {}, 'etapes': [], 'darija': [], 'anecdotes': [],
+    }
+    for recette in recettes.values():
+        vocabulaire['pays'].append(recette['pays'])
+        vocabulaire['categories'].append(recette['categorie'])
+        vocabulaire['difficultes'].append(recette['difficulte'])
+        vocabulaire['saisons'].append(recette['saison'])
+        vocabulaire['durees'].append(recette['duree_min'])
+        vocabulaire['nb_ingredients'].append(len(recette['ingredients']))
+        for cle, quantite in recette['ingredients'].items():
+            vocabulaire['quantites'].setdefault(cle, []).append(quantite)
+        vocabulaire['etapes'].extend(dict(etape) for etape in recette.get('etapes', ()))
+        if recette.get('darija'):
+            vocabulaire['darija'].append(recette['darija'])
+        if recette.get('anecdote'):
+            vocabulaire['anecdotes'].append(recette['anecdote'])
+
+    # Ingrédients: ceux des recettes + ceux qui ont un prix de référence
+    vocabulaire['ingredients'] = sorted(set(vocabulaire['quantites']) | set(prix_ingredients))
+    vocabulaire['prix'] = dict(prix_ingredients)
+    return vocabulaire
+
+def quantite_synthetique(cle, vocabulaire, rng):
+    """Quantité plausible pour un ingrédient (observée si possible)"""
+    observees = vocabulaire['quantites'].get(cle)
+    if observees:
+        return rng.choice(observees)
+    mini, maxi = QUANTITES_PAR_UNITE.get(app.unite_ingredient(cle), (0.05, 0.5))
+    if isinstance(mini, int):
+        return rng.randint(mini, maxi)
+    return round(rng.uniform(mini, maxi), 2)
+
+def generer_catalogue(nb_recettes, graine=0, vocabulaire=None):
+    """Génère un catalogue synthétique au schéma de RECETTES_DETAILLEES"""
+    vocabulaire = vocabulaire or vocabulaire_catalogue()
+    rng = random.Random(graine)
+    recettes = {}
+
+    for i in range(nb_recettes):
+        nb_ingredients = max(2, rng.choice(vocabulaire['nb_ingredients']) + rng.randint(-2, 2))
+        cles = rng.sample(vocabulaire['ingredients'], min(nb_ingredients, len(vocabulaire['ingredients'])))
+        ingredients = {cle: quantite_synthetique(cle, vocabulaire, rng) for cle in cles}
+
+        # Budget cohérent avec les prix de référence (4 personnes)
+        cout = sum(q * vocabulaire['prix'].get(cle, 0) for cle, q in ingredients.items())
+        budget = round(max(0.5, cout / 4 * rng.uniform(0.8, 1.2)), 2)
+
+        etapes = [dict(e) for e in rng.sample(vocabulaire['etapes'], min(rng.randint(3, 7), len(vocabulaire['etapes'])))]
+        for num, etape in enumerate(etapes, 1):
+            etape['num'] = num
+
+        nom = f"{rng.choice(vocabulaire['noms'])} {rng.choice(VARIANTES_NOMS)} n°{i + 1}"
+        recettes[nom] = {
+            'pays': rng.choice(vocabulaire['pays']),
+            'categorie': rng.choice(vocabulaire['categories']),
+            'budget_assiette': budget,
+            'duree_min': max(5, rng.choice(vocabulaire['durees']) + rng.randint(-10, 10)),
+            'difficulte': rng.choice(vocabulaire['difficultes']),
+            'saison': rng.choice(vocabulaire['saisons']),
+            'darija': rng.choice(vocabulaire['darija']) if vocabulaire['darija'] else "",
+            'ingredients': ingredients,
+            'etapes': etapes,
+            'anecdote': rng.choice(vocabulaire['anecdotes']) if vocabulaire['anecdotes'] else "",
+        }
+    return recettes
+
+def ecrire_catalogue_synthetique(recettes, dossier):
+    """Écrit recettes.json et prix.json dans un dossier, comme data/"""
+    fichier_recettes = os.path.join(dossier, 'recettes.json')
+    fichier_prix = os.path.join(dossier, 'prix.json')
+    prix = {'enseignes': {e: dict(p) for e, p in app.PRIX_ENSEIGNES.items()}, 'reference': dict(app.PRIX_INGREDIENTS)}
+    with open(fichier_recettes, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(recettes, ensure_ascii=False))
+    with open(fichier_prix, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(prix, ensure_ascii=False))
+    return fichier_recettes, fichier_prix
+
+# =============================================================================
+# SCÉNARIOS DE REQUÊTES
+# =============================================================================
+
+def scenarios_requetes(recettes, rng):
+    """Appels représentatifs de chaque fonction de requête (arguments variés)"""
+    noms = list(recettes)
+    ingredients = sorted({cle for r in recettes.values() for cle in r['ingredients']})
+    mots_frigo = sorted({mot for cle in ingredients for mot in app.mots_ingredient(cle)})
+    valeurs = lambda champ: sorted({r[champ] for r in recettes.values()})
+    pays, difficultes, saisons = valeurs('pays'), valeurs('difficulte'), valeurs('saison')
+
+    def suggerer():
+        app.suggerer_recettes(
+            budget_max=rng.choice([None, 2.0, 3.5, 5.0]),
+            temps_max=rng.choice([None, 20, 45, 90]),
+            difficulte=rng.choice([None] + difficultes),
+            saison=rng.choice([None] + saisons),
+            pays=rng.choice([None] + pays),
+        )
+
+    def filtrer_allergies():
+        app.filtrer_recettes_allergies(rng.sample(list(app.ALLERGENES), rng.randint(1, 3)))
+
+    def suggerer_ingredients():
+        app.suggerer_recettes_ingredients(rng.sample(mots_frigo, min(rng.randint(2, 6), len(mots_frigo))))
+
+    def comparer():
+        app.comparer_prix(dict(recettes[rng.choice(noms)]['ingredients']))
+
+    def detecter():
+        if rng.random() < 0.5:
+            message = f"Je veux préparer {rng.choice(noms).lower()} ce soir"
+        else:
+            message = "Fais-moi une idée de dîner rapide et pas cher"
+        app.detecter_recette_dans_message(message)
+
+    return {
+        'suggerer_recettes': suggerer,
+        'filtrer_recettes_allergies': filtrer_allergies,
+        'suggerer_recettes_ingredients': suggerer_ingredients,
+        'comparer_prix': comparer,
+        'detecter_recette_dans_message': detecter,
+        'recettes_anti_stress': app.recettes_anti_stress,
+    }
+
+# =============================================================================
+# MESURES
+# =============================================================================
+
+def mesurer_fonction(fonction, repetitions):
+    """Latences (ms) sur plusieurs appels + pic mémoire alloué par un appel (Ko)"""
+    fonction()  # échauffement (caches, imports paresseux)
+    latences = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction()
+        latences.append((time.perf_counter() - debut) * 1000)
+
+    gc.collect()
+    tracemalloc.start()
+    fonction()
+    pic = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latences.sort()
+    return {
+        'p50_ms': statistics.median(latences),
+        'p95_ms': latences[min(len(latences) - 1, int(len(latences) * 0.95))],
+        'memoire_ko': pic / 1024,
+    }
+
+def mesurer_taille(nb_recettes, repetitions, vocabulaire, graine=0):
+    """Génère un catalogue de nb_recettes et mesure chargement + chaque requête"""
+    dossier = tempfile.mkdtemp(prefix='sarahmiam-bench-')
+    try:
+        fichiers = ecrire_catalogue_synthetique(generer_catalogue(nb_recettes, graine, vocabulaire), dossier)
+
+        # Premier chargement: compilation SQLite + en-têtes + index (chronométré)
+        debut = time.perf_counter()
+        app.charger_instantane(*fichiers)
+        duree_chargement = time.perf_counter() - debut
+
+        # Second chargement (base déjà compilée) sous tracemalloc: mémoire résidente de l'instantané
+        gc.collect()
+        tracemalloc.start()
+        catalogue = app.charger_instantane(*fichiers)
+        gc.collect()
+        memoire_catalogue = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        app.utiliser_catalogue(catalogue)
+        resultats = {
+            'chargement': {'duree_s': duree_chargement, 'memoire_mo': memoire_catalogue / 1024 ** 2},
+            'fonctions': {},
+        }
+        rng = random.Random(graine)
+        for nom, fonction in scenarios_requetes(catalogue.recettes, rng).items():
+            resultats['fonctions'][nom] = mesurer_fonction(fonction, repetitions)
+        return resultats
+    finally:
+        shutil.rmtree(dossier, ignore_errors=True)
+
+def exposant_croissance(tailles, valeurs):
+    """Exposant k de valeur ~ taille^k entre les deux plus grandes tailles"""
+    if len(tailles) < 2 or valeurs[-2] <= 0 or valeurs[-1] <= 0:
+        return None
+    return math.log(valeurs[-1] / valeurs[-2]) / math.log(tailles[-1] / tailles[-2])
+
+# =============================================================================
+# RAPPORT
+# =============================================================================
+
+def afficher_rapport(mesures, reference=None):
+    """Tableau latence/mémoire par taille, avec alertes de passage à l'échelle et de régression"""
+    tailles = sorted(mesures)
+    alertes = []
+
+    print("\nChargement du catalogue (compilation + index; mémoire résidente)")
+    print(f"{'recettes':>10} {'durée (s)':>10} {'mémoire (Mo)':>13}")
+    for taille in tailles:
+        c = mesures[taille]['chargement']
+        print(f"{taille:>10} {c['duree_s']:>10.2f} {c['memoire_mo']:>13.1f}")
+
+    fonctions = list(mesures[tailles[0]]['fonctions'])
+    for fonction in fonctions:
+        print(f"\n{fonction}")
+        print(f"{'recettes':>10} {'p50 (ms)':>10} {'p95 (ms)':>10} {'pic mém. (Ko)':>14}")
+        for taille in tailles:
+            m = mesures[taille]['fonctions'][fonction]
+            ligne = f"{taille:>10} {m['p50_ms']:>10.3f} {m['p95_ms']:>10.3f} {m['memoire_ko']:>14.1f}"
+            ref = (reference or {}).get(taille, {}).get('fonctions', {}).get(fonction)
+            if ref and ref['p50_ms'] > 0:
+                ratio = m['p50_ms'] / ref['p50_ms']
+                ligne += f"   x{ratio:.2f} vs référence"
+                if ratio > RALENTISSEMENT_ALERTE:
+                    alertes.append(f"{fonction} à {taille} recettes: x{ratio:.2f} plus lent que la référence")
+            print(ligne)
+
+        exposant = exposant_croissance(tailles, [mesures[t]['fonctions'][fonction]['p50_ms'] for t in tailles])
+        if exposant is not None:
+            print(f"{'':>10} croissance ~ n^{exposant:.2f}")
+            if exposant > EXPOSANT_ALERTE:
+                alertes.append(f"{fonction}: croissance ~ n^{exposant:.2f} (superlinéaire)")
+
+    if alertes:
+        print("\n⚠️ Alertes")
+        for alerte in alertes:
+            print(f"  - {alerte}")
+    return alertes
+
+# =============================================================================
+# LANCEMENT
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des requêtes recettes sur catalogues synthétiques")
+    parser.add_argument('--tailles', type=int, nargs='+', default=list(TAILLES_DEFAUT), help="Nombres de recettes à tester")
+    parser.add_argument('--repetitions', type=int, default=REPETITIONS_DEFAUT, help="Appels mesurés par fonction et par taille")
+    parser.add_argument('--graine', type=int, default=0, help="Graine du générateur (catalogues reproductibles)")
+    parser.add_argument('--json', help="Fichier où sauvegarder les mesures")
+    parser.add_argument('--reference', help="Mesures d'une exécution précédente à comparer")
+    parser.add_argument('--generer', type=int, help="Génère seulement un catalogue de N recettes (avec --sortie)")
+    parser.add_argument('--sortie', help="Fichier JSON du catalogue généré")
+    args = parser.parse_args()
+
+    vocabulaire = vocabulaire_catalogue()
+
+    if args.generer:
+        recettes = generer_catalogue(args.generer, args.graine, vocabulaire)
+        sortie = args.sortie or f"recettes_{args.generer}.json"
+        with open(sortie, 'w', encoding='utf-8') as f:
+            json.dump(recettes, f, ensure_ascii=False, indent=1)
+        print(f"{len(recettes)} recettes écrites dans {sortie}")
+        return
+
+    mesures = {}
+    for taille in sorted(args.tailles):
+        print(f"Catalogue de {taille} recettes...", flush=True)
+        mesures[taille] = mesurer_taille(taille, args.repetitions, vocabulaire, args.graine)
+
+    reference = None
+    if args.reference:
+        with open(args.reference, encoding='utf-8') as f:
+            reference = {int(t): m for t, m in json.load(f).items()}
+
+    alertes = afficher_rapport(mesures, reference)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(mesures, f, indent=2)
+
+    raise SystemExit(1 if alertes and reference else 0)
+
+if __name__ == "__main__":
+    main()
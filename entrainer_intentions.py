@@ -0,0 +1,260 @@
+"""
+🎯 SARAH'MIAM - Entraînement et évaluation du classifieur d'intentions
+
+Entraîne la régression logistique de data/intentions.json sur les exemples
+annotés de data/intentions_exemples.json, mesure l'exactitude (validation
+croisée) et la latence du classifieur complet (mots clés + modèle), puis
+écrit le modèle utilisé par l'app.
+
+Usage:
+    python entrainer_intentions.py                        # rapport + data/intentions.json
+    python entrainer_intentions.py --plis 10 --graine 1
+    python entrainer_intentions.py --rapport rapport.json --sans-ecrire
+"""
+
+# =============================================================================
+# IMPORTS
+# =============================================================================
+
+import argparse
+import json
+import os
+import random
+import time
+
+import numpy as np
+
+import app
+
+# =============================================================================
+# CONSTANTES
+# =============================================================================
+
+FICHIER_EXEMPLES = os.path.join(app.DOSSIER_DONNEES, 'intentions_exemples.json')
+
+ITERATIONS = 400
+PAS_APPRENTISSAGE = 0.5
+REGULARISATION_L2 = 1e-3
+
+# Poids plus petits que ça (pour toutes les classes) ne sont pas écrits dans le modèle
+POIDS_MINIMUM = 0.01
+
+# Budget de latence par message (ms), vérifié sur le 99e centile
+BUDGET_LATENCE_MS = 1.0
+
+# =============================================================================
+# DONNÉES
+# =============================================================================
+
+def charger_exemples(fichier=FICHIER_EXEMPLES):
+    """Liste de (texte, intention) et liste des classes (conversation en dernier)"""
+    with open(fichier, encoding='utf-8') as f:
+        par_intention = json.load(f)
+    classes = sorted(c for c in par_intention if c != app.INTENTION_CONVERSATION) + [app.INTENTION_CONVERSATION]
+    exemples = [(texte, intention) for intention in classes for texte in par_intention[intention]]
+    return exemples, classes
+
+def plis_stratifies(exemples, nb_plis, graine):
+    """Répartit les exemples en plis de même composition par intention"""
+    rng = random.Random(graine)
+    plis = [[] for _ in range(nb_plis)]
+    par_intention = {}
+    for exemple in exemples:
+        par_intention.setdefault(exemple[1], []).append(exemple)
+    for groupe in par_intention.values():
+        groupe = groupe[:]
+        rng.shuffle(groupe)
+        for i, exemple in enumerate(groupe):
+            plis[i % nb_plis].append(exemple)
+    return plis
+
+# =============================================================================
+# ENTRAÎNEMENT (régression logistique multinomiale, descente de gradient)
+# =============================================================================
+
+def entrainer(exemples, classes, iterations=ITERATIONS):
+    """Modèle {classes, biais, poids par trait, seuil} au format de ClassifieurIntentions"""
+    traits = [app.traits_intention(app.mots_intention(texte)) for texte, _ in exemples]
+    vocabulaire = sorted(set().union(*traits))
+    colonnes = {trait: j for j, trait in enumerate(vocabulaire)}
+
+    x = np.zeros((len(exemples), len(vocabulaire)))
+    for i, traits_exemple in enumerate(traits):
+        x[i, [colonnes[t] for t in traits_exemple]] = 1.0
+    y = np.zeros((len(exemples), len(classes)))
+    y[np.arange(len(exemples)), [classes.index(intention) for _, intention in exemples]] = 1.0
+
+    poids = np.zeros((len(vocabulaire), len(classes)))
+    biais = np.zeros(len(classes))
+    for _ in range(iterations):
+        scores = x @ poids + biais
+        scores -= scores.max(axis=1, keepdims=True)
+        probas = np.exp(scores)
+        probas /= probas.sum(axis=1, keepdims=True)
+        erreur = (probas - y) / len(exemples)
+        poids -= PAS_APPRENTISSAGE * (x.T @ erreur + REGULARISATION_L2 * poids)
+        biais -= PAS_APPRENTISSAGE * erreur.sum(axis=0)
+
+    gardes = np.abs(poids).max(axis=1) >= POIDS_MINIMUM
+    return {
+        'classes': classes,
+        'biais': [round(float(b), 4) for b in biais],
+        'poids': {vocabulaire[j]: [round(float(p), 4) for p in poids[j]] for j in np.flatnonzero(gardes)},
+        'seuil': app.SEUIL_INTENTION,
+    }
+
+# =============================================================================
+# ÉVALUATION
+# =============================================================================
+
+def intention_mots_cles(texte):
+    """Intention du seul automate de mots clés (premier motif trouvé), conversation sinon"""
+    trouve = app.AUTOMATE_INTENTIONS.search(' '.join(app.mots_intention(texte)))
+    return trouve.lastgroup if trouve else app.INTENTION_CONVERSATION
+
+def predire(classifieur, exemples):
+    """Prédictions des trois variantes: mots clés seuls, modèle seul, mots clés + modèle"""
+    return {
+        'mots_cles': [intention_mots_cles(texte) for texte, _ in exemples],
+        'modele': [classifieur.classer(texte, mots_cles=False)[0] for texte, _ in exemples],
+        'complet': [classifieur.classer(texte)[0] for texte, _ in exemples],
+    }
+
+def validation_croisee(exemples, classes, nb_plis, graine):
+    """Prédictions hors entraînement de chaque exemple (chaque pli évalué par un modèle entraîné sans lui)"""
+    reels, predictions, erreurs = [], {}, []
+    plis = plis_stratifies(exemples, nb_plis, graine)
+    for k, pli in enumerate(plis):
+        entrainement = [e for j, autre in enumerate(plis) if j != k for e in autre]
+        classifieur = app.ClassifieurIntentions(entrainer(entrainement, classes))
+        for variante, valeurs in predire(classifieur, pli).items():
+            predictions.setdefault(variante, []).extend(valeurs)
+        reels.extend(intention for _, intention in pli)
+        erreurs.extend(
+            (texte, intention, predit)
+            for (texte, intention), predit in zip(pli, predictions['complet'][-len(pli):])
+            if predit != intention
+        )
+    return reels, predictions, erreurs
+
+def scores_par_classe(reels, predits, classes):
+    """Précision, rappel et matrice de confusion (lignes: réel, colonnes: prédit)"""
+    confusion = {r: dict.fromkeys(classes, 0) for r in classes}
+    for reel, predit in zip(reels, predits):
+        confusion[reel][predit] += 1
+    scores = {}
+    for c in classes:
+        vrais = confusion[c][c]
+        nb_predits = sum(confusion[r][c] for r in classes)
+        nb_reels = sum(confusion[c].values())
+        scores[c] = {
+            'precision': vrais / nb_predits if nb_predits else 0.0,
+            'rappel': vrais / nb_reels if nb_reels else 0.0,
+        }
+    return scores, confusion
+
+def mesurer_latence(classifieur, textes, repetitions=20):
+    """Latence de classer() par message (ms): p50, p95, p99, max"""
+    durees = []
+    for _ in range(repetitions):
+        for texte in textes:
+            debut = time.perf_counter()
+            classifieur.classer(texte)
+            durees.append((time.perf_counter() - debut) * 1000)
+    durees = np.array(durees)
+    return {
+        'p50': float(np.percentile(durees, 50)),
+        'p95': float(np.percentile(durees, 95)),
+        'p99': float(np.percentile(durees, 99)),
+        'max': float(durees.max()),
+    }
+
+# =============================================================================
+# RAPPORT
+# =============================================================================
+
+def afficher_rapport(rapport, classes):
+    """Exactitudes, scores par intention, confusion, erreurs et latence"""
+    print(f"\n{rapport['nb_exemples']} exemples, validation croisée en {rapport['plis']} plis")
+    print("\nExactitude")
+    for variante, libelle in (('mots_cles', "mots clés seuls"), ('modele', "modèle seul"), ('complet', "mots clés + modèle")):
+        print(f"  {libelle:<22}{rapport['exactitude'][variante]:>7.1%}")
+
+    print("\nPar intention (mots clés + modèle)")
+    print(f"  {'intention':<14}{'précision':>10}{'rappel':>10}")
+    for c in classes:
+        score = rapport['par_intention'][c]
+        print(f"  {c:<14}{score['precision']:>10.1%}{score['rappel']:>10.1%}")
+
+    print("\nConfusion (lignes: réel, colonnes: prédit)")
+    print("  " + " " * 14 + "".join(f"{c[:10]:>12}" for c in classes))
+    for r in classes:
+        print(f"  {r:<14}" + "".join(f"{rapport['confusion'][r][c]:>12}" for c in classes))
+
+    print(f"\nAppels au modèle évités sur les intentions simples: {rapport['appels_evites']:.1%}")
+    print(f"Questions ouvertes détournées à tort (sans Sarah): {rapport['conversations_detournees']:.1%}")
+
+    if rapport['erreurs']:
+        print("\nErreurs")
+        for texte, reel, predit in rapport['erreurs']:
+            print(f"  [{reel} -> {predit}] {texte}")
+
+    latence = rapport['latence_ms']
+    print(f"\nLatence par message: p50 {latence['p50']:.3f} ms · p95 {latence['p95']:.3f} ms · "
+          f"p99 {latence['p99']:.3f} ms · max {latence['max']:.3f} ms (budget {BUDGET_LATENCE_MS} ms)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Entraînement et évaluation du classifieur d'intentions")
+    parser.add_argument('--exemples', default=FICHIER_EXEMPLES, help="Exemples annotés (JSON: intention -> messages)")
+    parser.add_argument('--sortie', default=app.FICHIER_INTENTIONS, help="Fichier modèle à écrire")
+    parser.add_argument('--plis', type=int, default=5, help="Nombre de plis de la validation croisée")
+    parser.add_argument('--graine', type=int, default=0, help="Graine de la répartition en plis")
+    parser.add_argument('--rapport', help="Fichier JSON où sauvegarder le rapport")
+    parser.add_argument('--sans-ecrire', action='store_true', help="Évaluer sans écrire le modèle")
+    args = parser.parse_args()
+
+    exemples, classes = charger_exemples(args.exemples)
+    reels, predictions, erreurs = validation_croisee(exemples, classes, args.plis, args.graine)
+    par_intention, confusion = scores_par_classe(reels, predictions['complet'], classes)
+
+    simples = [p for r, p in zip(reels, predictions['complet']) if r != app.INTENTION_CONVERSATION]
+    ouvertes = [p for r, p in zip(reels, predictions['complet']) if r == app.INTENTION_CONVERSATION]
+
+    # Modèle final: tous les exemples
+    modele = entrainer(exemples, classes)
+    latence = mesurer_latence(app.ClassifieurIntentions(modele), [texte for texte, _ in exemples])
+
+    rapport = {
+        'nb_exemples': len(exemples),
+        'plis': args.plis,
+        'exactitude': {
+            variante: sum(p == r for p, r in zip(valeurs, reels)) / len(reels)
+            for variante, valeurs in predictions.items()
+        },
+        'par_intention': par_intention,
+        'confusion': confusion,
+        'appels_evites': sum(p != app.INTENTION_CONVERSATION for p in simples) / len(simples),
+        'conversations_detournees': sum(p != app.INTENTION_CONVERSATION for p in ouvertes) / len(ouvertes),
+        'erreurs': erreurs,
+        'latence_ms': latence,
+    }
+    afficher_rapport(rapport, classes)
+
+    if args.rapport:
+        with open(args.rapport, 'w', encoding='utf-8') as f:
+            json.dump(rapport, f, ensure_ascii=False, indent=2)
+
+    if not args.sans_ecrire:
+        modele['evaluation'] = {
+            'exactitude': round(rapport['exactitude']['complet'], 4),
+            'latence_p99_ms': round(latence['p99'], 4),
+        }
+        with open(args.sortie, 'w', encoding='utf-8') as f:
+            json.dump(modele, f, ensure_ascii=False, separators=(',', ':'))
+            f.write('\n')
+        print(f"\nModèle écrit dans {args.sortie} ({len(modele['poids'])} traits)")
+
+    raise SystemExit(1 if latence['p99'] > BUDGET_LATENCE_MS else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+🧠 SARAH'MIAM - Évaluation du seuil du cache sémantique
+
+Mesure, sur les paires annotées de data/paraphrases.json, la précision (réponses
+servies à la bonne question) et le rappel (paraphrases retrouvées) du cache
+sémantique pour une série de seuils, avec le même découpage que l'app
+(entités du catalogue en partition, similarité cosinus sur le reste).
+
+Usage:
+    python evaluer_cache_semantique.py                          # n-grammes hachés
+    python evaluer_cache_semantique.py --modele paraphrase-multilingual-MiniLM-L12-v2
+    python evaluer_cache_semantique.py --seuil 0.9              # échec si une paire différente passe
+    python evaluer_cache_semantique.py --rapport rapport.json
+"""
+
+# =============================================================================
+# IMPORTS
+# =============================================================================
+
+import argparse
+import json
+import os
+
+import app
+
+# =============================================================================
+# CONSTANTES
+# =============================================================================
+
+FICHIER_PAIRES = os.path.join(app.DOSSIER_DONNEES, 'paraphrases.json')
+
+SEUILS_DEFAUT = (0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95)
+
+# =============================================================================
+# MESURE
+# =============================================================================
+
+def charger_vectoriseur(modele):
+    """Vectoriseur de l'app: modèle sentence-transformers si demandé, n-grammes sinon"""
+    if not modele:
+        return app.VectoriseurNgrammes()
+    from sentence_transformers import SentenceTransformer
+    return app.VectoriseurModele(SentenceTransformer(modele, device='cpu'), modele)
+
+def similarite_paire(vectoriseur, question, autre):
+    """Similarité vue par le cache (None si les entités citées diffèrent: partitions séparées)"""
+    app.obtenir_vectoriseur = lambda: vectoriseur
+    partition, vecteur = app.requete_semantique('sarah', question, [])
+    partition_autre, vecteur_autre = app.requete_semantique('sarah', autre, [])
+    if partition != partition_autre:
+        return None
+    return float(vecteur @ vecteur_autre)
+
+def scores_seuil(similarites, seuil):
+    """Précision et rappel du cache à ce seuil, et paires différentes servies à tort"""
+    vrais = sum(s is not None and s >= seuil for s in similarites['paraphrases'])
+    faux = sum(s is not None and s >= seuil for s in similarites['differentes'])
+    return {
+        'seuil': seuil,
+        'precision': vrais / (vrais + faux) if vrais + faux else 1.0,
+        'rappel': vrais / len(similarites['paraphrases']),
+        'faux_positifs': faux,
+    }
+
+def seuil_sur(similarites):
+    """Plus petit seuil qui ne sert aucune paire différente (au-dessus de la plus forte similarité)"""
+    differentes = [s for s in similarites['differentes'] if s is not None]
+    return round(max(differentes, default=0.0) + 0.01, 2)
+
+# =============================================================================
+# RAPPORT
+# =============================================================================
+
+def afficher_rapport(rapport, paires, similarites):
+    """Distribution des similarités, précision/rappel par seuil et paires litigieuses"""
+    print(f"\nVectoriseur: {rapport['vectoriseur']} · {len(paires['paraphrases'])} paraphrases, "
+          f"{len(paires['differentes'])} paires différentes")
+    for categorie, libelle in (('paraphrases', "Paraphrases"), ('differentes', "Questions différentes")):
+        valeurs = [s for s in similarites[categorie] if s is not None]
+        separees = len(similarites[categorie]) - len(valeurs)
+        if valeurs:
+            print(f"  {libelle:<22} similarité {min(valeurs):.2f} - {max(valeurs):.2f} ({separees} séparées par les entités)")
+
+    print(f"\n  {'seuil':>6}{'précision':>11}{'rappel':>9}{'faux +':>8}")
+    for score in rapport['seuils']:
+        print(f"  {score['seuil']:>6.2f}{score['precision']:>11.1%}{score['rappel']:>9.1%}{score['faux_positifs']:>8}")
+
+    print(f"\nSeuil minimum sans faux positif: {rapport['seuil_sur']:.2f} "
+          f"(rappel {rapport['rappel_seuil_sur']:.1%})")
+
+    litigieuses = sorted(
+        ((s, a, b) for (a, b), s in zip(paires['differentes'], similarites['differentes']) if s is not None),
+        reverse=True
+    )[:5]
+    if litigieuses:
+        print("\nPaires différentes les plus proches")
+        for s, a, b in litigieuses:
+            print(f"  {s:.2f}  {a} | {b}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Précision et rappel du cache sémantique selon le seuil")
+    parser.add_argument('--paires', default=FICHIER_PAIRES, help="Paires annotées (JSON: paraphrases, differentes)")
+    parser.add_argument('--modele', default=app.MODELE_EMBEDDINGS, help="Modèle sentence-transformers (vide: n-grammes)")
+    parser.add_argument('--seuils', type=float, nargs='+', default=SEUILS_DEFAUT, help="Seuils à évaluer")
+    parser.add_argument('--seuil', type=float, help="Seuil à vérifier: échec si une paire différente est servie")
+    parser.add_argument('--rapport', help="Fichier JSON où sauvegarder le rapport")
+    args = parser.parse_args()
+
+    with open(args.paires, encoding='utf-8') as f:
+        paires = json.load(f)
+    vectoriseur = charger_vectoriseur(args.modele)
+    similarites = {
+        categorie: [similarite_paire(vectoriseur, a, b) for a, b in paires[categorie]]
+        for categorie in ('paraphrases', 'differentes')
+    }
+
+    seuils = sorted(set(args.seuils) | ({args.seuil} if args.seuil else set()))
+    rapport = {
+        'vectoriseur': vectoriseur.nom,
+        'seuils': [scores_seuil(similarites, seuil) for seuil in seuils],
+        'seuil_sur': seuil_sur(similarites),
+    }
+    rapport['rappel_seuil_sur'] = scores_seuil(similarites, rapport['seuil_sur'])['rappel']
+    afficher_rapport(rapport, paires, similarites)
+
+    if args.rapport:
+        with open(args.rapport, 'w', encoding='utf-8') as f:
+            json.dump(rapport, f, ensure_ascii=False, indent=2)
+
+    raise SystemExit(1 if args.seuil and scores_seuil(similarites, args.seuil)['faux_positifs'] else 0)
+
+if __name__ == "__main__":
+    main()